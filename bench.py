@@ -0,0 +1,291 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# ####################################################################
+# specker-lib - spec file manipulation library
+# Copyright (C) 2015  Fridolin Pokorny, fpokorny@redhat.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# ####################################################################
+'''
+Library benchmark tool
+@author: Fridolin Pokorny
+@contact: fpokorny@redhat.com
+@organization: Red Hat Inc.
+@license: GPL 2.0
+'''
+
+import os
+import sys
+import glob
+import time
+import pickle
+import cPickle
+import resource
+import optparse
+from modules.specFile import SpecFile
+from modules.specToken import SpecTokenList
+from modules.specFileParser import SpecFileParser
+from modules.specModelTransformator import SpecModelWriter
+from modules.specSection import SpecStChangelog
+from modules.specSerializer import SpecSerializer
+
+EXAMPLES = 'examples/*.spec'
+DEPTHS = [ 500, 1000, 2000, 4000, 8000 ]
+MODELS = 1000
+
+def generate_spec(repeat):
+	'''
+	Generate a big spec by concatenating example spec files
+	@param repeat: how many times examples should be repeated
+	@type repeat: number
+	@return: spec content
+	@rtype: string
+	'''
+	examples = ""
+	for path in sorted(glob.glob(EXAMPLES)):
+		with open(path) as f:
+			examples += f.read()
+	return examples * repeat
+
+def measure(func, *args):
+	'''
+	Run a function in a child process and measure its footprint, so
+	measurements do not affect each other
+	@param func: function to be measured
+	@type func: callable
+	@param args: arguments passed to func
+	@return: tuple (seconds, KiB allocated, value returned by func)
+	@rtype: tuple
+	'''
+	rfd, wfd = os.pipe()
+	pid = os.fork()
+
+	if pid == 0: # child
+		os.close(rfd)
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		start = time.time()
+		ret = func(*args)
+		elapsed = time.time() - start
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+		with os.fdopen(wfd, 'wb') as f:
+			pickle.dump((elapsed, rss, ret), f)
+		os._exit(0)
+
+	os.close(wfd)
+	with os.fdopen(rfd, 'rb') as f:
+		ret = pickle.load(f)
+	os.waitpid(pid, 0)
+	return ret
+
+def tokenize(spec, lexer, access):
+	'''
+	Tokenize a spec file
+	@param spec: spec to be tokenized
+	@type spec: L{SpecFile}
+	@param lexer: lexer to be used
+	@type lexer: string
+	@param access: if True, access all tokens after tokenization
+	@type access: Boolean
+	@return: number of tokens
+	@rtype: number
+	'''
+	token_list = SpecTokenList(spec, lexer)
+	if access:
+		for token in token_list:
+			pass
+	return len(token_list)
+
+def bench_tokens(spec):
+	'''
+	Benchmark token list footprint
+	@param spec: spec to be tokenized
+	@type spec: L{SpecFile}
+	@return: None
+	@rtype: None
+	'''
+	print "%-24s %10s %10s %10s %10s" % ('token list', 'tokens', 'seconds', 'KiB', 'B/token')
+	for lexer in SpecTokenList.LEXERS:
+		for access in [False, True]:
+			elapsed, rss, count = measure(tokenize, spec, lexer, access)
+			name = lexer + (', accessed' if access else '')
+			print "%-24s %10d %10.3f %10d %10.1f" % (name, count, elapsed, rss, rss * 1024.0 / count)
+
+def generate_nested(depth):
+	'''
+	Generate a spec with nested %if blocks
+	@param depth: nesting depth of %if blocks
+	@type depth: number
+	@return: spec content
+	@rtype: string
+	'''
+	return "Name: foo\n" + "%if 0%{?fedora}\nRequires: foo\n" * depth \
+			+ "%else\nRequires: bar\n%endif\n" * depth + "%build\nmake\n"
+
+def parse(spec):
+	'''
+	Parse a spec file
+	@param spec: spec to be parsed
+	@type spec: L{SpecFile}
+	@return: number of top-level sections
+	@rtype: number
+	'''
+	parser = SpecFileParser(SpecModelWriter())
+	parser.init(spec)
+	parser.parse()
+	return len(parser.get_model_writer().get_model().get_sections())
+
+def bench_nesting(spec):
+	'''
+	Benchmark parsing of nested %if blocks, time per nesting level should
+	not grow with depth
+	@param spec: unused, specs are generated
+	@type spec: L{SpecFile}
+	@return: None
+	@rtype: None
+	'''
+	print "%-24s %10s %10s %10s %10s" % ('nesting', 'depth', 'seconds', 'KiB', 'us/level')
+	for depth in DEPTHS:
+		elapsed, rss, _ = measure(parse, SpecFile(generate_nested(depth)))
+		print "%-24s %10d %10.3f %10d %10.1f" % ('%if', depth, elapsed, rss, elapsed * 1000000.0 / depth)
+
+def count_sections(model):
+	'''
+	Count sections of a model including nested sections and changelog entries
+	@param model: model to count sections of
+	@type model: L{SpecModel}
+	@return: number of sections
+	@rtype: number
+	'''
+	ret = 0
+	for section in model.walk():
+		ret += 1
+		if issubclass(section.__class__, SpecStChangelog):
+			ret += len(section.get_entries())
+	return ret
+
+def parse_models(spec, count):
+	'''
+	Parse a spec file multiple times, all models are kept in memory
+	@param spec: spec to be parsed
+	@type spec: L{SpecFile}
+	@param count: number of models
+	@type count: number
+	@return: number of sections of a model
+	@rtype: number
+	'''
+	models = []
+	for _ in xrange(count):
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		models.append(parser.get_model_writer().get_model())
+	return count_sections(models[0])
+
+def bench_memory(spec):
+	'''
+	Benchmark memory footprint of resident models of example spec files
+	and of the benchmarked spec
+	@param spec: spec to be parsed
+	@type spec: L{SpecFile}
+	@return: None
+	@rtype: None
+	'''
+	specs = []
+	for path in sorted(glob.glob(EXAMPLES)):
+		with open(path) as f:
+			specs.append((os.path.basename(path), SpecFile(f.read()), MODELS))
+	specs.append(('spec', spec, 1))
+
+	print "%-32s %10s %10s %10s %10s %10s" % ('models', 'count', 'sections', 'KiB', 'B/model', 'B/section')
+	for name, s, count in specs:
+		_, rss, sections = measure(parse_models, s, count)
+		print "%-32s %10d %10d %10d %10d %10.1f" % (name, count, sections, rss,
+				rss * 1024.0 / count, rss * 1024.0 / (count * max(sections, 1)))
+
+def load_serialized(data):
+	'''
+	Load a serialized model, see L{SpecSerializer}
+	@param data: serialized model
+	@type data: string
+	@return: number of top-level sections
+	@rtype: number
+	'''
+	return len(SpecSerializer().loads(data).get_sections())
+
+def load_pickled(data):
+	'''
+	Load a pickled model
+	@param data: pickled model
+	@type data: string
+	@return: number of top-level sections
+	@rtype: number
+	'''
+	return len(cPickle.loads(data).get_sections())
+
+def bench_serializer(spec):
+	'''
+	Benchmark loading of a serialized model compared to parsing and
+	unpickling of the model
+	@param spec: spec to be parsed
+	@type spec: L{SpecFile}
+	@return: None
+	@rtype: None
+	'''
+	parser = SpecFileParser(SpecModelWriter())
+	parser.init(spec)
+	parser.parse()
+	model = parser.get_model_writer().get_model()
+	serialized = SpecSerializer().dumps(model)
+	pickled = cPickle.dumps(model, cPickle.HIGHEST_PROTOCOL)
+
+	print "%-24s %10s %10s %10s" % ('model', 'bytes', 'seconds', 'KiB')
+	for name, func, data in [ ('parsed', parse, spec), ('serialized', load_serialized, serialized),
+			('pickled', load_pickled, pickled) ]:
+		elapsed, rss, _ = measure(func, data)
+		size = len(data.content) if data is spec else len(data)
+		print "%-24s %10d %10.3f %10d" % (name, size, elapsed, rss)
+
+BENCHMARKS = { 'tokens': bench_tokens, 'nesting': bench_nesting, 'memory': bench_memory,
+		'serializer': bench_serializer }
+
+if __name__ == '__main__':
+	parser = optparse.OptionParser("%prog [OPTIONS] [SPEC]")
+
+	parser.add_option(
+		"-b", "--benchmark", dest="benchmark", action = "append", type = "choice",
+		choices = sorted(BENCHMARKS.keys()), default = None,
+		help = "benchmark to run (%s), all by default" % ', '.join(sorted(BENCHMARKS.keys()))
+	)
+
+	parser.add_option(
+		"-r", "--repeat", dest="repeat", type = "int", default = 2000,
+		help = "how many times examples should be repeated if no spec is given"
+	)
+
+	options, args = parser.parse_args()
+	if len(args) > 1:
+		sys.stderr.write("Error: Incorrect number of arguments\n")
+		exit(1)
+
+	# spec is read upfront, so only structures built on top of it are measured
+	if len(args) == 1:
+		with open(args[0]) as f:
+			spec = SpecFile(f.read())
+	else:
+		spec = SpecFile(generate_spec(options.repeat))
+
+	for benchmark in options.benchmark or sorted(BENCHMARKS.keys()):
+		print "== %s" % benchmark
+		BENCHMARKS[benchmark](spec)
@@ -28,9 +28,31 @@ Library check tool
 
 import unittest
 import sys
+import os
+import cStringIO
+import cPickle
 import logging
 import optparse
+import shutil
+import tempfile
+import datetime
 from subprocess import PIPE, Popen
+from modules.specFile import SpecFile
+from modules.specToken import SpecTokenList, SpecTokenStream
+from modules.specLexer import SpecLexer
+from modules.specFileParser import SpecFileParser, SpecSectionParser, SpecGlobalParser, SpecDefineParser, \
+		SpecChangelogParser, SpecPackageParser, SpecBuildParser
+from modules.specFileRenderer import SpecFileRenderer
+from modules.specModelTransformator import SpecModelWriter, SpecModelReader
+from modules.specDefaultEditor import SpecDefaultEditor
+from modules.specSection import SpecSection, SpecStPackage, SpecStDefinition, SpecStBuild, SpecStChangelog, \
+		SpecStFiles, SpecStDescription, SpecStPrep, SpecStInstall, SpecStCheck, SpecStIf
+from modules.specCache import SpecCache
+from modules.specEventParser import SpecEventParser, SpecEventHandler
+from modules.specSerializer import SpecSerializer
+from modules.specModelDiff import SpecModelDiff
+from modules.specModel import SpecModel
+from modules.specError import SpecBadToken, SpecNotFound, SpecBadParam, SpecBadIndex
 
 LOGGER = logging.getLogger('specker-check')
 VERBOSE = False
@@ -143,13 +165,444 @@ class TestGeneric(unittest.TestCase):
 		assertContains('No such file or directory', result['stderr'], result)
 		assertNotEqual(0, result['returncode'], result)
 
+	def test_malformed_file(self):
+		# without options the whole file is parsed, not only the preamble
+		path = tempfile.mkdtemp()
+		try:
+			spec = os.path.join(path, 'foo.spec')
+			with open(spec, 'w') as f:
+				f.write("Name: foo\n\n%package -n libfoo\nSummary: foo\n%build\nmake\n")
+			result = run_specker([spec])
+		finally:
+			shutil.rmtree(path)
+		assertContains("Unexpected symbol 'libfoo'", result['stderr'], result)
+		assertNotEqual(0, result['returncode'], result)
+
+	def test_output_over_input(self):
+		# the input file is mapped, it cannot be truncated while being read
+		path = tempfile.mkdtemp()
+		try:
+			spec = os.path.join(path, 'foo.spec')
+			with open(spec, 'w') as f:
+				f.write("Name: foo\n%package devel\nRequires: bar\n%build\nmake\n")
+			result = run_specker(["--requires-add=devel:zlib", "-o", spec, spec])
+			with open(spec) as f:
+				output = f.read()
+			files = os.listdir(path)
+		finally:
+			shutil.rmtree(path)
+		assertEqual(0, result['returncode'], result)
+		assertEqual("Name: foo\n%package devel\nRequires: bar\nRequires: zlib\n%build\nmake\n", output, result)
+		assertEqual(['foo.spec'], files, result)
+
+################################################################################
+
+class TestTokenList(unittest.TestCase):
+	'''
+	Test L{SpecTokenList}
+	'''
+	def test_lexers_equal(self):
+		spec = "Name: foo # comment\n%build \\\n  make\n  # comment\n\tmake   install\n"
+		char = SpecTokenList(spec, SpecTokenList.LEXER_CHAR)
+		regex = SpecTokenList(spec, SpecTokenList.LEXER_REGEX)
+		self.assertEqual(len(char), len(regex))
+		for t1, t2 in zip(char, regex):
+			self.assertEqual((t1.prepend, t1.token, t1.append, t1.line, t1.eol_count),
+					(t2.prepend, t2.token, t2.append, t2.line, t2.eol_count))
+
+	def test_write_modified(self):
+		spec = "Name: foo\nVersion: 1.0\nRelease: 1\n"
+		tokens = SpecTokenList(spec)
+		tokens[3].set_token('2.0')
+		output = cStringIO.StringIO()
+		tokens.write(output)
+		self.assertEqual(output.getvalue(), spec.replace('1.0', '2.0'))
+
+	def test_token_table(self):
+		tokens = SpecTokenList("Requires: foo\nRequires: bar\n")
+		self.assertTrue(tokens[0].token is tokens[2].token)
+		self.assertEqual(tokens.table.strings, ['Requires:', 'foo', 'bar'])
+		tokens[1].set_token('baz')
+		self.assertEqual((tokens[1].token, tokens[1].line, tokens[1].eol_count), ('baz', 1, 1))
+		self.assertEqual(tokens[3].get_source_span()[1:], (24, 28))
+
+	def test_line_index(self):
+		spec_file = SpecFile("Name: foo\n%build\nmake \\\n  all\nmake install\n")
+		self.assertEqual(spec_file.get_position(26), (4, 3))
+		self.assertEqual([spec_file.get_logical_line(i) for i in xrange(1, 6)], [1, 2, 3, 3, 4])
+		tokens = SpecTokenList(spec_file)
+		self.assertEqual([t.token for t in tokens.get_line_tokens(4)], ['make', 'all'])
+		tokens.set_pointer(3)
+		self.assertEqual([t.token for t in tokens.get_line()], ['make', 'all'])
+		self.assertTrue(tokens[3].same_line(tokens[4]))
+		self.assertFalse(tokens[4].same_line(tokens[5]))
+
+	def test_stream_equal(self):
+		spec = "Name: foo # comment\n%build \\\n  make\n  # comment\n\tmake   install\n"
+		tokens = SpecTokenList(spec)
+		stream = SpecTokenStream(cStringIO.StringIO(spec), chunk_size = 3)
+		for t1 in tokens:
+			t2 = stream.get()
+			self.assertEqual((t1.prepend, t1.token, t1.append, t1.line, t1.eol_count),
+					(t2.prepend, t2.token, t2.append, t2.line, t2.eol_count))
+		self.assertTrue(stream.is_eof())
+
+	def test_stream_iter(self):
+		spec = "Name: foo\n%build\nmake\n"
+		tokens = [ str(t) for t in SpecTokenList(spec) ]
+		self.assertEqual([ str(t) for t in SpecTokenStream(spec) ], tokens)
+		stream = SpecTokenStream(spec)
+		stream.get()
+		stream.get()
+		self.assertEqual([ str(t) for t in stream ], tokens)
+		stream = SpecTokenStream(spec)
+		stream.TRIM_THRESHOLD = 1
+		stream.get()
+		stream.get()
+		self.assertRaises(SpecBadIndex, list, stream)
+
+	def test_mapped_file(self):
+		path = 'examples/custom_model_writer.spec'
+		spec_file = SpecFile(path = path)
+		self.assertTrue(spec_file.mapped)
+		output = cStringIO.StringIO()
+		SpecTokenList(spec_file).write(output)
+		with open(path) as f:
+			self.assertEqual(output.getvalue(), f.read())
+
+	def test_get_while_not_kinds(self):
+		spec = "%build\nmake\n%if 0\nmake all\n%endif\n%install\nmake install\n"
+		callback = lambda token_list: str(token_list.touch()) == '%install'
+		probed = SpecTokenList(spec)
+		probed.get()
+		skipped = SpecTokenList(spec)
+		skipped.get()
+		tokens = skipped.get_while_not(callback, set([SpecLexer.KIND_SECTION]))
+		self.assertEqual([t.token for t in tokens], [t.token for t in probed.get_while_not(callback)])
+		self.assertEqual(skipped.get_pointer(), probed.get_pointer())
+		self.assertEqual(skipped.table.get_kind_mask(set([SpecLexer.KIND_SECTION])).find('\x01', 1), 7)
+
 ################################################################################
 
 class TestFileParser(unittest.TestCase):
 	'''
 	Test L{SpecFileParser}
 	'''
-	pass
+	def test_keyword_kinds(self):
+		sections = SpecSectionParser.obj + [ SpecGlobalParser.obj, SpecDefineParser.obj,
+				SpecChangelogParser.obj, SpecPackageParser.obj ]
+		for section in sections:
+			self.assertEqual(SpecLexer.classify(str(section)), SpecLexer.KIND_SECTION)
+		tokens = SpecTokenList("Requires(post): foo >= 1\n%if 0\n%endif\n* Wed\n")
+		self.assertEqual([t.kind for t in tokens], [SpecLexer.KIND_DEFINITION, SpecLexer.KIND_WORD,
+				SpecLexer.KIND_OPERATOR, SpecLexer.KIND_WORD, SpecLexer.KIND_CONDITIONAL,
+				SpecLexer.KIND_WORD, SpecLexer.KIND_CONDITIONAL, SpecLexer.KIND_STAR,
+				SpecLexer.KIND_WORD, SpecLexer.KIND_EOF])
+		self.assertTrue(tokens[4].token is intern('%if'))
+
+	def test_register_index(self):
+		class MyBuildParser(SpecBuildParser):
+			@staticmethod
+			def section_beginning(token_list):
+				if str(token_list.touch()) == '%mybuild':
+					return SpecBuildParser.obj
+				return SpecBuildParser.section_beginning(token_list)
+
+		parser = SpecFileParser(SpecModelWriter())
+		tokens = SpecTokenList("%mybuild\n%build\nRequires: foo\n")
+		self.assertEqual(parser.section_beginning(tokens), None)
+		parser.register(MyBuildParser)
+		self.assertEqual(parser.section_beginning(tokens), MyBuildParser)
+		tokens.set_pointer(1)
+		self.assertEqual(parser.section_beginning(tokens), MyBuildParser)
+		tokens.set_pointer(2)
+		self.assertEqual(parser.section_beginning(tokens).__name__, 'SpecDefinitionParser')
+
+	def test_reparse(self):
+		spec = "Name: foo\nRequires: bar\n%build\nmake\n%install\nmake install\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		sections = list(parser.get_model_writer().get_model().get_sections())
+		parser.reparse(spec.index('make\n'), 4, "make \\\n  all")
+		changed = parser.get_model_writer().get_model().get_sections()
+		self.assertTrue(changed[0] is sections[0] and changed[3] is sections[3])
+		self.assertFalse(changed[2] is sections[2])
+		self.assertEqual(changed[3].get_token_section().line, 6)
+		parser.reparse_text(parser.text.replace('%install', '%check'))
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(parser.get_model_writer().get_model())).render(output)
+		self.assertEqual(output.getvalue(), spec.replace('make\n', 'make \\\n  all\n').replace('%install', '%check'))
+		self.assertEqual(str(type(parser.get_model_writer().get_model().get_sections()[3])), '%check')
+
+	def test_lazy(self):
+		spec = "Name: foo\n%build\nmake\n%install\nmake install\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec, lazy = True)
+		parser.parse()
+		section = parser.get_model_writer().get_model().get_sections()[1]
+		self.assertTrue(section.get_source_span() is not None)
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(parser.get_model_writer().get_model())).render(output)
+		self.assertEqual(output.getvalue(), spec)
+		output = cStringIO.StringIO()
+		section.get_tokens().write(output)
+		self.assertEqual(output.getvalue(), "make\n")
+		self.assertTrue(section.get_source_span() is None)
+
+	def test_needed(self):
+		spec = "Name: foo\n%package devel\nSummary: %build tools\n%build\nmake\n" \
+				"%changelog\n* Mon Jan 05 2015 Foo <foo@bar.com> - 1.0\n- Add Requires: bar\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec, needed = set(['%changelog']))
+		parser.parse()
+		sections = parser.get_model_writer().get_model().get_sections()
+		self.assertEqual([str(type(s)) for s in sections], ['spec definition', 'raw section', 'raw section', '%changelog'])
+		self.assertEqual(str(sections[1].get_section_type()), '%package')
+		self.assertEqual(len(sections[3].get_entries()), 1)
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(parser.get_model_writer().get_model())).render(output)
+		self.assertEqual(output.getvalue(), spec)
+
+	def test_changelog_lazy(self):
+		spec = "Name: foo\n%changelog\n* Mon Jan 05 2015 Foo <foo@bar.com> - 1.1\n- Update\n\n" \
+				"* Mon Jan 05 2015 Foo Bar <foo@bar.com> 1.0\n- Add Requires: bar\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		entries = parser.get_model_writer().get_model().get_sections()[1].get_entries()
+		self.assertTrue(entries[0].get_source_span() is not None)
+		self.assertTrue(entries[1].get_source_span() is not None)
+		self.assertEqual(str(entries[1].get_version()), '1.0')
+		self.assertEqual([str(t) for t in entries[1].get_user().token_list], ['Foo', 'Bar'])
+		self.assertEqual(entries[1].get_version_delim(), None)
+		self.assertTrue(entries[0].get_source_span() is not None)
+		self.assertTrue(entries[1].get_source_span() is None)
+		self.assertTrue(entries[0].get_date_parsed() is entries[1].get_date_parsed())
+		for year in xrange(1000, 1000 + SpecChangelogParser.DATES_SIZE + 1):
+			SpecChangelogParser.parse_date(['Mon', 'Jan', '05', str(year)])
+		self.assertEqual(len(SpecChangelogParser.dates), SpecChangelogParser.DATES_SIZE)
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(parser.get_model_writer().get_model())).render(output)
+		self.assertEqual(output.getvalue(), spec)
+
+	def test_nested(self):
+		depth = sys.getrecursionlimit()
+		spec = "Name: foo\n" + "%if 1\nRequires: foo\n" * depth + "%else\nRequires: bar\n%endif\n" * depth
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec + "%package devel\n%if 1\nRequires: baz\n%endif\n")
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		definitions = model.find_definitions_all()
+		self.assertEqual(len(definitions), 2 * depth + 2)
+		self.assertEqual(str(definitions[-1].get_value().token_list[0]), 'baz')
+		self.assertEqual(str(definitions[-1].get_package().get_package()), 'devel')
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(model)).render(output)
+		self.assertEqual(output.getvalue(), spec + "%package devel\n%if 1\nRequires: baz\n%endif\n")
+		parser.init(spec[:-len("%endif\n")])
+		self.assertRaises(SpecBadToken, parser.parse)
+
+	def test_slots(self):
+		spec = "Name: foo\n%if 1\n%global bar 1\n%endif\n%package devel\nRequires: bar\n%build\nmake\n" \
+				"%changelog\n* Mon Jan 05 2015 Foo <foo@bar.com> - 1.0\n- Initial\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		sections = list(model.walk()) + model.get_sections()[-1].get_entries()
+		self.assertEqual(len(sections), 8)
+		self.assertFalse(any(hasattr(s, '__dict__') for s in sections))
+		self.assertEqual([str(type(s)) for s in sections[::3]], ['spec definition', '%package', '%changelog'])
+
+################################################################################
+
+class TestCache(unittest.TestCase):
+	'''
+	Test L{SpecCache}
+	'''
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.path)
+
+	def test_store_load(self):
+		path = 'examples/custom_model_writer.spec'
+		spec_file = SpecFile(path = path)
+		parser = SpecFileParser(SpecModelWriter())
+		cache = SpecCache(self.path)
+		key = cache.get_key(spec_file, parser)
+		self.assertTrue(cache.load(key) is None)
+		parser.init(spec_file)
+		parser.parse()
+		cache.store(key, parser.get_model_writer().get_model())
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(cache.load(key))).render(output)
+		with open(path) as f:
+			self.assertEqual(output.getvalue(), f.read())
+
+	def test_key(self):
+		cache = SpecCache(self.path)
+		parser = SpecFileParser(SpecModelWriter())
+		key = cache.get_key(SpecFile("Name: foo\n"), parser)
+		self.assertNotEqual(key, cache.get_key(SpecFile("Name: bar\n"), parser))
+		self.assertNotEqual(key, cache.get_key(SpecFile("Name: foo\n"), parser, 'char'))
+		parser.MANIPULATORS.remove(SpecBuildParser)
+		self.assertNotEqual(key, cache.get_key(SpecFile("Name: foo\n"), parser))
+
+	def test_evict(self):
+		cache = SpecCache(self.path, 0)
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init("Name: foo\n")
+		parser.parse()
+		cache.store('foo', parser.get_model_writer().get_model())
+		self.assertTrue(cache.load('foo') is None)
+
+	def test_owner(self):
+		path = os.path.join(self.path, 'cache')
+		cache = SpecCache(path)
+		self.assertEqual(os.stat(path).st_mode & 0777, 0700)
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init("Name: foo\n")
+		parser.parse()
+		cache.store('foo', parser.get_model_writer().get_model())
+		self.assertEqual(os.stat(cache.get_path('foo')).st_mode & 0777, 0600)
+		self.assertTrue(cache.load('foo') is not None)
+		if os.getuid() != 0:
+			self.skipTest("entries of another user can be created only by root")
+		os.chown(cache.get_path('foo'), os.getuid() + 1, -1)
+		self.assertTrue(cache.load('foo') is None)
+
+################################################################################
+
+class TestSerializer(unittest.TestCase):
+	'''
+	Test L{SpecSerializer}
+	'''
+	def test_dumps_loads(self):
+		spec = "Name: foo\n%if 0\n%if 1\nRequires: bar\n%endif\n%else\nRequires: baz\n%endif\n" \
+				"%package devel\nProvides: foo-devel\n%build\nmake\n" \
+				"%changelog\n* Wed Nov 25 2015 John Doe <jd@example.com> - 1.0\n- init\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		serializer = SpecSerializer()
+		data = serializer.dumps(parser.get_model_writer().get_model())
+		model = serializer.loads(data)
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(model)).render(output)
+		self.assertEqual(output.getvalue(), spec)
+		bar = model.find_definitions('Requires', ['-'])[0]
+		self.assertEqual([b for _, b in model.get_definition_path(bar)], [True, True])
+		entry = model.find_section(SpecStChangelog)[0].get_entries()[0]
+		self.assertEqual(entry.get_date_parsed(), datetime.datetime(2015, 11, 25))
+		self.assertEqual(serializer.dumps(model), data)
+		self.assertRaises(SpecBadParam, serializer.loads, data[:-1])
+		self.assertRaises(SpecBadParam, serializer.loads, 'XXXX' + data[4:])
+
+	def test_foreign_class(self):
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init("Name: foo\n%build\nmake\n")
+		parser.parse()
+		serializer = SpecSerializer()
+		data = serializer.dumps(parser.get_model_writer().get_model())
+		name = SpecStBuild.__module__ + '.SpecStBuild'
+		self.assertTrue(name in data)
+		foreign = 'this.' + 'X' * (len(name) - len('this.'))
+		self.assertRaises(SpecBadParam, serializer.loads, data.replace(name, foreign))
+		self.assertFalse('this' in sys.modules)
+		self.assertRaises(SpecBadParam, serializer.get_class, 'sys.exit')
+		self.assertTrue(serializer.get_class(name) is SpecStBuild)
+
+################################################################################
+
+class TestModelDiff(unittest.TestCase):
+	'''
+	Test L{SpecModelDiff}
+	'''
+	def test_diff(self):
+		spec = "Name: foo\nRequires: bar\n%package devel\nRequires: gcc\n%post devel -p /bin/sh\nfoo\n" \
+				"%changelog\n* Wed Nov 25 2015 John Doe <jd@example.com> - 1.0\n- init\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		old = parser.get_model_writer().get_model()
+		self.assertEqual(SpecModelDiff(old, old).diff(), [])
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec.replace("Requires: bar", "Requires:  baz\nRequires: qux").replace("foo\n%changelog", "bar\n%changelog"))
+		parser.parse()
+		new = parser.get_model_writer().get_model()
+		writer = SpecModelWriter(new)
+		editor = SpecDefaultEditor(SpecModelReader(new), writer)
+		editor.requires_remove({'devel': ['gcc']})
+		editor.changelogentry_add(datetime.date(2015, 11, 26), 'John Doe', 'jd@example.com', '1.1', '- fix')
+		changes = [ (c[0], c[1], c[2]) for c in SpecModelDiff(old, new).diff() ]
+		self.assertEqual(changes, [
+				(SpecModelDiff.CHANGED, SpecModelDiff.DEFINITION, ('Requires', None)),
+				(SpecModelDiff.ADDED, SpecModelDiff.DEFINITION, ('Requires', None)),
+				(SpecModelDiff.REMOVED, SpecModelDiff.DEFINITION, ('Requires', 'devel')),
+				(SpecModelDiff.CHANGED, SpecModelDiff.SECTION, ('%post', 'devel')),
+				(SpecModelDiff.ADDED, SpecModelDiff.CHANGELOG, '* Thu Nov 26 2015 John Doe <jd@example.com> - 1.1')
+			])
+
+################################################################################
+
+class TestEventParser(unittest.TestCase):
+	'''
+	Test L{SpecEventParser}
+	'''
+	class Handler(SpecEventHandler):
+		def __init__(self):
+			self.events = []
+
+		def section_start(self, kind, token, package):
+			self.events.append(('start', kind, str(package) if package else None))
+
+		def section_body(self, tokens):
+			self.events.append(('body', ''.join(str(t) for t in tokens)))
+
+		def section_end(self, kind):
+			self.events.append(('end', kind))
+
+		def definition(self, name, value, package):
+			self.events.append((str(name), str(value.token_list[0]), str(package) if package else None))
+
+		def macro(self, token, variable, value):
+			self.events.append((str(token), str(variable), str(value.token_list[0])))
+
+		def if_start(self, token, expr):
+			self.events.append(('if', str(expr.token_list[0])))
+
+		def if_else(self, token):
+			self.events.append(('else',))
+
+		def if_end(self, token):
+			self.events.append(('endif',))
+
+		def changelog_entry(self, date, user, email, version, message):
+			self.events.append(('entry', str(email), str(version), str(message.token_list[1])))
+
+	def test_events(self):
+		spec = "%global foo 1\nName: foo\n%if 0%{?fedora}\nRequires: bar\n%else\nRequires: baz\n%endif\n" \
+				"%package devel\n%if 1\nRequires: foo\n%endif\n%build\nmake\n" \
+				"%changelog\n* Mon Jan 05 2015 Foo <foo@bar.com> - 1.0\n- Update\n"
+		events = [ ('%global', 'foo', '1'), ('Name:', 'foo', None), ('if', '0%{?fedora}'),
+				('Requires:', 'bar', None), ('else',), ('Requires:', 'baz', None), ('endif',),
+				('start', '%package', 'devel'), ('if', '1'), ('Requires:', 'foo', 'devel'), ('endif',),
+				('end', '%package'), ('start', '%build', None), ('body', 'make'), ('end', '%build'),
+				('start', '%changelog', None), ('entry', '<foo@bar.com>', '1.0', 'Update'), ('end', '%changelog') ]
+		for stream in [False, True]:
+			handler = self.Handler()
+			parser = SpecEventParser(handler)
+			parser.init(spec, stream = stream)
+			parser.parse()
+			self.assertEqual(handler.events, events)
+
+		parser = SpecEventParser(SpecEventHandler())
+		self.assertFalse(parser.bodies)
+		parser.init("Name: foo\n%if 1\n%if 1\nRequires: foo\n%endif\n")
+		self.assertRaises(SpecBadToken, parser.parse)
 
 ################################################################################
 
@@ -157,7 +610,127 @@ class TestDefaultEditor(unittest.TestCase):
 	'''
 	Test L{SpecDefaultEditor}
 	'''
-	pass
+	def test_index(self):
+		spec = "Name: foo\n%package devel\nRequires: bar\n%build\nmake\n%package doc\n%files\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		editor = SpecDefaultEditor(SpecModelReader(model), SpecModelWriter(model))
+		editor.requires_add({'devel': ['gcc'], 'doc': ['foo']})
+		editor.requires_remove({'devel': ['bar']})
+		defs = model.find_package('devel')[0].get_defs()
+		self.assertEqual(len(defs), 1)
+		self.assertEqual(str(defs[0].get_value()), 'gcc')
+		editor.package_remove(['devel'])
+		self.assertEqual(model.find_package('devel'), None)
+		self.assertEqual([str(p.get_package()) for p in model.find_section(SpecStPackage)], ['doc'])
+		editor.build_edit("make all\n")
+		self.assertEqual(len(model.find_section(SpecStBuild)), 1)
+		self.assertEqual(model.find_section(SpecSection), model.get_sections())
+		self.assertEqual(len(model.find_section(SpecStDefinition)), 1)
+		self.assertRaises(SpecNotFound, editor.requires_add, {'devel': ['gcc']})
+
+	def test_fork(self):
+		spec = "Name: foo\n%package devel\nRequires: bar\n%build\nmake\n" \
+				"%changelog\n* Mon Jan 05 2015 Foo <foo@bar.com> - 1.0\n- Initial\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		writer = parser.get_model_writer()
+		variants = []
+		for release in ['1', '2']:
+			fork = writer.fork()
+			editor = SpecDefaultEditor(SpecModelReader(fork.get_model()), fork)
+			editor.requires_add({'devel': ['gcc' + release]})
+			editor.build_edit("make " + release + "\n")
+			editor.changelogentry_add(datetime.date(2015, 1, 6), 'Foo', 'foo@bar.com', None, '- Release ' + release)
+			variants.append(fork.get_model())
+		editor = SpecDefaultEditor(SpecModelReader(variants[1]), SpecModelWriter(variants[1]))
+		editor.requires_remove({'devel': ['bar']})
+
+		outputs = []
+		for model in [writer.get_model()] + variants:
+			output = cStringIO.StringIO()
+			SpecFileRenderer(SpecModelReader(model)).render(output)
+			outputs.append(output.getvalue())
+		self.assertEqual(outputs[0], spec)
+		self.assertTrue("Requires: bar\nRequires: gcc1\n%build\nmake 1\n" in outputs[1])
+		self.assertTrue("%package devel\nRequires: gcc2\n%build\nmake 2\n" in outputs[2])
+		self.assertTrue("- Release 2" in outputs[2] and "- Release 2" not in outputs[1])
+		self.assertTrue(variants[0].get_sections()[0] is writer.get_model().get_sections()[0])
+		self.assertFalse(variants[0].get_sections()[1] is writer.get_model().get_sections()[1])
+
+	def test_fork_tokens(self):
+		spec = "Name: foo\nRelease: 1\n%build\nmake\n" \
+				"%changelog\n* Mon Jan 05 2015 Foo <foo@bar.com> - 1.0\n- Initial\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		writer = parser.get_model_writer()
+		model = writer.get_model()
+		fork = writer.fork()
+		fork.modify(model.find_definitions('Release')[0]).get_value()[0].set_token('2')
+		fork.modify(model.find_section(SpecStBuild)[0]).get_tokens()[0].set_token('ninja')
+		entry = model.find_section(SpecStChangelog)[0].get_entries()[0]
+		fork.modify(entry).get_message()[0].set_token('+')
+		renderer = SpecFileRenderer(SpecModelReader(model))
+		renderer.passthrough = False
+		output = cStringIO.StringIO()
+		renderer.render(output)
+		self.assertEqual(output.getvalue(), spec)
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(fork.get_model())).render(output)
+		self.assertEqual(output.getvalue(), spec.replace('Release: 1', 'Release: 2').replace('make', 'ninja') \
+				.replace('- Initial', '+ Initial'))
+		changes = SpecModelDiff(model, fork.get_model()).diff()
+		self.assertEqual([ (c[0], c[1]) for c in changes ], [ (SpecModelDiff.CHANGED, SpecModelDiff.DEFINITION),
+				(SpecModelDiff.CHANGED, SpecModelDiff.SECTION), (SpecModelDiff.CHANGED, SpecModelDiff.CHANGELOG) ])
+
+	def test_digest(self):
+		spec = "Name: foo\n%package devel\nRequires: bar\n%build\nmake\n%files\n/usr/bin/foo\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		writer = parser.get_model_writer()
+		reader = SpecModelReader(writer.get_model())
+		digest = reader.get_model_digest()
+		files = reader.find_section(SpecStFiles)[0]
+		package = reader.find_package('devel')[0]
+		digests = (reader.get_digest(files), reader.get_digest(package))
+		fork = writer.fork()
+		fork_reader = SpecModelReader(fork.get_model())
+		editor = SpecDefaultEditor(fork_reader, fork)
+		editor.requires_add({'devel': ['gcc']})
+		self.assertEqual(reader.get_model_digest(), digest)
+		self.assertNotEqual(fork_reader.get_model_digest(), digest)
+		self.assertEqual(fork_reader.get_digest(files), digests[0])
+		self.assertNotEqual(fork_reader.get_digest(fork_reader.find_package('devel')[0]), digests[1])
+		model = SpecSerializer().loads(SpecSerializer().dumps(writer.get_model()))
+		self.assertEqual(SpecModelReader(model).get_model_digest(), digest)
+
+	def test_sections_add(self):
+		spec = "Name: foo\n%description\nfoo\n%package devel\n%install\nmake install\n%files\n%changelog\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		reader = SpecModelReader(model)
+		editor = SpecDefaultEditor(reader, SpecModelWriter(model))
+		sections = SpecFileParser(reader)
+		sections.init("%check\nmake check\n%install\ncp foo\n%build\nmake\n%prep\n%prep\n%setup\n")
+		editor.sections_add(sections.parse_loop_section())
+		editor.package_add(['doc', 'test'])
+		self.assertEqual([ s.__class__ for s in model.get_sections()[1:] ],
+				[ SpecStDescription, SpecStPackage, SpecStPackage, SpecStPackage, SpecStPrep,
+					SpecStBuild, SpecStInstall, SpecStCheck, SpecStFiles, SpecStChangelog ])
+		self.assertEqual([ str(s.get_package()) for s in model.get_sections()[2:5] ], ['devel', 'doc', 'test'])
+		self.assertEqual(str(reader.find_section(SpecStInstall)[0].get_tokens()[0]), 'cp')
+		self.assertEqual(str(reader.find_section(SpecStPrep)[0].get_tokens()[0]), '%setup')
+		self.assertEqual(len(reader.find_package('doc')), 1)
+		output = cStringIO.StringIO()
+		SpecFileRenderer(reader).render(output)
+		self.assertTrue("%package doc\n\n%package test\n\n%prep\n" in output.getvalue())
 
 ################################################################################
 
@@ -165,7 +738,92 @@ class TestFileRenderer(unittest.TestCase):
 	'''
 	Test L{SpecFileRenderer}
 	'''
-	pass
+	def test_definitions(self):
+		spec = "Name: foo\n%if 1\nRequires: bar\n%else\nRequires(post): baz\n%endif\n" \
+				"%package devel\n%if 0\nRequires: gcc\n%endif\nProvides: foo-devel\n%build\nmake\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		renderer = SpecFileRenderer(SpecModelReader(model))
+		output = cStringIO.StringIO()
+		renderer.requires_show(['-', 'devel'], output)
+		self.assertEqual(output.getvalue(), "-:bar\ndevel:gcc\n")
+		gcc = model.find_definitions('Requires', ['devel'])[0]
+		self.assertEqual([b for _, b in model.get_definition_path(gcc)], [True])
+		self.assertEqual([b for _, b in model.get_definition_path(model.find_definitions('Requires(post):')[0])], [False])
+		editor = SpecDefaultEditor(SpecModelReader(model), SpecModelWriter(model))
+		editor.requires_add({'devel': ['gdb']})
+		editor.provides_remove({'devel': ['foo-devel']})
+		output = cStringIO.StringIO()
+		renderer.requires_show(['*'], output)
+		self.assertEqual(output.getvalue(), "-:bar\ndevel:gcc\ndevel:gdb\n")
+		self.assertEqual(model.find_definitions('Provides:'), [])
+		parser.reparse_text(parser.text.replace('Name: foo', 'Name: foo\nRequires: first'))
+		model = parser.get_model_writer().get_model()
+		self.assertEqual(model.find_definitions_all(), [s for s in model.walk() if isinstance(s, SpecStDefinition)])
+		self.assertEqual(str(model.find_definitions('Requires', ['-'])[0].get_value().token_list[0]), 'first')
+
+	def test_passthrough(self):
+		spec = "Name: foo\n\n%package devel\n%if 0\nRequires: gcc\n%endif\n%build\nmake\n" \
+				"%changelog\n* Wed Nov 25 2015 John Doe <jd@example.com> - 1.0\n- init\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		self.assertEqual([s for s in model.walk() if s.is_dirty()], [])
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(model)).render(output)
+		self.assertEqual(output.getvalue(), spec)
+		writer = SpecModelWriter(model).fork()
+		editor = SpecDefaultEditor(SpecModelReader(writer.get_model()), writer)
+		editor.requires_add({'devel': ['gdb']})
+		editor.changelogentry_add(datetime.date(2015, 11, 26), 'John Doe', 'jd@example.com', '1.1', '- fix')
+		model = writer.get_model()
+		self.assertEqual([type(s) for s in model.walk() if s.is_dirty()], [SpecStPackage, SpecStDefinition, SpecStChangelog])
+		renderer = SpecFileRenderer(SpecModelReader(model))
+		output = cStringIO.StringIO()
+		renderer.render(output)
+		renderer.passthrough = False
+		rendered = cStringIO.StringIO()
+		renderer.render(rendered)
+		self.assertEqual(output.getvalue(), rendered.getvalue())
+		self.assertTrue("Requires: gcc\n%endif\nRequires: gdb\n" in output.getvalue())
+
+	def test_edit_in_place(self):
+		spec = "Name: foo\n%if 1\nRequires: bar\n%endif\n%build\nmake\n%install\nmake install\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		model.find_section(SpecStBuild)[0].get_tokens()[0].set_token('ninja')
+		model.find_definitions('Requires')[0].get_value()[0].set_token('baz')
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(model)).render(output)
+		self.assertEqual(output.getvalue(), spec.replace('make\n', 'ninja\n').replace('bar', 'baz'))
+		self.assertEqual([type(s) for s in model.walk() if s.is_dirty()], [SpecStIf, SpecStDefinition, SpecStBuild])
+
+	def test_edit_definitions(self):
+		spec = "Name: foo\n%package devel\nProvides: foo-devel\n%build\nmake\n"
+		parser = SpecFileParser(SpecModelWriter())
+		parser.init(spec)
+		parser.parse()
+		model = parser.get_model_writer().get_model()
+		self.assertEqual(model.find_definitions('Requires'), [])
+		devel = model.find_package('devel')[0]
+		provides = model.find_definitions('Provides')[0]
+		gcc = SpecModel.copy_section(provides)[provides]
+		gcc.get_name().set_token('Requires:')
+		gcc.get_value()[0].set_token('gcc')
+		devel.defs_append(gcc)
+		self.assertEqual(model.find_definitions('Requires', ['devel']), [gcc])
+		model = cPickle.loads(cPickle.dumps(model, cPickle.HIGHEST_PROTOCOL))
+		model.find_definitions('Provides')[0].get_name().set_token('Conflicts:')
+		self.assertEqual(model.find_definitions('Provides'), [])
+		output = cStringIO.StringIO()
+		SpecFileRenderer(SpecModelReader(model)).requires_show(['devel'], output)
+		self.assertEqual(output.getvalue(), "devel:gcc\n")
+		self.assertEqual(len(model.find_definitions('Conflicts')), 1)
 
 ################################################################################
 
@@ -194,7 +852,8 @@ if __name__ == '__main__':
 	loader = unittest.TestLoader()
 
 	suites_list = []
-	for test_class in [TestGeneric, TestFileParser, TestDefaultEditor, TestFileRenderer]:
+	for test_class in [TestGeneric, TestTokenList, TestFileParser, TestCache, TestSerializer, TestModelDiff,
+			TestEventParser, TestDefaultEditor, TestFileRenderer]:
 		suites_list.append(loader.loadTestsFromTestCase(test_class))
 
 	unittest.TextTestRunner(verbosity = unittest_verbosity).run(unittest.TestSuite(suites_list))
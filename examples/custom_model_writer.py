@@ -22,7 +22,7 @@ class MySpecModelWriter(SpecModelWriter):
 			if len(files) == 0:
 				return
 
-			files_section = files[0]
+			files_section = self.modify(files[0])
 
 			output = cStringIO.StringIO()
 			new_tokens = SpecTokenList()
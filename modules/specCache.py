@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# ####################################################################
+# specker-lib - spec file manipulation library
+# Copyright (C) 2015  Fridolin Pokorny, fpokorny@redhat.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# ####################################################################
+'''
+An on-disk cache of parsed spec models
+@author: Fridolin Pokorny
+@contact: fpokorny@redhat.com
+@organization: Red Hat Inc.
+@license: GPL 2.0
+'''
+
+import os
+import time
+import zlib
+import errno
+import fcntl
+import cPickle
+import hashlib
+import tempfile
+from specDebug import SpecDebug
+
+class SpecCache(object):
+	'''
+	A cache of parsed spec models stored in a directory; models are pickled
+	together with their token tables and stored under a hash of the spec
+	content and the parser configuration. Entries are written atomically,
+	so the cache can be shared by concurrent processes. When the cache grows
+	over its size, least recently used entries are removed. Loading a pickle
+	can run arbitrary code, so the cache directory is private and entries
+	not owned by the current user are not loaded.
+	@cvar VERSION: version of stored entries, has to be changed when pickled
+	classes change
+	'''
+	VERSION = 10
+	SIZE = 128 * 1024 * 1024
+	SUFFIX = '.model'
+	TMP_SUFFIX = '.tmp'
+	TMP_AGE = 3600 # age of abandoned temporary files to be removed, in seconds
+
+	def __init__(self, path, size = SIZE):
+		'''
+		Init cache, create cache directory accessible only by the current
+		user if needed
+		@param path: cache directory
+		@type path: string
+		@param size: maximum size of the cache in bytes
+		@type size: number
+		@return: None
+		@rtype: None
+		'''
+		self.path = path
+		self.size = size
+		try:
+			os.makedirs(path, 0700)
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+
+	def get_key(self, specFile, parser, *args):
+		'''
+		Get a key of a parsed spec
+		@param specFile: spec file to be parsed
+		@type specFile: L{SpecFile}
+		@param parser: parser used, its registered section parsers are a part
+		of the key
+		@type parser: L{SpecFileParser}
+		@param args: other values affecting the parsed model, e.g. lexer
+		@type args: list
+		@return: cache key
+		@rtype: string
+		'''
+		h = hashlib.sha1()
+		h.update("%d\n" % self.VERSION)
+		for manipulator in [ parser.__class__ ] + parser.PREAMBLE_MANIPULATORS + parser.MANIPULATORS:
+			h.update("%s.%s\n" % (manipulator.__module__, manipulator.__name__))
+		for arg in args:
+			h.update("%r\n" % (arg,))
+		h.update(specFile.content)
+		return h.hexdigest()
+
+	def get_path(self, key):
+		'''
+		Get path of a cache entry
+		@param key: cache key, see L{get_key}
+		@type key: string
+		@return: path of the entry
+		@rtype: string
+		'''
+		return os.path.join(self.path, key + self.SUFFIX)
+
+	def load(self, key):
+		'''
+		Load a model from the cache
+		@param key: cache key, see L{get_key}
+		@type key: string
+		@return: cached model or None if not cached
+		@rtype: L{SpecModel}
+		'''
+		path = self.get_path(key)
+		try:
+			with open(path, 'rb') as f:
+				if os.fstat(f.fileno()).st_uid != os.getuid():
+					SpecDebug.debug("- ignoring cache entry '%s' of another user" % key)
+					return None
+				model = cPickle.loads(zlib.decompress(f.read()))
+		except IOError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			SpecDebug.debug("- cache miss '%s'" % key)
+			return None
+		except (zlib.error, cPickle.UnpicklingError, EOFError, AttributeError, ImportError):
+			SpecDebug.debug("- removing broken cache entry '%s'" % key)
+			self.remove(path)
+			return None
+
+		# entries are evicted by time of the last use
+		try:
+			os.utime(path, None)
+		except OSError:
+			pass
+
+		SpecDebug.debug("- cache hit '%s'" % key)
+		return model
+
+	def store(self, key, model):
+		'''
+		Store a model to the cache, evict old entries if needed
+		@param key: cache key, see L{get_key}
+		@type key: string
+		@param model: model to be stored
+		@type model: L{SpecModel}
+		@return: None
+		@rtype: None
+		'''
+		try:
+			data = zlib.compress(cPickle.dumps(model, cPickle.HIGHEST_PROTOCOL), 1)
+		except RuntimeError: # pickle recurses, models of deeply nested %ifs are not cached
+			SpecDebug.debug("- model too deep to be cached '%s'" % key)
+			return
+
+		# mkstemp makes entries private
+		fd, tmp = tempfile.mkstemp(suffix = self.TMP_SUFFIX, dir = self.path)
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				f.write(data)
+			# readers see either no entry or a complete one
+			os.rename(tmp, self.get_path(key))
+		except:
+			self.remove(tmp)
+			raise
+
+		SpecDebug.debug("- cached '%s'" % key)
+		self.evict()
+
+	def evict(self):
+		'''
+		Remove least recently used entries until the cache fits its size,
+		skipped if another process is evicting
+		@return: None
+		@rtype: None
+		'''
+		with open(os.path.join(self.path, '.lock'), 'w') as lock:
+			try:
+				fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except IOError as e:
+				if e.errno in (errno.EAGAIN, errno.EACCES):
+					return
+				raise
+
+			entries = []
+			total = 0
+			now = time.time()
+			for name in os.listdir(self.path):
+				path = os.path.join(self.path, name)
+				try:
+					st = os.stat(path)
+				except OSError: # removed meanwhile
+					continue
+
+				if name.endswith(self.SUFFIX):
+					entries.append((st.st_mtime, st.st_size, path))
+					total += st.st_size
+				elif name.endswith(self.TMP_SUFFIX) and now - st.st_mtime > self.TMP_AGE:
+					self.remove(path)
+
+			entries.sort()
+			for _, size, path in entries:
+				if total <= self.size:
+					break
+				SpecDebug.debug("- evicting cache entry '%s'" % path)
+				self.remove(path)
+				total -= size
+
+	@staticmethod
+	def remove(path):
+		'''
+		Remove a file, it could be already removed by another process
+		@param path: path of a file
+		@type path: string
+		@return: None
+		@rtype: None
+		'''
+		try:
+			os.unlink(path)
+		except OSError as e:
+			if e.errno != errno.ENOENT:
+				raise
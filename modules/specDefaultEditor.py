@@ -25,7 +25,6 @@ A spec model editor
 @license: GPL 2.0
 '''
 
-import re
 from specSection import *
 from specDebug import SpecDebug
 from specToken import SpecToken, SpecTokenList
@@ -122,6 +121,7 @@ class SpecDefaultEditor(SpecModelEditor):
 				raise SpecNotImplemented("Cannot edit more then one section")
 
 			SpecDebug.debug("- editing section '%s'" % str(s[0]))
+			s[0] = self.get_model_writer().modify(s[0])
 			self.get_editor(s[0]).edit(s[0], replacement)
 		elif verbose:
 			raise SpecNotFound("Error: section type '%s' not found" % section_type)
@@ -139,7 +139,7 @@ class SpecDefaultEditor(SpecModelEditor):
 		'''
 		for section in sections:
 			SpecDebug.debug("- adding section '%s'" % str(section))
-			self.get_model_writer().add(section)
+		self.get_model_writer().add_items(sections)
 
 	def find_section_add(self, section_type, items, verbose = True):
 		'''
@@ -159,6 +159,7 @@ class SpecDefaultEditor(SpecModelEditor):
 
 		if s is not None:
 			SpecDebug.debug("- adding section to '%s'", str(s[0]))
+			s[0] = self.get_model_writer().modify(s[0])
 			self.get_editor(s[0]).add(s[0], items)
 		elif verbose:
 			raise SpecNotFound("Error: section '%s' not found" % section_type)
@@ -186,18 +187,17 @@ class SpecDefaultEditor(SpecModelEditor):
 					d = definition_editor.create(None, definition, val)
 					self.get_model_writer().add(d)
 			else:
-				found = False
-				for st_pkg in self.get_model_reader().get_sections():
-					if issubclass(st_pkg.__class__, SpecStPackage):
-						if st_pkg.pkg != None and str(st_pkg.get_package()) == pkg:
-							found = True
-							for val in packages[str(st_pkg.get_package())]:
-								d = definition_editor.create(st_pkg, definition, val)
-								package_editor.add_definition(st_pkg, d)
-
-				if not found:
+				st_pkgs = self.get_model_reader().find_package(pkg)
+				if not st_pkgs:
 					raise SpecNotFound("Package '%s' not found" % pkg)
 
+				for st_pkg in st_pkgs:
+					st_pkg = self.get_model_writer().modify(st_pkg)
+					for val in packages[pkg]:
+						d = definition_editor.create(st_pkg, definition, val)
+						package_editor.add_definition(st_pkg, d)
+					self.get_model_writer().update(st_pkg)
+
 	def find_definition_remove(self, definition, packages):
 		'''
 		Find definition in specific package and remove it
@@ -212,21 +212,23 @@ class SpecDefaultEditor(SpecModelEditor):
 		'''
 		for pkg in packages:
 			if pkg == '-':
-				for st_def in self.get_model_reader().model.get_sections():
-					if issubclass(st_def.__class__, SpecStDefinition):
-						if definition.match(str(st_def.get_name())):
-							for val in packages['-']:
-								if st_def.get_value() == val:
-									self.get_model_writer().remove(st_def)
+				for st_def in self.get_model_reader().find_definitions(definition, ['-']):
+					if st_def.parent is None and any(st_def.get_value() == val for val in packages['-']):
+						self.get_model_writer().remove(st_def)
 			else:
-				found = False
-				for st_pkg in self.get_model_reader().model.get_sections():
-					if type(st_pkg) is SpecStPackage:
-						if st_pkg.pkg != None and str(st_pkg.pkg) == pkg:
-								st_pkg.remove_definition(definition, packages[pkg])
-				if not found:
+				st_pkgs = self.get_model_reader().find_package(pkg)
+				if not st_pkgs:
 					raise SpecNotFound("Package '%s' not found" % pkg)
 
+				package_editor = self.get_editor_class(SpecStPackage)
+				st_pkgs = [ self.get_model_writer().modify(st_pkg) for st_pkg in st_pkgs ]
+				for st_def in self.get_model_reader().find_definitions(definition, [pkg]):
+					if st_def.parent in st_pkgs and any(st_def.get_value() == val for val in packages[pkg]):
+						package_editor.remove_definition(st_def.parent, st_def)
+
+				for st_pkg in st_pkgs:
+					self.get_model_writer().update(st_pkg)
+
 	################################################################################
 
 	def provides_add(self, packages):
@@ -251,7 +253,7 @@ class SpecDefaultEditor(SpecModelEditor):
 		@rtype: None
 		@raise SpecNotFound: if package is not found
 		'''
-		self.find_definition_remove(re.compile('Provides:'), packages)
+		self.find_definition_remove('Provides:', packages)
 
 	def requires_add(self, packages):
 		'''
@@ -275,7 +277,7 @@ class SpecDefaultEditor(SpecModelEditor):
 		@rtype: None
 		@raise SpecNotFound: if package is not found
 		'''
-		self.find_definition_remove(re.compile('Requires:'), packages)
+		self.find_definition_remove('Requires:', packages)
 
 	def buildrequires_add(self, packages):
 		'''
@@ -299,7 +301,7 @@ class SpecDefaultEditor(SpecModelEditor):
 		@rtype: None
 		@raise SpecNotFound: if package is not found
 		'''
-		return self.find_definition_remove(re.compile('BuildRequires:'), packages)
+		return self.find_definition_remove('BuildRequires:', packages)
 
 	def changelogentry_add(self, date, username, email, version, msg):
 		'''
@@ -325,7 +327,8 @@ class SpecDefaultEditor(SpecModelEditor):
 		if len(changelog) != 1:
 			raise SpecNotFound("Cannot add changelog entry, changelog not found")
 
-		self.get_editor(changelog[0]).add_entry(changelog[0], date, username, email, version, msg)
+		changelog = self.get_model_writer().modify(changelog[0])
+		self.get_editor(changelog).add_entry(changelog, date, username, email, version, msg)
 
 	def description_edit(self, replacement, package = None):
 		'''
@@ -414,9 +417,8 @@ class SpecDefaultEditor(SpecModelEditor):
 		@todo: rename to packages_add()
 		'''
 		# TODO: check for duplicit entry
-		for pkg_name in items:
-			pkg = self.get_editor_class(SpecStPackage).create(None, pkg_name)
-			self.get_model_writer().add(pkg)
+		pkgs = [ self.get_editor_class(SpecStPackage).create(None, pkg_name) for pkg_name in items ]
+		self.get_model_writer().add_items(pkgs)
 
 	def package_remove(self, items):
 		'''
@@ -430,15 +432,8 @@ class SpecDefaultEditor(SpecModelEditor):
 		@todo: rename to packages_remove()
 		'''
 		for item in items:
-			for st_pkg in self.get_model_reader().get_sections():
-				if not issubclass(st_pkg.__class__, SpecStPackage):
-					continue
-
-				if (item == '-' or item is None) and st_pkg.get_package() is None:
-					self.get_model_writer().remove(st_pkg)
-				elif item is not None and st_pkg.get_package() is not None and \
-						item == str(st_pkg.get_package()):
-					self.get_model_writer().remove(st_pkg)
+			for st_pkg in self.get_model_reader().find_package(item) or []:
+				self.get_model_writer().remove(st_pkg)
 
 	def prep_edit(self, replacement):
 		'''
@@ -742,7 +737,7 @@ class SpecChangelogEditor(SpecSectionEditor):
 		@return: newly added entry
 		@rtype: L{SpecStChangelog.SpecStChangelogEntry}
 		'''
-		entry = SpecChangelogEditor.obj.SpecStChangelogEntry(changelog)
+		entry = SpecStChangelog.SpecStChangelogEntry(changelog)
 		entry.set_star(SpecToken.create('*'))
 		entry.set_date(SpecToken.create(date.strftime("%a %b %d %Y")))
 		entry.set_date_parsed(date)
@@ -813,9 +808,10 @@ class SpecPackageEditor(SpecSectionEditor):
 		'''
 		ret = SpecStPackage(parent)
 		pkg = None if pkg == None or pkg == '-' else pkg
+		# separated from the next section by a blank line as parsed sections are
 		if pkg is not None:
-			ret.set_package(SpecToken().create(pkg, append = '\n'))
-		ret.set_token_section(SpecToken().create('%package', append = '\n' if pkg is None else ' '))
+			ret.set_package(SpecToken().create(pkg, append = '\n\n'))
+		ret.set_token_section(SpecToken().create('%package', append = '\n\n' if pkg is None else ' '))
 		return ret
 
 	@classmethod
@@ -830,6 +826,19 @@ class SpecPackageEditor(SpecSectionEditor):
 		# TODO: based on alphabet?
 		pkg.defs_append(definition)
 
+	@classmethod
+	def remove_definition(cls, pkg, definition):
+		'''
+		Remove a definition from the package
+		@param pkg: package to remove definition from
+		@type pkg: L{SpecStPackage}
+		@param definition: definition to be removed
+		@type definition: L{SpecStDefinition}
+		@return: None
+		@rtype: None
+		'''
+		pkg.defs_remove(definition)
+
 class SpecPrepEditor(SpecSectionEditor):
 	'''
 	Prep section editor
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+# ####################################################################
+# specker-lib - spec file manipulation library
+# Copyright (C) 2015  Fridolin Pokorny, fpokorny@redhat.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# ####################################################################
+'''
+Event driven spec parser
+@author: Fridolin Pokorny
+@contact: fpokorny@redhat.com
+@organization: Red Hat Inc.
+@license: GPL 2.0
+'''
+
+import sys
+import functools
+from specDebug import SpecDebug
+from specError import SpecBadToken
+from specLexer import SpecLexer
+from specToken import SpecTokenList
+from specFileParser import SpecFileParser, SpecSectionParser, SpecIfParser, SpecDefinitionParser, \
+		SpecGlobalParser, SpecDefineParser, SpecChangelogParser, SpecPackageParser
+
+class SpecEventHandler(object):
+	'''
+	Handler of events generated by L{SpecEventParser}, all events are
+	ignored by default
+	'''
+	def section_start(self, kind, token, package):
+		'''
+		A section started
+		@param kind: section kind, e.g. '%build'
+		@type kind: string
+		@param token: section token
+		@type token: L{SpecToken}
+		@param package: package name token of %package section, None otherwise
+		@type package: L{SpecToken}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def section_body(self, tokens):
+		'''
+		Body of a section, e.g. commands in %build; bodies are skipped
+		without creating token lists if this event is not handled
+		@param tokens: section body
+		@type tokens: L{SpecTokenList}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def section_end(self, kind):
+		'''
+		A section ended
+		@param kind: section kind, e.g. '%build'
+		@type kind: string
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def definition(self, name, value, package):
+		'''
+		A definition, e.g. 'Requires: foo'
+		@param name: definition name token, e.g. 'Requires:'
+		@type name: L{SpecToken}
+		@param value: definition value
+		@type value: L{SpecTokenList}
+		@param package: package name token or None if not in a named package
+		@type package: L{SpecToken}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def macro(self, token, variable, value):
+		'''
+		A macro definition, %global or %define
+		@param token: %global or %define token
+		@type token: L{SpecToken}
+		@param variable: macro name
+		@type variable: L{SpecToken}
+		@param value: macro value
+		@type value: L{SpecTokenList}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def if_start(self, token, expr):
+		'''
+		A condition started, true branch follows
+		@param token: %if or %ifarch token
+		@type token: L{SpecToken}
+		@param expr: condition expression
+		@type expr: L{SpecTokenList}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def if_else(self, token):
+		'''
+		False branch of a condition follows
+		@param token: %else token
+		@type token: L{SpecToken}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def if_end(self, token):
+		'''
+		A condition ended
+		@param token: %endif token
+		@type token: L{SpecToken}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+	def changelog_entry(self, date, user, email, version, message):
+		'''
+		A changelog entry, date is not parsed, see
+		L{SpecChangelogParser.parse_date}
+		@param date: date tokens, e.g. ['Wed', 'Nov', '25', '2015']
+		@type date: L{SpecTokenList}
+		@param user: user tokens
+		@type user: L{SpecTokenList}
+		@param email: user email token, e.g. '<jd@example.com>'
+		@type email: L{SpecToken}
+		@param version: version token
+		@type version: L{SpecToken}
+		@param message: entry message
+		@type message: L{SpecTokenList}
+		@return: None
+		@rtype: None
+		'''
+		pass
+
+class SpecEventParser(SpecFileParser):
+	'''
+	A spec parser which does not build a model; events are passed to
+	a handler while walking tokens. Sections are recognized by registered
+	section parsers, see L{SpecFileParser}, parsers without events of their
+	own generate events of plain sections. Use streaming, see
+	L{SpecFileParser.init}, to keep only a window of tokens in memory.
+	@cvar EVENTS: methods generating events by section parsers
+	'''
+	EVENTS = {
+			SpecSectionParser: 'events_section',
+			SpecIfParser: 'events_if',
+			SpecDefinitionParser: 'events_definition',
+			SpecGlobalParser: 'events_macro',
+			SpecDefineParser: 'events_macro',
+			SpecChangelogParser: 'events_changelog',
+			SpecPackageParser: 'events_package'
+		}
+
+	def __init__(self, handler):
+		'''
+		Init
+		@param handler: handler of generated events
+		@type handler: L{SpecEventHandler}
+		@return: None
+		@rtype: None
+		'''
+		SpecFileParser.__init__(self, None)
+		self.handler = handler
+		self.bodies = type(handler).section_body != SpecEventHandler.section_body
+
+	def get_events(self, parser):
+		'''
+		Get a method generating events of sections parsed by a parser
+		@param parser: section parser
+		@type parser: L{SpecSectionParser}
+		@return: method generating events, see L{events_section}
+		@rtype: method
+		'''
+		for cls in parser.__mro__:
+			name = self.EVENTS.get(cls)
+			if name is not None:
+				return getattr(self, name)
+		return self.events_section
+
+	def parse(self):
+		'''
+		Parse provided spec file, events are passed to the handler
+		@return: None
+		@rtype: None
+		@raise SpecBadToken: when an unexpected token is reached
+		'''
+		self.parse_events(self.token_list, self.PREAMBLE_MANIPULATORS)
+		self.parse_events(self.token_list, self.MANIPULATORS)
+
+		eof = self.token_list.touch()
+		if not eof.is_eof():
+			raise SpecBadToken("Unexpected symbol '" + str(eof.token) + "' on line " + str(eof.line))
+
+	def parse_events(self, token_list, allowed):
+		'''
+		Generate events of sections until no allowed section can be parsed;
+		sections with nested sections are kept on an explicit stack, see
+		L{SpecFileParser.parse_loops}
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@param allowed: allowed sections to be parsed, section parsers
+		@type allowed: list of L{SpecSectionParser}
+		@return: None
+		@rtype: None
+		@raise SpecBadToken: when an unexpected token is reached
+		'''
+		stack = [] # sections being parsed as tuples (steps, loop)
+		loop = (allowed, None)
+		try:
+			while True:
+				allowed, package = loop
+				found = False
+				steps = None
+				if not token_list.touch().is_eof():
+					for parser in allowed:
+						kind = parser.section_beginning(token_list)
+						if kind:
+							found = True
+							steps = self.get_events(parser)(token_list, kind, allowed, package)
+							break
+
+				if not found:
+					SpecDebug.debug("- events finished with token '%s'" % str(token_list.touch()))
+					if not stack:
+						return
+					steps, loop = stack.pop()
+
+				if steps is not None:
+					request = next(steps, None)
+					if request is not None:
+						stack.append((steps, loop))
+						loop = request
+		except:
+			# let unfinished sections clean up, innermost first
+			exc = sys.exc_info()
+			while stack:
+				stack.pop()[0].close()
+			raise exc[0], exc[1], exc[2]
+
+	@staticmethod
+	def get_expression(token_list):
+		'''
+		Get tokens of an expression, see L{SpecExpressionParser}
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@return: expression tokens
+		@rtype: L{SpecTokenList}
+		@raise SpecBadToken: if an expression is not terminated
+		'''
+		tokens = SpecTokenList()
+		tokens.token_list_append(token_list.get())
+		while token_list.touch().kind == SpecLexer.KIND_OPERATOR:
+			tokens.token_list_append(token_list.get())
+			if token_list.touch().is_eof():
+				raise SpecBadToken("Unexpected EOF, expected expression termination")
+			tokens.token_list_append(token_list.get())
+		return tokens
+
+	def events_section(self, token_list, kind, allowed, package):
+		'''
+		Generate events of a plain section
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@param kind: section type, see L{SpecSectionParser.section_beginning}
+		@type kind: __class__
+		@param allowed: allowed sections
+		@type allowed: list of L{SpecSectionParser}
+		@param package: package name token or None
+		@type package: L{SpecToken}
+		@return: None or a generator of nested loops to be parsed as tuples
+		(allowed, package)
+		@rtype: generator
+		'''
+		kind = str(kind)
+		self.handler.section_start(kind, token_list.get(), None)
+		callback = functools.partial(self.section_beginning_callback_no_if, self)
+		if self.bodies:
+			self.handler.section_body(token_list.get_while_not(callback, self.boundary_kinds))
+		else:
+			token_list.skip_while_not(callback, self.boundary_kinds)
+		self.handler.section_end(kind)
+
+	def events_definition(self, token_list, kind, allowed, package):
+		'''
+		Generate event of a definition, see L{events_section}
+		@raise ValueError: if definition value is missing
+		'''
+		name = token_list.get()
+		value = token_list.get_line()
+		if value.is_eof():
+			raise ValueError("Expected definition value, got '%s'" % str(value))
+		self.handler.definition(name, value, package)
+
+	def events_macro(self, token_list, kind, allowed, package):
+		'''
+		Generate event of %global or %define, see L{events_section}
+		@raise SpecBadToken: if macro name is missing
+		'''
+		token = token_list.get()
+		variable = token_list.get()
+		if variable.is_eof():
+			raise SpecBadToken("Expected variable, got '%s'" % str(variable))
+		self.handler.macro(token, variable, self.get_expression(token_list))
+
+	def events_if(self, token_list, kind, allowed, package):
+		'''
+		Generate events of %if, see L{events_section}
+		@raise SpecBadToken: if %endif is missing
+		'''
+		self.handler.if_start(token_list.get(), self.get_expression(token_list))
+		yield allowed, package
+
+		token = token_list.touch()
+		if token.kind == SpecLexer.KIND_CONDITIONAL and str(token) == '%else':
+			self.handler.if_else(token_list.get())
+			yield allowed, package
+			token = token_list.touch()
+
+		if token.kind != SpecLexer.KIND_CONDITIONAL or str(token) != '%endif':
+			raise SpecBadToken("Unexpected token '%s' on line '%s', expected 'endif'"
+					% (str(token), str(token.get_line())))
+		self.handler.if_end(token_list.get())
+
+	def events_package(self, token_list, kind, allowed, package):
+		'''
+		Generate events of %package, see L{events_section}
+		'''
+		kind = str(kind)
+		token = token_list.get()
+		package = None
+		if token.same_line(token_list.touch()):
+			package = token_list.get()
+		self.handler.section_start(kind, token, package)
+		yield [SpecIfParser, SpecDefinitionParser], package
+		self.handler.section_end(kind)
+
+	def events_changelog(self, token_list, kind, allowed, package):
+		'''
+		Generate events of %changelog, see L{events_section}
+		@raise SpecBadToken: if a changelog entry is malformed
+		'''
+		kind = str(kind)
+		self.handler.section_start(kind, token_list.get(), None)
+
+		callback = functools.partial(SpecChangelogParser.entry_boundary, self)
+		kinds = None
+		if self.boundary_kinds is not None:
+			kinds = self.boundary_kinds | set([SpecLexer.KIND_STAR])
+		while token_list.touch().kind == SpecLexer.KIND_STAR:
+			_, date, user, email, _, version = SpecChangelogParser.get_entry_header(token_list)
+			self.handler.changelog_entry(date, user, email, version, token_list.get_while_not(callback, kinds))
+
+		self.handler.section_end(kind)
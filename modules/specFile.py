@@ -25,28 +25,76 @@ A spec FILE abstraction
 @license: GPL 2.0
 '''
 
+import mmap
 import sys
+import array
+from bisect import bisect_right
 from specError import SpecBadIndex
 
 class SpecFile:
 	'''
 	A file abstraction with relative and absolute access using a pointer into
-	a buffer.
+	a buffer. Regular files are memory-mapped, so the buffer is not read
+	upfront; pipes and empty files are read as usual. An index of line offsets
+	is built on demand, lines joined by a backslash continuation form one
+	logical line.
 	'''
-	def __init__(self, spec):
+	def __init__(self, spec = None, path = None):
 		'''
 		Initialize C{SpecFile}
 		@param spec: file or string to be read
 		@type spec: file or string
+		@param path: path to a file to be read, used instead of spec
+		@type path: string
 		@return: None
 		@rtype: None
 		'''
-		if type(spec) is file:
-			self.content = spec.read()
+		self.mapped = False
+		if path is not None:
+			with open(path, 'rb') as f:
+				self.content = self.map_file(f)
+		elif type(spec) is file:
+			self.content = self.map_file(spec)
 		else: # string
 			self.content = spec
 		self.pointer = 0
 		self.length = len(self.content)
+		self.line_starts = None # offsets of lines, see build_line_index()
+		self.logical_lines = None
+
+	def map_file(self, f):
+		'''
+		Memory-map a file, fall back to reading if the file cannot be mapped
+		@param f: file to be mapped
+		@type f: file
+		@return: buffer with file content
+		@rtype: mmap or string
+		'''
+		try:
+			# mapping always starts at the beginning of a file
+			if f.tell() == 0:
+				ret = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+				self.mapped = True
+				return ret
+		except (EnvironmentError, ValueError):
+			# not seekable (e.g. pipe) or empty file
+			pass
+
+		return f.read()
+
+	def __getstate__(self):
+		'''
+		Get state to be pickled, a mapped buffer is stored as a string, line
+		index is built again on demand
+		@return: file state
+		@rtype: dict
+		'''
+		state = self.__dict__.copy()
+		state['line_starts'] = state['logical_lines'] = None
+		if self.mapped:
+			state['content'] = self.content[:]
+			state['mapped'] = False
+		return state
 
 	def in_file(self, position = None):
 		'''
@@ -138,6 +186,124 @@ class SpecFile:
 		if self.pointer != self.length:
 			self.pointer -= 1
 
+	def get_span(self, start, end):
+		'''
+		Get a part of the buffer
+		@param start: offset where the span starts
+		@type start: number
+		@param end: offset where the span ends
+		@type end: number
+		@return: span of the buffer
+		@rtype: string
+		'''
+		return self.content[start:end]
+
+	def count_eol(self, start, end):
+		'''
+		Count new lines in a part of the buffer
+		@param start: offset where the span starts
+		@type start: number
+		@param end: offset where the span ends
+		@type end: number
+		@return: number of new lines
+		@rtype: number
+		'''
+		if self.mapped: # mmap has no count()
+			return self.content[start:end].count('\n')
+		return self.content.count('\n', start, end)
+
+	def write_span(self, f, start, end):
+		'''
+		Write a part of the buffer to a file
+		@param f: file to write to
+		@type f: FILE
+		@param start: offset where the span starts
+		@type start: number
+		@param end: offset where the span ends
+		@type end: number
+		@return: None
+		@rtype: None
+		'''
+		f.write(self.content[start:end])
+
+	def build_line_index(self):
+		'''
+		Build index of line offsets and logical lines, the index is built only
+		once
+		@return: None
+		@rtype: None
+		'''
+		if self.line_starts is not None:
+			return
+
+		content = self.content
+		find = content.find
+		line_starts = array.array('l', [0])
+		logical_lines = array.array('l', [1])
+		logical = 1
+
+		pos = find('\n')
+		while pos != -1:
+			if pos == 0 or content[pos - 1] != '\\':
+				logical += 1
+			line_starts.append(pos + 1)
+			logical_lines.append(logical)
+			pos = find('\n', pos + 1)
+
+		self.line_starts = line_starts
+		self.logical_lines = logical_lines
+
+	def get_line(self, offset):
+		'''
+		Get line of an offset in the buffer
+		@param offset: offset in the buffer
+		@type offset: number
+		@return: line number, first line is 1
+		@rtype: number
+		'''
+		self.build_line_index()
+		return bisect_right(self.line_starts, offset)
+
+	def get_position(self, offset):
+		'''
+		Get line and column of an offset in the buffer
+		@param offset: offset in the buffer
+		@type offset: number
+		@return: tuple (line, column), first line and column is 1
+		@rtype: tuple
+		'''
+		line = self.get_line(offset)
+		return (line, offset - self.line_starts[line - 1] + 1)
+
+	def get_line_offset(self, line):
+		'''
+		Get offset where a line starts
+		@param line: line number
+		@type line: number
+		@return: offset of the first char on the line
+		@rtype: number
+		@raise SpecBadIndex: if there is no such line
+		'''
+		self.build_line_index()
+		if line < 1 or line > len(self.line_starts):
+			raise SpecBadIndex("No line %d" % line)
+		return self.line_starts[line - 1]
+
+	def get_logical_line(self, line):
+		'''
+		Get logical line of a line, escaped new lines do not start
+		a new logical line
+		@param line: line number
+		@type line: number
+		@return: logical line number, first logical line is 1
+		@rtype: number
+		@raise SpecBadIndex: if there is no such line
+		'''
+		self.build_line_index()
+		if line < 1 or line > len(self.logical_lines):
+			raise SpecBadIndex("No line %d" % line)
+		return self.logical_lines[line - 1]
+
 	def reset(self):
 		'''
 		Reset buffer pointer to point at the beginning of the buffer
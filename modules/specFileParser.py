@@ -28,14 +28,17 @@ A spec file parser
 import copy
 import datetime
 import functools
-import re
 import sys
+from bisect import bisect_right
+from collections import OrderedDict
 from specDebug import SpecDebug
-from specError import SpecBadToken, SpecBadIf
+from specError import SpecBadToken, SpecBadIf, SpecBadParam, SpecNotImplemented
+from specFile import SpecFile
 from specModel import SpecModel
 from specModelParser import SpecModelParser
 from specSection import *
-from specToken import SpecTokenList
+from specToken import SpecTokenList, SpecTokenStream, SpecTokenTable
+from specLexer import SpecLexer
 
 class SpecFileParser(SpecModelParser):
 	'''
@@ -43,7 +46,13 @@ class SpecFileParser(SpecModelParser):
 	'''
 	def __init__(self, writer):
 		self.token_list = None
+		self.text = None   # parsed text, see reparse()
+		self.lazy = False  # see init()
+		self.stream = False
+		self.needed = None
+		self.spans = None  # top-level sections (section, preamble, first token)
 		self.set_model_writer(writer)
+		self.PREAMBLE_MANIPULATORS = [ SpecIfParser, SpecDefinitionParser, SpecGlobalParser ]
 		self.MANIPULATORS = [
 				SpecIfParser,
 				SpecDefinitionParser,
@@ -71,16 +80,107 @@ class SpecFileParser(SpecModelParser):
 				SpecTriggerpostunParser,
 				SpecVerifyscriptParser
 			]
+		self.build_index()
 
-	def init(self, f):
+	def register(self, manipulator):
+		'''
+		Register a section parser, see L{SpecModelManipulator.register}
+		@param manipulator: a parser to be registered
+		@type manipulator: L{SpecSectionParser}
+		@return: None
+		@rtype: None
+		@raise SpecNotFound: if provided parser cannot be registered
+		'''
+		SpecModelParser.register(self, manipulator)
+		self.build_index()
+
+	def build_index(self):
+		'''
+		Build index of section parsers by keys of tokens which can begin
+		a section, see L{SpecSectionParser.section_keys}; parsers which
+		override section_beginning without keys are tried for every token.
+		Has to be called if L{MANIPULATORS} are changed directly.
+		@return: None
+		@rtype: None
+		'''
+		def owner(parser, attr):
+			for cls in parser.__mro__:
+				if attr in cls.__dict__:
+					return cls
+			return None
+
+		keyed = {}
+		generic = set()
+		for parser in self.MANIPULATORS:
+			if owner(parser, 'section_beginning') is owner(parser, 'section_keys'):
+				for key in parser.section_keys():
+					keyed.setdefault(key, set()).add(parser)
+			else:
+				generic.add(parser)
+
+		# a keyword can be matched by parsers checking its token kind as well
+		self.index = {}
+		for key, parsers in keyed.iteritems():
+			if isinstance(key, basestring):
+				parsers = parsers | keyed.get(SpecLexer.classify(key), set())
+			self.index[key] = [ p for p in self.MANIPULATORS if p in parsers or p in generic ]
+		self.index_generic = [ p for p in self.MANIPULATORS if p in generic ]
+
+		# kinds of tokens which can begin a section, see SpecTokenList.get_while_not()
+		if generic:
+			self.boundary_kinds = None
+		else:
+			self.boundary_kinds = set(SpecLexer.classify(key) if isinstance(key, basestring) else key
+					for key in keyed)
+
+	def get_section_parsers(self, token):
+		'''
+		Get section parsers which can parse a section beginning with a token
+		@param token: token to be checked
+		@type token: L{SpecToken}
+		@return: section parsers in order of L{MANIPULATORS}
+		@rtype: list of L{SpecSectionParser}
+		'''
+		parsers = self.index.get(token.token)
+		if parsers is None:
+			parsers = self.index.get(token.kind, self.index_generic)
+		return parsers
+
+	def init(self, f, lexer = SpecTokenList.LEXER_REGEX, stream = False, lazy = False, needed = None):
 		'''
 		Init parser
-		@param f: FILE or a string to init parser from
-		@type f: FILE or a string
+		@param f: FILE, a string or L{SpecFile} to init parser from
+		@type f: FILE, a string or L{SpecFile}
+		@param lexer: lexer to be used, see L{SpecTokenList.LEXERS}
+		@type lexer: string
+		@param stream: if True, tokens are lexed on demand while parsing, see
+		L{SpecTokenStream}
+		@type stream: Boolean
+		@param lazy: if True, section bodies are kept as ranges of tokens
+		until accessed, see L{SpecStSection.set_tokens_span}; ignored when
+		streaming
+		@type lazy: Boolean
+		@param needed: names of sections to be parsed, e.g. '%changelog'; other
+		sections after preamble are skipped and kept as L{SpecStRaw}, None to
+		parse all sections. Sections to be edited or searched for have to be
+		listed.
+		@type needed: set of strings
 		@return: None
 		@rtype: None
+		@raise SpecBadParam: if streaming is requested with a lexer other than regex
 		'''
-		self.token_list = SpecTokenList(f)
+		self.text = self.spans = None
+		self.lazy = lazy and not stream
+		self.stream = stream
+		self.needed = needed
+		if not stream:
+			self.token_list = SpecTokenList(f, lexer)
+			if self.token_list.table is not None:
+				self.text = self.token_list.table.source.content
+		elif lexer == SpecTokenList.LEXER_REGEX:
+			self.token_list = SpecTokenStream(f)
+		else:
+			raise SpecBadParam("Streaming is supported only with '%s' lexer" % SpecTokenList.LEXER_REGEX)
 
 	@staticmethod
 	def section_beginning_callback(obj, token_list):
@@ -104,7 +204,7 @@ class SpecFileParser(SpecModelParser):
 		@return: section parser to be used to parse the upcoming section
 		@rtype: L{SpecModelParser}
 		'''
-		for parser in self.MANIPULATORS:
+		for parser in self.get_section_parsers(token_list.touch()):
 			ret = parser.section_beginning(token_list)
 			if ret is not None:
 				return parser
@@ -133,13 +233,100 @@ class SpecFileParser(SpecModelParser):
 		@return: section parser to be used to parse the upcoming section
 		@rtype: L{SpecModelParser}
 		'''
-		for parser in self.MANIPULATORS:
+		for parser in self.get_section_parsers(token_list.touch()):
 			ret = parser.section_beginning(token_list)
 			if ret is not None and not issubclass(ret, SpecStIf):
 				return parser
 
 		return None # Not found
 
+	def parse_section(self, token_list, parent, allowed):
+		'''
+		Parse a section on the current position
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section
+		@type parent: L{SpecSection}
+		@param allowed: allowed sections to be parsed, section parsers
+		@type allowed: list of L{SpecSectionParser}
+		@return: parsed section or None if no allowed section was found
+		@rtype: L{SpecSection}
+		'''
+		pointer = token_list.get_pointer()
+		section, steps = self.parse_section_steps(token_list, parent, allowed)
+		if steps is not None:
+			self.parse_nested(token_list, section, steps)
+		if section is not None:
+			self.set_origin(token_list, section, pointer)
+		return section
+
+	@staticmethod
+	def set_origin(token_list, section, pointer):
+		'''
+		Remember span of a parsed section in the source buffer, so the section
+		can be rendered by copying the source while it is not modified
+		@param token_list: a list of tokens the section was parsed from
+		@type token_list: L{SpecTokenList}
+		@param section: parsed section
+		@type section: L{SpecSection}
+		@param pointer: index of the first section token
+		@type pointer: number
+		@return: None
+		@rtype: None
+		'''
+		section.set_origin(token_list.get_source_span(pointer, token_list.get_pointer()))
+
+	def parse_section_steps(self, token_list, parent, allowed):
+		'''
+		Start parsing a section on the current position, sections nested in
+		the section are left to the caller, see L{SpecSectionParser.parse_steps}
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section
+		@type parent: L{SpecSection}
+		@param allowed: allowed sections to be parsed, section parsers
+		@type allowed: list of L{SpecSectionParser}
+		@return: tuple (section, steps) or (None, None) if no allowed section
+		was found; steps are None if the section has nothing nested
+		@rtype: tuple
+		'''
+		if parent is None and self.needed is not None:
+			section = self.skip_section(token_list, allowed)
+			if section is not None:
+				SpecDebug.debug("- skipped section '%s'" % section.get_section_type())
+				return section, None
+
+		for t in allowed:
+			steps = t.parse_steps(token_list, parent, allowed, self)
+			section = next(steps)
+			if section:
+				SpecDebug.debug("- adding parsed section '%s'" % type(section))
+				return section, steps
+
+		return None, None
+
+	def skip_section(self, token_list, allowed):
+		'''
+		Skip a section on the current position if it is not needed, see L{init}
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@param allowed: allowed sections to be parsed, section parsers
+		@type allowed: list of L{SpecSectionParser}
+		@return: skipped section or None if the section should be parsed
+		@rtype: L{SpecStRaw}
+		'''
+		for parser in self.get_section_parsers(token_list.touch()):
+			if parser not in allowed:
+				continue
+
+			section = parser.section_beginning(token_list)
+			if section is not None:
+				if issubclass(section, SpecStSection) and str(section) not in self.needed:
+					return parser.skip(token_list, section, self)
+				return None
+
+		return None
+
 	def parse_loop(self, token_list, parent, allowed):
 		'''
 		Main parse loop to get list of parsed sections
@@ -153,28 +340,100 @@ class SpecFileParser(SpecModelParser):
 		@rtype: L{SpecSection}
 		'''
 		ret = []
+		self.parse_loops(token_list, [], (parent, allowed, ret))
+		return ret
 
-		found = True
-		while found:
-			found = False
-			token = token_list.touch()
-			SpecDebug.debug("- parsing round: '%s'" % str(token))
-
-			if token.is_eof():
-				break
-
-			for t in allowed:
-				section = t.parse(token_list, parent, allowed, self)
-				if section:
-					found = True
-					SpecDebug.debug("- adding parsed section '%s'" % type(section))
-					ret.append(section)
-					break
+	def parse_nested(self, token_list, section, steps):
+		'''
+		Parse sections nested in a section, see L{parse_section_steps}
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@param section: section being parsed
+		@type section: L{SpecSection}
+		@param steps: steps of the section parser
+		@type steps: generator, see L{SpecSectionParser.parse_steps}
+		@return: None
+		@rtype: None
+		'''
+		request = self.parse_step(steps, None)
+		if request is not None:
+			self.parse_loops(token_list, [(section, steps, None, None)], request + ([],))
 
-			if not found:
-				SpecDebug.debug("- unparsed token '%s' on line %s" % (str(token), str(token.line)))
+	@staticmethod
+	def parse_step(steps, sections):
+		'''
+		Resume a section parser
+		@param steps: steps of the section parser
+		@type steps: generator, see L{SpecSectionParser.parse_steps}
+		@param sections: sections parsed in the last requested loop
+		@type sections: list of L{SpecSection}
+		@return: next loop requested as a tuple (parent, allowed) or None if
+		the section was parsed
+		@rtype: tuple
+		'''
+		try:
+			return steps.send(sections)
+		except StopIteration:
+			return None
 
-		return ret
+	def parse_loops(self, token_list, stack, loop):
+		'''
+		Parse loops of nested sections; sections which are being parsed are
+		kept on an explicit stack, so nesting of sections is not limited by
+		the Python stack
+		@param token_list: a list of tokens to be used
+		@type token_list: L{SpecTokenList}
+		@param stack: sections being parsed as tuples (section, steps, pointer,
+		loop the section belongs to); parsing stops when the loop is None
+		@type stack: list
+		@param loop: loop to be parsed as a tuple (parent, allowed, sections),
+		parsing stops when the loop ends and the stack is empty
+		@type loop: tuple
+		@return: None
+		@rtype: None
+		'''
+		try:
+			while True:
+				parent, allowed, sections = loop
+				token = token_list.touch()
+				SpecDebug.debug("- parsing round: '%s'" % str(token))
+
+				section = steps = None
+				if not token.is_eof():
+					pointer = token_list.get_pointer()
+					section, steps = self.parse_section_steps(token_list, parent, allowed)
+					if section is None:
+						SpecDebug.debug("- unparsed token '%s' on line %s" % (str(token), str(token.line)))
+
+				if section is None:
+					# loop ended, continue with the section it is nested in
+					if not stack:
+						return
+					section, steps, pointer, loop = stack.pop()
+					request = self.parse_step(steps, sections)
+				elif steps is not None:
+					request = self.parse_step(steps, None)
+				else:
+					request = None
+
+				if request is not None:
+					stack.append((section, steps, pointer, loop))
+					loop = request + ([],)
+					continue
+
+				if loop is None:
+					return
+
+				self.set_origin(token_list, section, pointer)
+				loop[2].append(section)
+				if loop[0] is None and self.spans is not None:
+					self.spans.append((section, loop[1] is self.PREAMBLE_MANIPULATORS, pointer))
+		except:
+			# let parsers of unfinished sections clean up, innermost first
+			exc = sys.exc_info()
+			while stack:
+				stack.pop()[1].close()
+			raise exc[0], exc[1], exc[2]
 
 	def parse_preamble(self):
 		'''
@@ -182,9 +441,7 @@ class SpecFileParser(SpecModelParser):
 		@return: parsed sections in preamble
 		@rtype: list of L{SpecSection}
 		'''
-		allowed = [ SpecIfParser, SpecDefinitionParser, SpecGlobalParser ]
-
-		ret = self.parse_loop(self.token_list, None, allowed)
+		ret = self.parse_loop(self.token_list, None, self.PREAMBLE_MANIPULATORS)
 		unparsed = self.token_list.touch()
 		SpecDebug.debug("-- preamble finished with token '%s' on line %d" % (str(unparsed), unparsed.line))
 		return ret
@@ -205,6 +462,9 @@ class SpecFileParser(SpecModelParser):
 		@rtype:
 		@raise SpecBadToken: when an unexpected token is reached
 		'''
+		if self.text is not None:
+			self.spans = []
+
 		self.get_model_writer().append_items(self.parse_preamble())
 		self.get_model_writer().append_items(self.parse_loop_section())
 
@@ -212,6 +472,179 @@ class SpecFileParser(SpecModelParser):
 		if not eof.is_eof():
 			raise SpecBadToken("Unexpected symbol '" + str(eof.token) + "' on line " + str(eof.line))
 
+	def reparse(self, offset, removed, inserted):
+		'''
+		Apply a change to the parsed text and update the model incrementally;
+		only tokens around the change are lexed again and only top-level
+		sections containing them are parsed again, other sections and their
+		tokens are kept
+		@param offset: offset of the change in the parsed text
+		@type offset: number
+		@param removed: number of removed characters
+		@type removed: number
+		@param inserted: inserted text
+		@type inserted: string
+		@return: None
+		@rtype: None
+		@raise SpecBadParam: if the change is out of the parsed text
+		@raise SpecNotImplemented: if the text was not parsed by L{parse} using
+		regex lexer without streaming
+		@raise SpecBadToken: when an unexpected token is reached, parser and
+		model are left untouched
+		'''
+		if self.spans is None:
+			raise SpecNotImplemented("Incremental parsing requires a text parsed using '%s' lexer without streaming"
+					% SpecTokenList.LEXER_REGEX)
+
+		text = self.text
+		if offset < 0 or removed < 0 or offset + removed > len(text):
+			raise SpecBadParam("Change out of the parsed text")
+
+		token_list = self.token_list
+		spans = self.spans
+		delta = len(inserted) - removed
+		new_text = text[:offset] + inserted + text[offset + removed:]
+
+		# a token ending just before the change can be merged with it, such
+		# as '\\' followed by an inserted new line
+		damaged = token_list.find_offset(max(offset - 2, 0))
+		k = max(bisect_right([span[2] for span in spans], damaged) - 1, 0)
+		# a section ends where the next one begins, which is checked by the
+		# first token of the next section
+		if k > 0 and spans[k][2] == damaged:
+			k -= 1
+		first = spans[k][2] if spans else 0
+		start = token_list.get_offset(first)
+
+		# lex until a token starts where an old token after the change starts;
+		# lexing does not depend on text before a token, so the rest is same
+		last = token_list.find_offset(offset + removed)
+		if token_list.get_offset(last) < offset + removed:
+			last += 1
+		end = None
+		for span in SpecLexer.tokenize(new_text, start):
+			while last < len(token_list) and token_list.get_offset(last) + delta < span[0]:
+				last += 1
+			if last < len(token_list) and token_list.get_offset(last) + delta == span[0]:
+				end = span[0]
+				break
+
+		if end is None: # changed up to EOF, EOF token is lexed again
+			last = len(token_list)
+			end = len(new_text)
+
+		changed = new_text[start:end]
+		line = token_list[first].line
+		table = SpecTokenTable(SpecFile(changed), line)
+		rows = len(table) if last == len(token_list) else len(table) - 1
+		tokens = token_list.splice(first, last, table, rows, delta)
+		shift = 0
+		if last < len(token_list):
+			shift = line + changed.count('\n') - token_list[last].line
+		tokens.shift_lines(first + rows, shift)
+
+		try:
+			spans = self.reparse_spans(tokens, spans, k, first, last, rows)
+		except:
+			tokens.shift_lines(first + rows, -shift)
+			raise
+
+		self.token_list = tokens
+		self.text = new_text
+		self.spans = spans
+		self.get_model_writer().set_sections([span[0] for span in spans])
+
+	def reparse_spans(self, tokens, spans, k, first, last, rows):
+		'''
+		Parse top-level sections of a changed token list again until
+		sections parsed before the change can be reused
+		@param tokens: changed token list
+		@type tokens: L{SpecTokenList}
+		@param spans: top-level sections before the change
+		@type spans: list of tuples (section, preamble, first token)
+		@param k: index of the first span to be parsed again
+		@type k: number
+		@param first: index of the first changed token
+		@type first: number
+		@param last: index of the first old token which was not changed
+		@type last: number
+		@param rows: number of tokens the changed tokens were replaced with
+		@type rows: number
+		@return: top-level sections after the change
+		@rtype: list of tuples (section, preamble, first token)
+		@raise SpecBadToken: when an unexpected token is reached
+		'''
+		count = rows - (last - first)
+		kept = {}
+		for i in xrange(k, len(spans)):
+			if spans[i][2] >= last:
+				kept[spans[i][2] + count] = i
+
+		# preamble ends where nothing allowed in preamble can be parsed
+		preamble = spans[k - 1][1] if k > 0 else True
+		allowed = copy.deepcopy(self.MANIPULATORS)
+		ret = spans[:k]
+		tokens.set_pointer(first)
+		while True:
+			pointer = tokens.get_pointer()
+			i = kept.get(pointer)
+			if i is not None and spans[i][1] == preamble:
+				ret.extend((section, p, index + count) for section, p, index in spans[i:])
+				break
+
+			token = tokens.touch()
+			if token.is_eof():
+				break
+
+			section = self.parse_section(tokens, None, self.PREAMBLE_MANIPULATORS if preamble else allowed)
+			if section is None:
+				if preamble:
+					preamble = False
+					continue
+				raise SpecBadToken("Unexpected symbol '" + str(token.token) + "' on line " + str(token.line))
+			ret.append((section, preamble, pointer))
+
+		return ret
+
+	def reparse_text(self, text):
+		'''
+		Update model incrementally after the parsed text was changed, see
+		L{reparse}; the change is the span between a common prefix and suffix
+		@param text: changed text
+		@type text: string
+		@return: None
+		@rtype: None
+		@raise SpecNotImplemented: if the text was not parsed by L{parse} using
+		regex lexer without streaming
+		@raise SpecBadToken: when an unexpected token is reached, parser and
+		model are left untouched
+		'''
+		if self.spans is None:
+			raise SpecNotImplemented("Incremental parsing requires a text parsed using '%s' lexer without streaming"
+					% SpecTokenList.LEXER_REGEX)
+
+		old = self.text
+		# slices are compared in bisection, so a character is not compared in Python
+		lo, hi = 0, min(len(old), len(text))
+		while lo < hi:
+			mid = (lo + hi + 1) // 2
+			if old[lo:mid] == text[lo:mid]:
+				lo = mid
+			else:
+				hi = mid - 1
+		prefix = lo
+
+		lo, hi = 0, min(len(old), len(text)) - prefix
+		while lo < hi:
+			mid = (lo + hi + 1) // 2
+			if old[len(old) - mid:len(old) - lo] == text[len(text) - mid:len(text) - lo]:
+				lo = mid
+			else:
+				hi = mid - 1
+		suffix = lo
+
+		self.reparse(prefix, len(old) - prefix - suffix, text[prefix:len(text) - suffix])
+
 class SpecSectionParser(object):
 	'''
 	Generic section parser
@@ -241,13 +674,25 @@ class SpecSectionParser(object):
 		@rtype: L{SpecSectionParser}
 		'''
 		token = token_list.touch()
+		if token.kind != SpecLexer.KIND_SECTION:
+			return None
 
+		token = str(token)
 		for o in SpecSectionParser.obj:
-			if str(token) == str(o):
+			if token == str(o):
 				return o
 
 		return None
 
+	@classmethod
+	def section_keys(cls):
+		'''
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ str(o) for o in SpecSectionParser.obj ]
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -270,8 +715,109 @@ class SpecSectionParser(object):
 		ret = section(parent)
 		ret.set_token_section(token_list.get())
 		#could be empty
-		ret.set_tokens(token_list.get_while_not(functools.partial(ctx.section_beginning_callback_no_if, ctx)))
+		cls.parse_tokens(ret, token_list, functools.partial(ctx.section_beginning_callback_no_if, ctx),
+				ctx, ctx.lazy)
+
+		return ret
+
+	@classmethod
+	def parse_steps(cls, token_list, parent, allowed, ctx):
+		'''
+		Parse section from token list step by step, sections nested in the
+		section are parsed by the caller; the first value generated is the
+		section or None if the section was not found, then (parent, allowed)
+		is generated for each list of nested sections to be parsed and the
+		list of parsed sections is sent back
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section or None
+		@type parent: L{SpecSection}
+		@param allowed: allowed sections within the section
+		@type allowed: list of L{SpecSection}
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@return: generator of the section and nested lists to be parsed
+		@rtype: generator
+		'''
+		yield cls.parse(token_list, parent, allowed, ctx)
+
+	@classmethod
+	def parse_nested(cls, token_list, parent, allowed, ctx):
+		'''
+		Parse section from token list using L{parse_steps}, used as L{parse}
+		by parsers of sections with nested sections
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section or None
+		@type parent: L{SpecSection}
+		@param allowed: allowed sections within the section
+		@type allowed: list of L{SpecSection}
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@return: parsed section
+		@rtype: L{SpecSection}
+		'''
+		steps = cls.parse_steps(token_list, parent, allowed, ctx)
+		section = next(steps)
+		if section:
+			ctx.parse_nested(token_list, section, steps)
+		return section
+
+	@staticmethod
+	def parse_tokens(section, token_list, callback, ctx, lazy):
+		'''
+		Parse section tokens up to a section boundary
+		@param section: section to set tokens to
+		@type section: L{SpecStSection}
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param callback: predicate which is True on a section boundary
+		@type callback: func(L{SpecTokenList}) -> Boolean
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@param lazy: if True, tokens are kept as a range until accessed
+		@type lazy: Boolean
+		@return: None
+		@rtype: None
+		'''
+		if lazy:
+			start = token_list.get_pointer()
+			token_list.skip_while_not(callback, ctx.boundary_kinds)
+			section.set_tokens_span(token_list, start, token_list.get_pointer())
+		else:
+			section.set_tokens(token_list.get_while_not(callback, ctx.boundary_kinds))
 
+	@staticmethod
+	def skip_boundary(ctx, token_list):
+		'''
+		Check whether next token ends a skipped section, see L{skip}
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@param token_list: token list to use
+		@type token_list: L{SpecTokenList}
+		@return: True if the section ends on the next token
+		@rtype: Boolean
+		'''
+		return ctx.section_beginning_no_if(token_list) is not None
+
+	@classmethod
+	def skip(cls, token_list, section, ctx):
+		'''
+		Skip a section without parsing it, the section ends where
+		L{parse} would stop
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param section: type of the section to be skipped
+		@type section: __class__
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@return: skipped section
+		@rtype: L{SpecStRaw}
+		'''
+		ret = SpecStRaw(None, section)
+		ret.set_token_section(token_list.get())
+		cls.parse_tokens(ret, token_list, functools.partial(cls.skip_boundary, ctx),
+				ctx, not ctx.stream)
 		return ret
 
 class SpecExpressionParser(SpecSectionParser):
@@ -291,6 +837,15 @@ class SpecExpressionParser(SpecSectionParser):
 		'''
 		raise SpecNotImplemented("Spec expression has no beginning")
 
+	@classmethod
+	def section_keys(cls):
+		'''
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ ]
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -313,11 +868,7 @@ class SpecExpressionParser(SpecSectionParser):
 		tokens.token_list_append(token_list.get())
 
 		while True:
-			tkn = token_list.touch()
-			if str(tkn) == '>=' or str(tkn) == '<=' \
-					or str(tkn) == '<' or str(tkn) == '>' \
-					or str(tkn) == '!=' or str(tkn) == '==' \
-					or str(tkn) == '&&' or str(tkn) == '||':
+			if token_list.touch().kind == SpecLexer.KIND_OPERATOR:
 				tokens.token_list_append(token_list.get())
 				if token_list.touch().is_eof():
 					raise SpecBadToken("Unexpected EOF, expected expression termination")
@@ -345,11 +896,20 @@ class SpecIfParser(SpecSectionParser):
 		@rtype: L{SpecSectionParser}
 		'''
 		token = token_list.touch()
-		if str(token) == '%if' or str(token) == '%ifarch':
+		if token.kind == SpecLexer.KIND_CONDITIONAL and (str(token) == '%if' or str(token) == '%ifarch'):
 			return SpecIfParser.obj
 		else:
 			return None
 
+	@classmethod
+	def section_keys(cls):
+		'''
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ '%if', '%ifarch' ]
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -366,28 +926,51 @@ class SpecIfParser(SpecSectionParser):
 		@rtype: L{SpecSection}
 		@raises SpecBadToken: if an unexpected token is reached
 		'''
+		return cls.parse_nested(token_list, parent, allowed, ctx)
+
+	@classmethod
+	def parse_steps(cls, token_list, parent, allowed, ctx):
+		'''
+		Parse section from token list step by step, see
+		L{SpecSectionParser.parse_steps}
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section or None
+		@type parent: L{SpecSection}
+		@param allowed: allowed sections within the section
+		@type allowed: list of L{SpecSection}
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@return: generator of the section and its branches to be parsed
+		@rtype: generator
+		@raises SpecBadToken: if an unexpected token is reached
+		'''
 		if not cls.section_beginning(token_list):
-			return None
+			yield None
+			return
 
-		pointer = token_list.get_pointer()
+		pointer = token_list.pin()
+		try:
+			stif = SpecIfParser.obj(parent)
+			stif.set_if_token(token_list.get())
+			stif.set_expr(SpecExpressionParser.parse(token_list, parent, allowed, ctx))
+			yield stif
 
-		stif = SpecIfParser.obj(parent)
-		stif.set_if_token(token_list.get())
-		stif.set_expr(SpecExpressionParser.parse(token_list, parent, allowed, ctx))
-		stif.set_true_branch(ctx.parse_loop(token_list, stif, allowed))
-		token = token_list.touch()
-		if str(token) == '%else':
-			stif.set_else_token(token_list.get())
-			stif.set_false_branch(ctx.parse_loop(token_list, stif, allowed))
+			stif.set_true_branch((yield stif, allowed))
 			token = token_list.touch()
+			if token.kind == SpecLexer.KIND_CONDITIONAL and str(token) == '%else':
+				stif.set_else_token(token_list.get())
+				stif.set_false_branch((yield stif, allowed))
+				token = token_list.touch()
 
-		if str(token) != '%endif':
-			token_list.set_pointer(pointer)
-			raise SpecBadToken("Unexpected token '%s' on line '%s', expected 'endif'"
-					% (str(token), str(token.get_line())))
+			if token.kind != SpecLexer.KIND_CONDITIONAL or str(token) != '%endif':
+				token_list.set_pointer(pointer)
+				raise SpecBadToken("Unexpected token '%s' on line '%s', expected 'endif'"
+						% (str(token), str(token.get_line())))
 
-		stif.set_endif_token(token_list.get())
-		return stif
+			stif.set_endif_token(token_list.get())
+		finally:
+			token_list.unpin(pointer)
 
 class SpecDefinitionParser(SpecSectionParser):
 	'''
@@ -404,36 +987,20 @@ class SpecDefinitionParser(SpecSectionParser):
 		@return: None or a parser to be used to parse the section
 		@rtype: L{SpecSectionParser}
 		'''
-		token = token_list.touch()
-
-		if str(token) in [ 'Name:', 'Version:', 'Release:', 'Summary:', 'License:',
-				'URL:', 'ExclusiveArch:', 'BuildRequires:', 'Provides:', 'Requires:',
-				'Source:', 'BuildArch:', 'Group:', 'Url:', 'Conflicts:', 'Obsoletes:',
-				'BuildRoot:' ]:
+		if token_list.touch().kind == SpecLexer.KIND_DEFINITION:
 			return SpecDefinitionParser.obj
 
-		p = re.compile('BuildRequires(.*):') # This could be adjusted later on
-		if p.match(str(token)):
-			return SpecDefinitionParser.obj
-
-		p = re.compile('Requires(.*):') # This could be adjusted later on
-		if p.match(str(token)):
-			return SpecDefinitionParser.obj
-
-		p = re.compile('Provides(.*):') # This could be adjusted later on
-		if p.match(str(token)):
-			return SpecDefinitionParser.obj
-
-		p = re.compile('Source[0-9]+:')
-		if p.match(str(token)):
-				return SpecDefinitionParser.obj
-
-		p = re.compile('Patch[0-9]+:')
-		if p.match(str(token)):
-				return SpecDefinitionParser.obj
-
 		return None
 
+	@classmethod
+	def section_keys(cls):
+		'''
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ SpecLexer.KIND_DEFINITION ]
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -476,11 +1043,20 @@ class SpecGlobalParser(SpecSectionParser):
 		@rtype: L{SpecSectionParser}
 		'''
 		token = token_list.touch()
-		if str(token) == str(SpecGlobalParser.obj):
+		if token.kind == SpecLexer.KIND_SECTION and str(token) == str(SpecGlobalParser.obj):
 			return SpecGlobalParser.obj
 		else:
 			return None
 
+	@classmethod
+	def section_keys(cls):
+		'''
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ str(SpecGlobalParser.obj) ]
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -524,11 +1100,20 @@ class SpecDefineParser(SpecSectionParser):
 		@rtype: L{SpecSectionParser}
 		'''
 		token = token_list.touch()
-		if str(token) == str(SpecDefineParser.obj):
+		if token.kind == SpecLexer.KIND_SECTION and str(token) == str(SpecDefineParser.obj):
 			return SpecGlobalParser.obj
 		else:
 			return None
 
+	@classmethod
+	def section_keys(cls):
+		'''
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ str(SpecDefineParser.obj) ]
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -565,8 +1150,11 @@ class SpecBuildParser(SpecSectionParser):
 class SpecChangelogParser(SpecSectionParser):
 	'''
 	Parse %changelog section
+	@cvar DATES_SIZE: number of parsed dates kept, see L{parse_date}
 	'''
 	obj = SpecStChangelog
+	DATES_SIZE = 1024
+	dates = OrderedDict() # parsed dates by their tokens, least recently used first
 
 	@staticmethod
 	def section_beginning(token_list):
@@ -578,79 +1166,209 @@ class SpecChangelogParser(SpecSectionParser):
 		@rtype: L{SpecSectionParser}
 		'''
 		token = token_list.touch()
-		if str(token) == str(SpecChangelogParser.obj):
+		if token.kind == SpecLexer.KIND_SECTION and str(token) == str(SpecChangelogParser.obj):
 			return SpecChangelogParser.obj
 
 		return None
 
 	@classmethod
-	def parse_entry(cls, token_list, parent, ctx):
+	def section_keys(cls):
 		'''
-		Parse a changelog entry
-		@param token_list: a token list to be used
-		@type token_list: L{SpecTokenList}
-		@param parent: parent section or None
-		@type parent: L{SpecSection}
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ str(SpecChangelogParser.obj) ]
+
+	@staticmethod
+	def skip_boundary(ctx, token_list):
+		'''
+		Check whether next token ends a skipped section, see L{skip}; section
+		keywords in entries do not end a changelog unless they begin a line
 		@param ctx: parsing context
 		@type ctx: L{SpecModelParser}
-		@return: parsed section
-		@rtype: L{SpecSection}
-
+		@param token_list: token list to use
+		@type token_list: L{SpecTokenList}
+		@return: True if the section ends on the next token
+		@rtype: Boolean
 		'''
-		def parse_date(date):
-			s = str(date[0]) + ' ' + str(date[1]) + ' ' + str(date[2]) + ' ' + str(date[3])
-			return datetime.datetime.strptime(s, '%a %b %d %Y')
+		if ctx.section_beginning(token_list) is None:
+			return False
+		return not token_list.touch().same_line(token_list[token_list.get_pointer() - 1])
 
-		def changelog_entry_beginning_callback(obj, token_list):
-			# is there some section?
-			if obj.section_beginning_callback(obj, token_list):
-				# changelog message can consist of keyword like:
-				# - Add missing Requires: golang(github.com/gorilla/mux) to devel
-				tkn = token_list.touch()
-				if not tkn.same_line(token_list[token_list.get_pointer() - 1]):
-					return True
+	@classmethod
+	def parse_date(cls, date):
+		'''
+		Parse a date of a changelog entry, L{DATES_SIZE} recently used dates
+		are memoized
+		@param date: date tokens, e.g. ['Wed', 'Nov', '25', '2015']
+		@type date: L{SpecTokenList}
+		@return: parsed date
+		@rtype: datetime
+		'''
+		s = str(date[0]) + ' ' + str(date[1]) + ' ' + str(date[2]) + ' ' + str(date[3])
+		ret = cls.dates.pop(s, None)
+		if ret is None:
+			ret = datetime.datetime.strptime(s, '%a %b %d %Y')
+			if len(cls.dates) >= cls.DATES_SIZE:
+				cls.dates.popitem(last = False)
+		cls.dates[s] = ret
+		return ret
 
-			# or is there another changelog entry?
-			return str(token_list.touch()) == '*'
+	@staticmethod
+	def entry_boundary(ctx, token_list):
+		'''
+		Check whether next token ends a changelog entry
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@param token_list: token list to use
+		@type token_list: L{SpecTokenList}
+		@return: True if the entry ends on the next token
+		@rtype: Boolean
+		'''
+		# is there some section?
+		if ctx.section_beginning(token_list):
+			# changelog message can consist of keyword like:
+			# - Add missing Requires: golang(github.com/gorilla/mux) to devel
+			tkn = token_list.touch()
+			if not tkn.same_line(token_list[token_list.get_pointer() - 1]):
+				return True
 
-		entry = SpecChangelogParser.obj.SpecStChangelogEntry(parent)
+		# or is there another changelog entry?
+		return token_list.touch().kind == SpecLexer.KIND_STAR
 
+	@staticmethod
+	def get_entry_header(token_list):
+		'''
+		Get tokens of a changelog entry up to its message
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@return: tuple (star, date, user, user email, version delimiter or
+		None, version)
+		@rtype: tuple
+		@raise SpecBadToken: if an entry does not start with '*'
+		'''
 		star = token_list.get()
-		if str(star) != '*':
+		if star.kind != SpecLexer.KIND_STAR:
 			token_list.unget()
 			raise SpecBadToken("Expected token '*', got '%s'" % star)
-		entry.set_star(star)
 
 		date = SpecTokenList()
 		for _ in xrange(0, 4):
 			date.token_list_append(token_list.get())
-		entry.set_date(date)
-
-		date_parsed = parse_date(date)
-		entry.set_date_parsed(date_parsed)
 
 		user = SpecTokenList()
 		while not str(token_list.touch()).startswith('<'):
 			user.token_list_append(token_list.get())
-		entry.set_user(user)
 
 		user_email = token_list.get()
-		entry.set_user_email(user_email)
 
 		# version delim is optional here, if not stated, let's skip it
+		version_delim = None
 		if str(token_list.touch()) == '-':
-			entry.set_version_delim(token_list.get())
+			version_delim = token_list.get()
 
 		version = token_list.get()
+		return star, date, user, user_email, version_delim, version
+
+	@classmethod
+	def parse_entry_header(cls, entry, token_list):
+		'''
+		Parse a changelog entry up to its message
+		@param entry: entry to be filled
+		@type entry: L{SpecStChangelog.SpecStChangelogEntry}
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@return: None
+		@rtype: None
+		@raise SpecBadToken: if an entry does not start with '*'
+		'''
+		star, date, user, user_email, version_delim, version = cls.get_entry_header(token_list)
+		entry.set_star(star)
+		entry.set_date(date)
+		entry.set_date_parsed(cls.parse_date(date))
+		entry.set_user(user)
+		entry.set_user_email(user_email)
+		if version_delim is not None:
+			entry.set_version_delim(version_delim)
 		entry.set_version(version)
 
-		entry.set_message(token_list.get_while_not(
-									functools.partial(changelog_entry_beginning_callback, ctx)
-									)
-								)
+	@classmethod
+	def parse_entry(cls, token_list, parent, ctx):
+		'''
+		Parse a changelog entry
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section or None
+		@type parent: L{SpecSection}
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@return: parsed section
+		@rtype: L{SpecSection}
+
+		'''
+		entry = SpecChangelogParser.obj.SpecStChangelogEntry(parent)
+		cls.parse_entry_header(entry, token_list)
+
+		kinds = None
+		if ctx.boundary_kinds is not None:
+			kinds = ctx.boundary_kinds | set([SpecLexer.KIND_STAR])
+		entry.set_message(token_list.get_while_not(functools.partial(cls.entry_boundary, ctx), kinds))
+
+		return entry
+
+	@classmethod
+	def skip_entry(cls, token_list, parent, ctx):
+		'''
+		Find end of a changelog entry and keep the entry unparsed until its
+		fields are accessed, see L{parse_entry_span}
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section or None
+		@type parent: L{SpecSection}
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@return: entry kept as a range of tokens
+		@rtype: L{SpecStChangelog.SpecStChangelogEntry}
+		'''
+		entry = SpecChangelogParser.obj.SpecStChangelogEntry(parent)
+		start = token_list.get_pointer()
+		token_list.get() # star
+
+		kinds = None
+		if ctx.boundary_kinds is not None:
+			kinds = ctx.boundary_kinds | set([SpecLexer.KIND_STAR])
+		token_list.skip_while_not(functools.partial(cls.entry_boundary, ctx), kinds)
+		entry.set_tokens_span(token_list, start, token_list.get_pointer(), cls)
 
 		return entry
 
+	@classmethod
+	def parse_entry_span(cls, entry, token_list, start, end):
+		'''
+		Parse a changelog entry kept as a range of tokens, see L{skip_entry}
+		@param entry: entry to be filled
+		@type entry: L{SpecStChangelog.SpecStChangelogEntry}
+		@param token_list: a token list with entry tokens
+		@type token_list: L{SpecTokenList}
+		@param start: index of the first entry token
+		@type start: number
+		@param end: index of the first token after the entry
+		@type end: number
+		@return: None
+		@rtype: None
+		@raise SpecBadToken: if the entry header is not complete
+		'''
+		pointer = token_list.get_pointer()
+		token_list.set_pointer(start)
+		try:
+			cls.parse_entry_header(entry, token_list)
+			if token_list.get_pointer() > end:
+				raise SpecBadToken("Unexpected end of changelog entry on line %d" % token_list[start].line)
+			entry.set_message(token_list.get_range(token_list.get_pointer(), end))
+		finally:
+			token_list.set_pointer(pointer)
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -672,8 +1390,12 @@ class SpecChangelogParser(SpecSectionParser):
 		ret = SpecChangelogParser.obj(parent)
 		ret.set_token_section(token_list.get())
 
-		while str(token_list.touch()) == '*':
-			entry = cls.parse_entry(token_list, ret, ctx)
+		# entries of a streamed token list cannot be parsed later
+		while token_list.touch().kind == SpecLexer.KIND_STAR:
+			if ctx.stream:
+				entry = cls.parse_entry(token_list, ret, ctx)
+			else:
+				entry = cls.skip_entry(token_list, ret, ctx)
 			if entry:
 				ret.append_entry(entry)
 
@@ -726,11 +1448,37 @@ class SpecPackageParser(SpecSectionParser):
 		'''
 		token = token_list.touch()
 
-		if str(token) == str(SpecPackageParser.obj):
+		if token.kind == SpecLexer.KIND_SECTION and str(token) == str(SpecPackageParser.obj):
 			return SpecPackageParser.obj
 		else:
 			return None
 
+	@classmethod
+	def section_keys(cls):
+		'''
+		Get keys of tokens which can begin a section, see L{section_beginning}
+		@return: section keywords or token kinds, see L{SpecLexer}
+		@rtype: list
+		'''
+		return [ str(SpecPackageParser.obj) ]
+
+	@staticmethod
+	def skip_boundary(ctx, token_list):
+		'''
+		Check whether next token ends a skipped section, see L{skip}; package
+		definitions and their values are a part of the section
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@param token_list: token list to use
+		@type token_list: L{SpecTokenList}
+		@return: True if the section ends on the next token
+		@rtype: Boolean
+		'''
+		parser = ctx.section_beginning_no_if(token_list)
+		if parser is None or parser is SpecDefinitionParser:
+			return False
+		return not token_list.touch().same_line(token_list[token_list.get_pointer() - 1])
+
 	@classmethod
 	def parse(cls, token_list, parent, allowed, ctx):
 		'''
@@ -746,16 +1494,35 @@ class SpecPackageParser(SpecSectionParser):
 		@return: parsed section
 		@rtype: L{SpecSection}
 		'''
+		return cls.parse_nested(token_list, parent, allowed, ctx)
+
+	@classmethod
+	def parse_steps(cls, token_list, parent, allowed, ctx):
+		'''
+		Parse section from token list step by step, see
+		L{SpecSectionParser.parse_steps}
+		@param token_list: a token list to be used
+		@type token_list: L{SpecTokenList}
+		@param parent: parent section or None
+		@type parent: L{SpecSection}
+		@param allowed: allowed sections within the section
+		@type allowed: list of L{SpecSection}
+		@param ctx: parsing context
+		@type ctx: L{SpecModelParser}
+		@return: generator of the section and its definitions to be parsed
+		@rtype: generator
+		'''
 		if not cls.section_beginning(token_list):
-			return None
+			yield None
+			return
 
 		section = SpecPackageParser.obj(parent)
 		section.set_token_section(token_list.get())
 		if section.get_token_section().same_line(token_list.touch()):
 			section.set_package(token_list.get())
-		section.set_defs(ctx.parse_loop(token_list, section, [SpecIfParser, SpecDefinitionParser]))
+		yield section
 
-		return section
+		section.set_defs((yield section, [SpecIfParser, SpecDefinitionParser]))
 
 class SpecPrepParser(SpecSectionParser):
 	'''
@@ -25,20 +25,23 @@ A spec model rendering
 @license: GPL 2.0
 '''
 
-import re
 import sys
 import cStringIO
 from specDebug import SpecDebug
 from specError import SpecNotFound, SpecNotImplemented
 from specModelRenderer import SpecModelRenderer
+from specModel import SpecModel
 from specSection import *
 
 class SpecFileRenderer(SpecModelRenderer):
 	'''
-	A spec renderer
+	A spec renderer; sections which were not modified since parsed are
+	rendered by copying their source, set passthrough to False to render
+	all sections by registered renderers
 	'''
 	def __init__(self, reader):
 		self.set_model_reader(reader)
+		self.passthrough = True
 		self.MANIPULATORS = [
 				SpecIfRenderer,
 				SpecDefinitionRenderer,
@@ -64,7 +67,8 @@ class SpecFileRenderer(SpecModelRenderer):
 				SpecTriggerpreinRenderer,
 				SpecTriggerunRenderer,
 				SpecTriggerpostunRenderer,
-				SpecVerifyscriptRenderer
+				SpecVerifyscriptRenderer,
+				SpecRawRenderer
 			]
 
 	def render_list(self, l, f):
@@ -77,8 +81,7 @@ class SpecFileRenderer(SpecModelRenderer):
 		@return: None
 		@rtype: None
 		'''
-		for section in l:
-			self.render_section(section, f)
+		self.render_nested([l], f)
 
 	def render(self, f):
 		'''
@@ -101,15 +104,75 @@ class SpecFileRenderer(SpecModelRenderer):
 		@rtype: None
 		@raise SpecNotImplemented: if renderer for the section is not registered
 		'''
+		self.render_nested([[s]], f)
+
+	def render_section_steps(self, s, f):
+		'''
+		Render a section step by step, see L{SpecSectionRenderer.render_steps}
+		@param s: a section to be rendered
+		@type s: L{SpecSection}
+		@param f: a file to render to
+		@type f: file
+		@return: generator of lists of nested sections to be rendered
+		@rtype: generator
+		@raise SpecNotImplemented: if renderer for the section is not registered
+		'''
 		found = False
 		for renderer in self.MANIPULATORS:
 			if issubclass(s.__class__, renderer.obj):
 				found = True
 				SpecDebug.debug("- rendering section '%s'" % str(s))
-				renderer(s).render(f, self)
+				for sections in renderer(s).render_steps(f, self):
+					yield sections
 		if not found:
 			raise SpecNotImplemented("Not implemented renderer")
 
+	def render_nested(self, lists, f):
+		'''
+		Render lists of sections; sections which are being rendered are kept
+		on an explicit stack, so nesting of sections is not limited by the
+		Python stack. Sources of adjacent sections which were not modified
+		are written at once
+		@param lists: lists of sections to be rendered
+		@type lists: iterable of lists of L{SpecSection}
+		@param f: a file to render to
+		@type f: file
+		@return: None
+		@rtype: None
+		@raise SpecNotImplemented: if renderer for a section is not registered
+		'''
+		# tuples (steps producing lists of sections, the current list)
+		stack = [ (iter(lists), iter(())) ]
+		pending = None # source span to be written
+		while stack:
+			steps, sections = stack[-1]
+			for section in sections:
+				origin = section.get_origin() if self.passthrough else None
+				if origin is None:
+					if pending is not None:
+						pending[0].write_span(f, pending[1], pending[2])
+						pending = None
+					stack.append((self.render_section_steps(section, f), iter(())))
+					break
+				if pending is not None and pending[0] is origin[0] and pending[2] == origin[1]:
+					pending = (pending[0], pending[1], origin[2])
+				else:
+					if pending is not None:
+						pending[0].write_span(f, pending[1], pending[2])
+					pending = origin
+			else:
+				# the list was rendered, steps write what follows it
+				if pending is not None:
+					pending[0].write_span(f, pending[1], pending[2])
+					pending = None
+				try:
+					stack[-1] = (steps, iter(next(steps)))
+				except StopIteration:
+					stack.pop()
+
+		if pending is not None:
+			pending[0].write_span(f, pending[1], pending[2])
+
 	def find_section_print(self, section_type, f = sys.stdout, verbose = True):
 		'''
 		Find a section of a type and print/render it
@@ -136,10 +199,11 @@ class SpecFileRenderer(SpecModelRenderer):
 	def print_definitions(self, defs, definition, packages, f):
 		'''
 		Find a definition and print/render it
-		@param defs: definitions to print from
+		@param defs: definitions to print from or None to look up definitions
+		in the definition index, see L{SpecModel.find_definitions}
 		@type defs: list of L{SpecSection}
-		@param definition: definition to be printed
-		@type definition: re
+		@param definition: definition to be printed, e.g. 'Requires:'
+		@type definition: string
 		@param packages: packages from definitions should be printed
 		@type packages: list of strings
 		@param f: a file to render to
@@ -147,20 +211,26 @@ class SpecFileRenderer(SpecModelRenderer):
 		@return: None
 		@rtype: None
 		'''
+		if defs is None:
+			defs = self.get_model_reader().find_definitions(definition, packages)
+		else:
+			tag = SpecModel.normalize_tag(definition)
+			defs = [ d for d in defs if SpecModel.normalize_tag(d.name) == tag ]
+
+		# definitions are only shown, getters would mark them as modified
 		for d in defs:
-			if definition.match(str(d.name)):
-				pkg = d.get_package()
-				if pkg:
-					pkg = pkg.get_package()
-				if str(pkg) in packages or (pkg is None and '-' in packages) or '*' in packages:
-					if pkg is None:
-						f.write('-:')
-					else:
-						pkg.write(f, raw = True)
-						f.write(':') # add delim since raw
-
-					d.get_value().write(f, raw = True)
-					f.write('\n') # Add delim since raw token is printed
+			pkg = d.get_package()
+			if pkg:
+				pkg = pkg.pkg
+			if str(pkg) in packages or (pkg is None and '-' in packages) or '*' in packages:
+				if pkg is None:
+					f.write('-:')
+				else:
+					pkg.write(f, raw = True)
+					f.write(':') # add delim since raw
+
+				d.value.write(f, raw = True)
+				f.write('\n') # Add delim since raw token is printed
 
 	def provides_show(self, packages, f = sys.stdout):
 		'''
@@ -172,8 +242,7 @@ class SpecFileRenderer(SpecModelRenderer):
 		@return: None
 		@rtype: None
 		'''
-		defs = self.get_model_reader().find_definitions_all()
-		self.print_definitions(defs, re.compile('Provides:'), packages, f)
+		self.print_definitions(None, 'Provides:', packages, f)
 
 	def requires_show(self, packages, f = sys.stdout):
 		'''
@@ -185,8 +254,7 @@ class SpecFileRenderer(SpecModelRenderer):
 		@return: None
 		@rtype: None
 		'''
-		defs = self.get_model_reader().find_definitions_all()
-		self.print_definitions(defs, re.compile('Requires:'), packages, f)
+		self.print_definitions(None, 'Requires:', packages, f)
 
 	def buildrequires_show(self, packages, f = sys.stdout):
 		'''
@@ -198,8 +266,7 @@ class SpecFileRenderer(SpecModelRenderer):
 		@return: None
 		@rtype: None
 		'''
-		defs = self.get_model_reader().find_definitions_all()
-		self.print_definitions(defs, re.compile('BuildRequires:'), packages, f)
+		self.print_definitions(None, 'BuildRequires:', packages, f)
 
 	def changelog_show(self, f = sys.stdout):
 		'''
@@ -433,7 +500,26 @@ class SpecSectionRenderer(object):
 		@rtype: None
 		'''
 		self.section.get_token_section().write(f)
-		self.section.get_tokens().write(f)
+		span = self.section.get_source_span()
+		if span is not None: # not accessed, straight from the source
+			span[0].write_span(f, span[1], span[2])
+		else:
+			self.section.get_tokens().write(f)
+
+	def render_steps(self, f, ctx):
+		'''
+		Render section step by step, renderers of sections with nested
+		sections generate lists of nested sections to be rendered by ctx in
+		between
+		@param f: a file to render to
+		@type f: file
+		@param ctx: a rendering context
+		@type ctx: L{SpecModelRenderer}
+		@return: lists of nested sections to be rendered
+		@rtype: iterable
+		'''
+		self.render(f, ctx)
+		return []
 
 	def raw_string(self, ctx):
 		'''
@@ -496,12 +582,24 @@ class SpecIfRenderer(SpecSectionRenderer):
 		@return: None
 		@rtype: None
 		'''
+		ctx.render_nested(self.render_steps(f, ctx), f)
+
+	def render_steps(self, f, ctx):
+		'''
+		Render section step by step, see L{SpecSectionRenderer.render_steps}
+		@param f: a file to render to
+		@type f: file
+		@param ctx: a rendering context
+		@type ctx: L{SpecModelRenderer}
+		@return: generator of branches to be rendered
+		@rtype: generator
+		'''
 		self.section.get_if_token().write(f)
 		SpecExpressionRenderer(self.section.get_expr()).render(f, ctx)
-		ctx.render_list(self.section.get_true_branch(), f)
+		yield self.section.get_true_branch()
 		if self.section.get_else_token():
 			self.section.get_else_token().write(f)
-			ctx.render_list(self.section.get_false_branch(), f)
+			yield self.section.get_false_branch()
 		self.section.get_endif_token().write(f)
 
 class SpecGlobalRenderer(SpecSectionRenderer):
@@ -573,14 +671,37 @@ class SpecChangelogRenderer(SpecSectionRenderer):
 		self.section.get_token_section().write(f)
 
 		for entry in self.section.get_entries():
-			entry.get_star().write(f)
-			entry.get_date().write(f)
-			entry.get_user().write(f)
-			entry.get_user_email().write(f)
-			if entry.get_version_delim():
-				entry.get_version_delim().write(f)
-			entry.get_version().write(f)
-			entry.get_message().write(f)
+			self.render_entry(entry, f)
+
+	@staticmethod
+	def render_entry(entry, f):
+		'''
+		Render a changelog entry
+		@param entry: entry to be rendered
+		@type entry: L{SpecStChangelog.SpecStChangelogEntry}
+		@param f: a file to render to
+		@type f: file
+		@return: None
+		@rtype: None
+		'''
+		span = entry.get_source_span()
+		if span is not None: # not accessed, straight from the source
+			span[0].write_span(f, span[1], span[2])
+			return
+
+		tokens = entry.get_tokens()
+		if tokens is not None: # not accessed, tokens were changed around
+			tokens.write(f)
+			return
+
+		entry.get_star().write(f)
+		entry.get_date().write(f)
+		entry.get_user().write(f)
+		entry.get_user_email().write(f)
+		if entry.get_version_delim():
+			entry.get_version_delim().write(f)
+		entry.get_version().write(f)
+		entry.get_message().write(f)
 
 class SpecCheckRenderer(SpecSectionRenderer):
 	'''
@@ -634,10 +755,22 @@ class SpecPackageRenderer(SpecSectionRenderer):
 		@return: None
 		@rtype: None
 		'''
+		ctx.render_nested(self.render_steps(f, ctx), f)
+
+	def render_steps(self, f, ctx):
+		'''
+		Render section step by step, see L{SpecSectionRenderer.render_steps}
+		@param f: a file to render to
+		@type f: file
+		@param ctx: a rendering context
+		@type ctx: L{SpecModelRenderer}
+		@return: generator of definitions to be rendered
+		@rtype: generator
+		'''
 		self.section.get_token_section().write(f)
 		if self.section.get_package():
 			self.section.get_package().write(f)
-		ctx.render_list(self.section.get_defs(), f)
+		yield self.section.get_defs()
 
 class SpecPrepRenderer(SpecSectionRenderer):
 	'''
@@ -750,3 +883,9 @@ class SpecVerifyscriptRenderer(SpecSectionRenderer):
 	'''
 	obj = SpecStVerifyscript
 
+class SpecRawRenderer(SpecSectionRenderer):
+	'''
+	Renderer of sections which were not parsed
+	@cvar obj: sections rendered by this renderer
+	'''
+	obj = SpecStRaw
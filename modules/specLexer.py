@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# ####################################################################
+# specker-lib - spec file manipulation library
+# Copyright (C) 2015  Fridolin Pokorny, fpokorny@redhat.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# ####################################################################
+'''
+A bulk spec file lexer based on precompiled patterns
+@author: Fridolin Pokorny
+@contact: fpokorny@redhat.com
+@organization: Red Hat Inc.
+@license: GPL 2.0
+'''
+
+import re
+from specError import SpecNotImplemented
+
+class SpecLexer(object):
+	'''
+	A bulk lexer splitting a whole buffer into token spans; it follows
+	the same rules as the char-by-char L{SpecToken} constructor
+	@cvar PREPEND: whitespaces, escaped newlines and comments before a token
+	@cvar TOKEN: token body
+	@cvar APPEND: whitespaces, escaped newlines and comments after a token;
+	a comment is a part of append only if it is not placed on a new line
+	@cvar SPAN: whole token, token body is empty only for EOF token
+	@cvar KIND_WORD: token kind of a plain word
+	@cvar KIND_EOF: token kind of EOF token
+	@cvar KIND_SECTION: token kind of a section keyword, e.g. '%build'
+	@cvar KIND_DEFINITION: token kind of a definition tag, e.g. 'Requires:'
+	@cvar KIND_CONDITIONAL: token kind of a conditional, e.g. '%if'
+	@cvar KIND_OPERATOR: token kind of an expression operator, e.g. '>='
+	@cvar KIND_STAR: token kind of a changelog star
+	@cvar KEYWORDS: keywords (interned) and their token kinds
+	@cvar DEFINITION: definition tags
+	'''
+	PREPEND = r'(?:[ \t\n]+|\\\n|#[^\n]*)*'
+	TOKEN = r'(?:[^ \t\n#\\]+|\\(?!\n))*'
+	APPEND = r'(?:#[^\n]*)?(?:[ \t]+(?:#[^\n]*)?|\n|\\\n)*'
+	SPAN = re.compile('(' + PREPEND + ')(' + TOKEN + ')' + APPEND)
+
+	KIND_WORD = 0
+	KIND_EOF = 1
+	KIND_SECTION = 2
+	KIND_DEFINITION = 3
+	KIND_CONDITIONAL = 4
+	KIND_OPERATOR = 5
+	KIND_STAR = 6
+
+	KEYWORDS = dict((intern(keyword), kind) for keyword, kind in [
+			('%build', KIND_SECTION), ('%changelog', KIND_SECTION), ('%check', KIND_SECTION),
+			('%clean', KIND_SECTION), ('%define', KIND_SECTION), ('%description', KIND_SECTION),
+			('%files', KIND_SECTION), ('%global', KIND_SECTION), ('%install', KIND_SECTION),
+			('%package', KIND_SECTION), ('%prep', KIND_SECTION), ('%pre', KIND_SECTION),
+			('%post', KIND_SECTION), ('%preun', KIND_SECTION), ('%postun', KIND_SECTION),
+			('%pretrans', KIND_SECTION), ('%posttrans', KIND_SECTION), ('%trigger', KIND_SECTION),
+			('%triggerin', KIND_SECTION), ('%triggerprein', KIND_SECTION), ('%triggerun', KIND_SECTION),
+			('%triggerpreun', KIND_SECTION), ('%triggerpostun', KIND_SECTION),
+			('%verifyscript', KIND_SECTION),
+			('%if', KIND_CONDITIONAL), ('%ifarch', KIND_CONDITIONAL), ('%else', KIND_CONDITIONAL),
+			('%endif', KIND_CONDITIONAL),
+			('>=', KIND_OPERATOR), ('<=', KIND_OPERATOR), ('<', KIND_OPERATOR), ('>', KIND_OPERATOR),
+			('!=', KIND_OPERATOR), ('==', KIND_OPERATOR), ('&&', KIND_OPERATOR), ('||', KIND_OPERATOR),
+			('*', KIND_STAR)
+		])
+
+	DEFINITION = re.compile(r'(?:Name|Version|Release|Summary|License|URL|ExclusiveArch|Source'
+			r'|BuildArch|Group|Url|Conflicts|Obsoletes|BuildRoot):\Z'
+			r'|(?:BuildRequires|Requires|Provides).*:|(?:Source|Patch)[0-9]+:')
+
+	def __init__(self):
+		'''
+		Init
+		@return: None
+		@rtype: None
+		@raise SpecNotImplemented: always, lexer should not be instantiated
+		'''
+		raise SpecNotImplemented("Cannot instantiate")
+
+	@classmethod
+	def classify(cls, token):
+		'''
+		Get kind of a token
+		@param token: token string, None for EOF token
+		@type token: string
+		@return: token kind, one of KIND_* constants
+		@rtype: number
+		'''
+		if token is None:
+			return cls.KIND_EOF
+
+		kind = cls.KEYWORDS.get(token)
+		if kind is not None:
+			return kind
+
+		if cls.DEFINITION.match(token):
+			return cls.KIND_DEFINITION
+
+		return cls.KIND_WORD
+
+	@classmethod
+	def tokenize(cls, content, pos = 0):
+		'''
+		Split buffer into token spans
+		@param content: buffer to be split
+		@type content: string
+		@param pos: offset where to start
+		@type pos: number
+		@return: generator of spans (prepend start, token start, token end,
+		append end); token end and append end are None for EOF token
+		@rtype: generator of tuples
+		'''
+		# every char is either a part of prepend, token or append, so
+		# matches are contiguous; patterns never fail, so there is no
+		# backtracking into comments
+		for m in cls.SPAN.finditer(content, pos):
+			token_start = m.end(1)
+			token_end = m.end(2)
+
+			if token_start == token_end:
+				yield (m.start(), token_start, None, None)
+				return
+
+			yield (m.start(), token_start, token_end, m.end())
+
+	@classmethod
+	def tokenize_stream(cls, f, chunk_size = 65536):
+		'''
+		Split a stream into tokens while reading it chunk by chunk
+		@param f: stream to be read
+		@type f: file
+		@param chunk_size: number of bytes to be read at once
+		@type chunk_size: number
+		@return: generator of token strings (prepend, token, append); token is
+		None for EOF token
+		@rtype: generator of tuples
+		'''
+		span_match = cls.SPAN.match
+		buf = ""
+		pos = 0
+		exhausted = False
+
+		while True:
+			m = span_match(buf, pos)
+
+			# patterns look at most two chars ahead, the match could continue
+			# in the next chunk otherwise
+			if not exhausted and m.end() + 2 > len(buf):
+				chunk = f.read(chunk_size)
+				if chunk:
+					buf = buf[pos:] + chunk
+					pos = 0
+				else:
+					exhausted = True
+				continue
+
+			token_start = m.end(1)
+			token_end = m.end(2)
+
+			if token_start == token_end:
+				yield (buf[pos:token_start], None, "")
+				return
+
+			yield (buf[pos:token_start], buf[token_start:token_end], buf[token_end:m.end()])
+			pos = m.end()
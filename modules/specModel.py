@@ -25,8 +25,10 @@ Basic operations on spec sections and spec section encapsulation
 @license: GPL 2.0
 '''
 
+import bisect
+import itertools
 from specSection import *
-from specError import SpecNotImplemented
+from specError import SpecNotImplemented, SpecNotFound
 
 class SpecModel(object):
 	'''
@@ -56,11 +58,488 @@ class SpecModel(object):
 				SpecStFiles,
 				SpecStChangelog
 			]
+	# Rank of a section class in the section order, see get_section_rank()
+	SPEC_SECTION_RANKS = dict((cls, idx) for idx, cls in enumerate(SPEC_SECTION_ORDER))
 
 	def __init__(self):
 		'''
 		'''
 		self.sections = []
+		self.types = {}    # section class and its bases -> sections in model order
+		self.packages = {} # package name, None for main package -> %package sections
+		self.ranks = {}    # section -> position in the model, None if outdated
+		self.placement = [] # placement rank of each section in model order, None if outdated
+		# definitions are indexed as entries (section, idx, definition, tag, package, path),
+		# where section is the top level section holding the definition, idx position
+		# of the definition within the section, tag normalized definition name and
+		# path enclosing %if sections as nested tuples (path, if section, True if
+		# in true branch) or None
+		self.roots = {}       # section -> definition entries within the section
+		self.entries = {}     # definition -> definition entry
+		self.definitions = {} # tag -> package name -> definition entries in model order
+		# definitions changed in place are indexed again on look up, see check_definitions()
+		self.revisions = {} # top level section -> its change stamp when indexed
+		self.checked = SpecSection.changes # change stamp of the last check
+		self.owned = None     # sections modified in place, None if not forked, see fork()
+		# content digests are computed by SpecModelReader.get_digest()
+		self.digests = {} # top level section -> digest of the section
+		self.digest = None # digest of the model, None if outdated
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['changes'] = SpecSection.changes
+		return state
+
+	def __setstate__(self, state):
+		# change stamps of a loaded model are not to be reused by this process
+		SpecSection.changes = max(SpecSection.changes, state.pop('changes', 0))
+		self.__dict__.update(state)
+
+	@staticmethod
+	def get_section_classes(section):
+		'''
+		Get classes a section is indexed by, see L{find_section}
+		@param section: a section
+		@type section: L{SpecSection}
+		@return: section class and its bases
+		@rtype: tuple of __class__
+		'''
+		return section.__class__.__mro__[:-1] # skip object
+
+	@staticmethod
+	def get_package_name(section):
+		'''
+		Get name a %package section is indexed by, see L{find_package}
+		@param section: a %package section
+		@type section: L{SpecStPackage}
+		@return: package name or None for main package
+		@rtype: string
+		'''
+		pkg = section.pkg # getters mark sections as modified
+		return str(pkg) if pkg is not None else None
+
+	@staticmethod
+	def get_section_type(section):
+		'''
+		Get type of a section, a raw section has type of the unparsed section
+		@param section: a section
+		@type section: L{SpecSection}
+		@return: section type
+		@rtype: __class__
+		'''
+		if issubclass(section.__class__, SpecStRaw):
+			return section.get_section_type()
+		return section.__class__
+
+	@classmethod
+	def get_section_rank(cls, section):
+		'''
+		Get rank of a section in L{SPEC_SECTION_ORDER}
+		@param section: a section
+		@type section: L{SpecSection}
+		@return: rank of the section, None if section is not ordered, e.g.
+		a definition or an %if
+		@rtype: int
+		'''
+		for sec in cls.get_section_type(section).__mro__:
+			if sec in cls.SPEC_SECTION_RANKS:
+				return cls.SPEC_SECTION_RANKS[sec]
+		return None
+
+	def get_placement(self):
+		'''
+		Get placement ranks of sections in the model; placement rank is the
+		highest rank of the section and sections preceding it, -1 for preamble,
+		so placement ranks are sorted even if the spec does not follow the
+		section order
+		@return: placement ranks in model order
+		@rtype: list of int
+		'''
+		if self.placement is None:
+			self.placement = []
+			rank = -1
+			for section in self.sections:
+				section_rank = self.get_section_rank(section)
+				if section_rank is not None:
+					rank = max(rank, section_rank)
+				self.placement.append(rank)
+		return self.placement
+
+	def index_add(self, section, pos = None, entries = None):
+		'''
+		Add a section to indexes
+		@param section: a section to be indexed
+		@type section: L{SpecSection}
+		@param pos: position of the section in the model, None if appended
+		@type pos: int
+		@param entries: already created definition entries of the section
+		@type entries: list of tuples
+		@return: None
+		@rtype: None
+		'''
+		for cls in self.get_section_classes(section):
+			sections = self.types.setdefault(cls, [])
+			if pos is None:
+				sections.append(section)
+			else:
+				# keep sections in model order
+				idx = 0
+				for s in self.sections[:pos]:
+					if issubclass(s.__class__, cls):
+						idx += 1
+				sections.insert(idx, section)
+
+		if issubclass(section.__class__, SpecStPackage):
+			self.packages.setdefault(self.get_package_name(section), []).append(section)
+
+		if pos is None and self.ranks is not None:
+			self.ranks[section] = len(self.ranks)
+		else:
+			self.ranks = None
+
+		if self.placement is not None:
+			idx = len(self.placement) if pos is None else pos
+			rank = self.placement[idx - 1] if idx > 0 else -1
+			section_rank = self.get_section_rank(section)
+			if section_rank is not None:
+				rank = max(rank, section_rank)
+			if idx < len(self.placement) and self.placement[idx] < rank:
+				self.placement = None # sections following are placed lower
+			else:
+				self.placement.insert(idx, rank)
+
+		self.invalidate(section)
+		self.index_definitions(section, pos is not None, entries)
+
+	def index_remove(self, section):
+		'''
+		Remove a section from indexes
+		@param section: an indexed section
+		@type section: L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		for cls in self.get_section_classes(section):
+			sections = self.types[cls]
+			sections.remove(section)
+			if not sections:
+				del self.types[cls]
+
+		if issubclass(section.__class__, SpecStPackage):
+			name = self.get_package_name(section)
+			self.packages[name].remove(section)
+			if not self.packages[name]:
+				del self.packages[name]
+
+		self.ranks = None
+		self.placement = None
+		self.invalidate(section)
+		self.index_definitions_remove(section)
+
+	def index_replace(self, section, replacement):
+		'''
+		Replace a section in indexes, replacement has to be already placed
+		in the model instead of the section
+		@param section: an indexed section
+		@type section: L{SpecSection}
+		@param replacement: section replacing the indexed section
+		@type replacement: L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		classes = self.get_section_classes(replacement)
+		if classes != self.get_section_classes(section) \
+				or issubclass(section.__class__, SpecStPackage):
+			self.index_remove(section)
+			self.index_add(replacement, self.sections.index(replacement))
+		else:
+			for cls in classes:
+				sections = self.types[cls]
+				sections[sections.index(section)] = replacement
+			if self.ranks is not None:
+				self.ranks[replacement] = self.ranks.pop(section)
+			if self.get_section_rank(section) != self.get_section_rank(replacement):
+				self.placement = None # raw sections of different types
+			self.invalidate(section)
+			self.index_definitions_remove(section)
+			self.index_definitions(replacement, True)
+
+	def index_rebuild(self):
+		'''
+		Rebuild indexes from model sections
+		@return: None
+		@rtype: None
+		'''
+		roots = self.roots
+		revisions = self.revisions
+		digests = self.digests
+		self.types = {}
+		self.packages = {}
+		self.ranks = {}
+		self.placement = []
+		self.roots = {}
+		self.entries = {}
+		self.definitions = {}
+		self.revisions = {}
+		self.digests = dict((s, digests[s]) for s in self.sections if s in digests)
+		self.digest = None
+		for section in self.sections:
+			if section in roots and revisions.get(section) == section.changed:
+				# definitions of sections kept are not walked again
+				self.index_add(section, entries = roots[section])
+			else:
+				self.index_add(section)
+
+	def invalidate(self, section):
+		'''
+		Drop cached digests of a top level section and of the model, see
+		L{SpecModelReader.get_digest}
+		@param section: a top level section
+		@type section: L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		self.digests.pop(section, None)
+		self.digest = None
+
+	@staticmethod
+	def normalize_tag(name):
+		'''
+		Get normalized definition tag used by the definition index
+		@param name: definition name, e.g. 'Requires(post):'
+		@type name: string or L{SpecToken}
+		@return: normalized tag, e.g. 'Requires(post)'
+		@rtype: string
+		'''
+		return ''.join(str(name).split()).rstrip(':')
+
+	def walk_definitions(self, section):
+		'''
+		Walk definitions within a section including nested sections, in order
+		of the spec file
+		@param section: a section to walk
+		@type section: L{SpecSection}
+		@return: generator of tuples (definition, package name, path), see
+		L{get_definition_path}
+		@rtype: generator
+		'''
+		# nested sections are not taken by getters, which mark sections as
+		# modified, see L{SpecSection.set_dirty}
+		stack = [ (iter([section]), None, None) ]
+		while stack:
+			sections, package, path = stack[-1]
+			for s in sections:
+				if issubclass(s.__class__, SpecStDefinition):
+					yield s, package, path
+				elif issubclass(s.__class__, SpecStIf):
+					stack.append((iter(s.false_branch), package, (path, s, False)))
+					stack.append((iter(s.true_branch), package, (path, s, True)))
+					break
+				elif issubclass(s.__class__, SpecStPackage):
+					stack.append((iter(s.defs), self.get_package_name(s), path))
+					break
+			else:
+				stack.pop()
+
+	def index_definitions(self, section, insert = False, entries = None):
+		'''
+		Add definitions within a top level section to the definition index
+		@param section: a top level section
+		@type section: L{SpecSection}
+		@param insert: False if section is the last section of the model
+		@type insert: Boolean
+		@param entries: already created definition entries of the section
+		@type entries: list of tuples
+		@return: None
+		@rtype: None
+		'''
+		self.revisions[section] = section.changed
+		if entries is None:
+			entries = [ (section, idx, d, self.normalize_tag(d.name), package, path) \
+					for idx, (d, package, path) in enumerate(self.walk_definitions(section)) ]
+
+		if not entries:
+			return
+
+		self.roots[section] = entries
+		updated = []
+		for entry in entries:
+			self.entries[entry[2]] = entry
+			packages = self.definitions.setdefault(entry[3], {})
+			if entry[4] not in packages:
+				packages[entry[4]] = []
+			packages[entry[4]].append(entry)
+			updated.append(packages[entry[4]])
+
+		if insert:
+			ranks = self.get_ranks()
+			for lst in updated:
+				lst.sort(key = lambda e: (ranks[e[0]], e[1]))
+
+	def index_definitions_remove(self, section):
+		'''
+		Remove definitions within a top level section from the definition index
+		@param section: a top level section
+		@type section: L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		self.revisions.pop(section, None)
+		entries = self.roots.pop(section, None)
+		if entries is None:
+			return
+
+		for tag, package in set((e[3], e[4]) for e in entries):
+			packages = self.definitions[tag]
+			packages[package] = [ e for e in packages[package] if e[0] is not section ]
+			if not packages[package]:
+				del packages[package]
+			if not packages:
+				del self.definitions[tag]
+
+		for entry in entries:
+			del self.entries[entry[2]]
+
+	def get_ranks(self):
+		'''
+		Get positions of sections in the model
+		@return: section to position mapping
+		@rtype: dict
+		'''
+		if self.ranks is None:
+			self.ranks = dict((s, idx) for idx, s in enumerate(self.sections))
+		return self.ranks
+
+	def update(self, section):
+		'''
+		Notify model about a modified section, definitions within the section
+		are indexed again and its cached digest is dropped; nested sections
+		are accepted as well
+		@param section: modified section
+		@type section: L{SpecSection}
+		@return: None
+		@rtype: None
+		@raise SpecNotFound: if section is not in the model
+		'''
+		while section.parent is not None:
+			section = section.parent
+
+		if section not in self.types.get(section.__class__, ()):
+			raise SpecNotFound("Section '%s' not found" % str(section))
+
+		self.invalidate(section)
+		self.index_definitions_remove(section)
+		self.index_definitions(section, True)
+
+	def fork(self):
+		'''
+		Fork the model; the fork shares all sections with the model, a shared
+		section is copied when it is about to be modified, see L{modify}
+		@return: forked model
+		@rtype: L{SpecModel}
+		'''
+		ret = self.__class__()
+		ret.sections = list(self.sections)
+		ret.types = dict((cls, list(sections)) for cls, sections in self.types.iteritems())
+		ret.packages = dict((name, list(sections)) for name, sections in self.packages.iteritems())
+		ret.ranks = dict(self.ranks) if self.ranks is not None else None
+		ret.placement = list(self.placement) if self.placement is not None else None
+		ret.roots = dict(self.roots) # entries of a section are not modified, only replaced
+		ret.entries = dict(self.entries)
+		ret.definitions = dict((tag, dict((name, list(entries)) for name, entries in packages.iteritems())) \
+				for tag, packages in self.definitions.iteritems())
+		ret.revisions = dict(self.revisions)
+		ret.checked = self.checked
+		ret.digests = dict(self.digests)
+		ret.digest = self.digest
+		# sections are shared from now on, neither of models can modify them in place
+		self.owned = set()
+		ret.owned = set()
+		return ret
+
+	def own(self, section):
+		'''
+		Mark a top level section as owned by the model, so it is not copied
+		when modified, see L{modify}
+		@param section: a top level section
+		@type section: L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		if self.owned is not None:
+			self.owned.add(section)
+
+	@staticmethod
+	def copy_section(section):
+		'''
+		Copy a section together with its nested sections and tokens
+		@param section: section to be copied
+		@type section: L{SpecSection}
+		@return: copies of the section and of its nested sections
+		@rtype: dict original section -> copy
+		'''
+		copies = { section: section.copy() }
+		copies[section].copy_tokens()
+		stack = [ section ]
+
+		def copy_list(sections, parent):
+			if sections is None:
+				return None
+			ret = []
+			for s in sections:
+				copies[s] = s.copy()
+				copies[s].copy_tokens()
+				copies[s].set_parent(parent)
+				ret.append(copies[s])
+				stack.append(s)
+			return ret
+
+		while stack:
+			s = stack.pop()
+			c = copies[s]
+			if issubclass(s.__class__, SpecStIf):
+				c.set_true_branch(copy_list(s.true_branch, c))
+				c.set_false_branch(copy_list(s.false_branch, c))
+			elif issubclass(s.__class__, SpecStPackage):
+				c.set_defs(copy_list(s.defs, c))
+			elif issubclass(s.__class__, SpecStChangelog):
+				c.set_entries(copy_list(s.entries, c))
+
+		# setters used above mark copies as modified, copies are not
+		for s, c in copies.iteritems():
+			c.set_origin(s.get_origin())
+
+		return copies
+
+	def modify(self, section):
+		'''
+		Get a section which can be modified in place; if the section is
+		shared with a fork, the top level section holding it is copied
+		with its nested sections first and the copy replaces it in the model.
+		The section is marked as modified, see L{SpecSection.set_dirty}
+		@param section: section to be modified, nested sections are accepted as well
+		@type section: L{SpecSection}
+		@return: the section or its copy
+		@rtype: L{SpecSection}
+		@raise SpecNotFound: if section is not in the model
+		'''
+		root = section
+		while root.parent is not None:
+			root = root.parent
+
+		if root not in self.types.get(root.__class__, ()):
+			raise SpecNotFound("Section '%s' not found" % str(section))
+
+		self.invalidate(root)
+		if self.owned is not None and root not in self.owned:
+			copies = self.copy_section(root)
+			self.sections[self.sections.index(root)] = copies[root]
+			self.index_replace(root, copies[root])
+			self.owned.add(copies[root])
+			section = copies[section]
+
+		section.set_dirty()
+		return section
 
 	def append(self, section):
 		'''
@@ -71,6 +550,8 @@ class SpecModel(object):
 		@rtype: None
 		'''
 		self.sections.append(section)
+		self.index_add(section)
+		self.own(section)
 
 	def remove(self, section):
 		'''
@@ -81,8 +562,9 @@ class SpecModel(object):
 		@rtype: None
 		@raise SpecNotFound: if section is not found
 		'''
-		if section in self.sections:
+		if section in self.types.get(section.__class__, ()):
 			self.sections.remove(section)
+			self.index_remove(section)
 		else:
 			raise SpecNotFound("Section '%s' not found", str(section))
 
@@ -96,6 +578,35 @@ class SpecModel(object):
 		'''
 		for item in items:
 			self.sections.append(item)
+			self.index_add(item)
+			self.own(item)
+
+	def set_sections(self, sections):
+		'''
+		Replace all sections
+		@param sections: new sections of the model
+		@type sections: list of L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		self.sections[:] = sections
+		self.index_rebuild()
+
+	def find_placed(self, section):
+		'''
+		Find a section to be replaced by a section being added, see L{add}
+		@param section: section to be added
+		@type section: L{SpecSection}
+		@return: first section of the same type in the model or None
+		@rtype: L{SpecSection}
+		'''
+		section_type = self.get_section_type(section)
+		found = list(self.types.get(section_type, ()))
+		found += [ s for s in self.types.get(SpecStRaw, ()) if issubclass(s.get_section_type(), section_type) ]
+		if not found:
+			return None
+		ranks = self.get_ranks()
+		return min(found, key = lambda s: ranks[s])
 
 	def add(self, section):
 		'''
@@ -104,62 +615,78 @@ class SpecModel(object):
 		@type section: L{SpecSection}
 		@return: None
 		@rtype: None
+		@raise SpecNotImplemented: if section is a definition or an %if
+		@raise SpecNotFound: if section is not in L{SPEC_SECTION_ORDER}
 		'''
-		def get_add_index(idx_find, idx):
-			# first iterate downwards, when beginning reached, continue upwards
-			# from idx till end of section is reached (should not occur)
-			if idx_find < idx and idx_find > 0:
-				return idx_find - 1
-			elif idx_find < idx and idx_find == 0:
-				return idx + 1
-			elif idx_find > idx and idx_find < len(self.SPEC_SECTION_ORDER):
-				return idx_find + 1
-			elif idx_find == idx:
-				return idx - 1
-			else:
-				return None
+		self.add_items([ section ])
 
-		if issubclass(section.__class__, SpecStDefinition) \
-				or issubclass(section.__class__, SpecStIf):
-			raise SpecNotImplemented("Unable to add definitions and ifs")
-
-		found = False
-		if not issubclass(section.__class__, SpecStPackage):
-			# simple replace
-			for idx, sec in enumerate(self.sections):
-				if issubclass(sec.__class__, section.__class__):
-					self.sections[idx] = section
-					found = True
-					break
+	def add_items(self, items):
+		'''
+		Add multiple sections in one pass; a section replaces the first
+		section of the same type, %package sections are always added. Added
+		sections are placed after the last section ranked not higher in
+		L{SPEC_SECTION_ORDER}, see L{get_placement}
+		@param items: sections to be added
+		@type items: list of L{SpecSection}
+		@return: None
+		@rtype: None
+		@raise SpecNotImplemented: if a section is a definition or an %if
+		@raise SpecNotFound: if a section is not in L{SPEC_SECTION_ORDER}
+		'''
+		added = []   # tuples (rank, section) to be inserted
+		pending = {} # section type -> index of a section in added
+		for section in items:
+			if issubclass(section.__class__, SpecStDefinition) \
+					or issubclass(section.__class__, SpecStIf):
+				raise SpecNotImplemented("Unable to add definitions and ifs")
 
-		if found:
-			return
+			rank = self.get_section_rank(section)
+			if rank is None:
+				raise SpecNotFound("Section '%s' was not found in section order" % section)
 
-		# replace failed, append section
+			if issubclass(section.__class__, SpecStPackage):
+				added.append((rank, section))
+				continue
 
-		if issubclass(section.__class__, SpecStPackage):
-			raise SpecNotImplemented("Adding %package section not implemented") # TODO: implement
+			section_type = self.get_section_type(section)
+			if section_type in pending:
+				# added by items as well
+				added[pending[section_type]] = (rank, section)
+				continue
 
-		for idx, sec in enumerate(self.SPEC_SECTION_ORDER):
-			if issubclass(section.__class__, sec):
-				break
+			replaced = self.find_placed(section)
+			if replaced is not None:
+				self.sections[self.get_ranks()[replaced]] = section
+				self.index_replace(replaced, section)
+				self.own(section)
+			else:
+				pending[section_type] = len(added)
+				added.append((rank, section))
 
-		# idx now points to the section in SPEC_SECTION_ORDER
-		idx_find = idx
-		while not found:
-			idx_find = get_add_index(idx_find, idx)
+		if not added:
+			return
 
-			if idx_find is None:
-				raise SpecNotFound("Section '%s' was not found in section order" % section)
+		# sections of the same rank are kept in order of items
+		added.sort(key = lambda a: a[0])
+		placement = self.get_placement()
+		positions = [ bisect.bisect_right(placement, rank) for rank, _ in added ]
 
-			for i, sec in enumerate(self.sections):
-				if type(sec) == self.SPEC_SECTION_ORDER[idx_find]:
-					found = True
-					self.sections.insert(i + 1, section)
-					break
+		if len(added) == 1:
+			self.sections.insert(positions[0], added[0][1])
+			self.index_add(added[0][1], positions[0])
+		else:
+			sections = []
+			start = 0
+			for pos, (_, section) in zip(positions, added):
+				sections.extend(self.sections[start:pos])
+				sections.append(section)
+				start = pos
+			sections.extend(self.sections[start:])
+			self.sections[:] = sections
+			self.index_rebuild()
 
-		if not found:
-			raise SpecNotFound("Section '%s' was not added" % section)
+		for _, section in added:
+			self.own(section)
 
 	def get_sections(self):
 		'''
@@ -177,14 +704,116 @@ class SpecModel(object):
 		@return: list of sections of the provided type or None
 		@rtype: list of L{SpecSection}
 		'''
-		ret = None
-		for s in self.sections:
-			if issubclass(s.__class__, section_type):
-				if not ret:
-					ret = []
-				ret.append(s)
+		ret = self.types.get(section_type)
+		return list(ret) if ret else None
+
+	def find_package(self, name):
+		'''
+		Find %package sections of a package
+		@param name: package name, None or '-' for main package
+		@type name: string
+		@return: list of %package sections or None
+		@rtype: list of L{SpecStPackage}
+		'''
+		ret = self.packages.get(None if name == '-' else name)
+		return list(ret) if ret else None
+
+	def check_definitions(self):
+		'''
+		Index definitions again within top level sections which were changed
+		in place since indexed, e.g. by L{SpecStPackage.defs_append} without
+		L{update}, see L{SpecSection.set_changed}
+		@return: None
+		@rtype: None
+		'''
+		if self.checked == SpecSection.changes:
+			return
+		for section in self.sections:
+			if self.revisions.get(section) != section.changed:
+				self.index_definitions_remove(section)
+				self.index_definitions(section, True)
+		self.checked = SpecSection.changes
+
+	def find_definitions(self, tag, packages = None):
+		'''
+		Find definitions of a tag using the definition index; tags are matched
+		exactly once normalized, see L{normalize_tag}, so 'Requires' matches
+		'Requires:' and 'Requires :' but no other name starting with
+		'Requires:' (names used to be matched by a regular expression prefix,
+		e.g. re.compile('Requires:').match)
+		@param tag: definition tag, e.g. 'Requires:' or 'Source0'
+		@type tag: string
+		@param packages: package names to look for, '-' for main package, '*'
+		or None for all packages
+		@type packages: list of strings
+		@return: definitions in order of the spec file
+		@rtype: list of L{SpecStDefinition}
+		'''
+		self.check_definitions()
+		by_package = self.definitions.get(self.normalize_tag(tag), {})
+		if packages is None or '*' in packages:
+			lists = by_package.values()
+		else:
+			names = set(None if p == '-' else p for p in packages)
+			lists = [ by_package[p] for p in names if p in by_package ]
+		return [ e[2] for e in self.merge_entries(lists) ]
+
+	def merge_entries(self, lists):
+		'''
+		Merge lists of definition entries to order of the spec file
+		@param lists: lists of definition entries in model order
+		@type lists: list of lists
+		@return: definition entries
+		@rtype: list of tuples
+		'''
+		if len(lists) == 1:
+			return lists[0]
+		ranks = self.get_ranks()
+		return sorted(itertools.chain.from_iterable(lists), key = lambda e: (ranks[e[0]], e[1]))
+
+	def get_definition_path(self, definition):
+		'''
+		Get %if sections enclosing a definition
+		@param definition: an indexed definition
+		@type definition: L{SpecStDefinition}
+		@return: list of tuples (if section, True if in true branch), outermost first
+		@rtype: list of tuples
+		@raise SpecNotFound: if definition is not indexed
+		'''
+		self.check_definitions()
+		entry = self.entries.get(definition)
+		if entry is None:
+			raise SpecNotFound("Definition '%s' not found" % str(definition.name))
+
+		ret = []
+		path = entry[5]
+		while path is not None:
+			path, section, branch = path
+			ret.append((section, branch))
+		ret.reverse()
 		return ret
 
+	def walk(self):
+		'''
+		Walk all sections within spec model including nested sections, in
+		order of the spec file; an explicit stack is used, so nesting is not
+		limited by the Python stack
+		@return: generator of sections
+		@rtype: generator of L{SpecSection}
+		'''
+		stack = [ iter(self.sections) ]
+		while stack:
+			for s in stack[-1]:
+				yield s
+				if issubclass(s.__class__, SpecStIf):
+					stack.append(itertools.chain(s.true_branch, s.false_branch))
+					break
+				elif issubclass(s.__class__, SpecStPackage):
+					stack.append(iter(s.defs))
+					break
+			else:
+				stack.pop()
+
 	def find_definitions_all(self):
 		'''
 		Find all definitions within spec model
@@ -193,23 +822,6 @@ class SpecModel(object):
 		@raise SpecNotFound:
 		@todo: move to the model itself?
 		'''
-		def xfind_definitions_all(sections):
-			ret = []
-			for s in sections:
-				if issubclass(s.__class__, SpecStIf):
-					b = xfind_definitions_all(s.get_true_branch())
-					if b:
-						ret += b
-					b = xfind_definitions_all(s.get_false_branch())
-					if b:
-						ret += b
-				elif issubclass(s.__class__, SpecStDefinition):
-					ret.append(s)
-				elif issubclass(s.__class__, SpecStPackage):
-					b = xfind_definitions_all(s.get_defs())
-					if b:
-						ret += b
-			return ret
-
-		return xfind_definitions_all(self.sections)
-
+		self.check_definitions()
+		lists = [ lst for packages in self.definitions.values() for lst in packages.values() ]
+		return [ e[2] for e in self.merge_entries(lists) ]
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# ####################################################################
+# specker-lib - spec file manipulation library
+# Copyright (C) 2015  Fridolin Pokorny, fpokorny@redhat.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# ####################################################################
+'''
+Structural diff of spec models
+@author: Fridolin Pokorny
+@contact: fpokorny@redhat.com
+@organization: Red Hat Inc.
+@license: GPL 2.0
+'''
+
+import itertools
+import cStringIO
+from collections import Counter, OrderedDict
+from specModel import SpecModel
+from specModelTransformator import SpecModelReader
+from specFileRenderer import SpecFileRenderer, SpecChangelogRenderer
+from specSection import *
+
+class SpecModelDiff(object):
+	'''
+	Structural diff of two spec models, e.g. of two revisions of a spec.
+	Top level sections with the same digest are skipped. Definitions,
+	macros, sections and changelog entries of the other sections are matched
+	by their kind, package and position, whitespace changes are ignored.
+	Sections are read without getters, so compared sections are not marked
+	as modified, see L{SpecSection.set_dirty}
+	@cvar ADDED: an item is only in the new model
+	@cvar REMOVED: an item is only in the old model
+	@cvar CHANGED: an item was changed
+	@cvar DEFINITION: definition, e.g. 'Requires: foo', key is a tuple
+	(normalized tag, package name or None)
+	@cvar MACRO: %global or %define, key is a tuple (token, macro name)
+	@cvar SECTION: section, e.g. %build or %package, key is a tuple (section
+	token, package argument), see L{get_package}
+	@cvar CHANGELOG: changelog entry, key is the entry header line
+	@cvar VALUE_OPTIONS: options of section lines followed by a value
+	'''
+	ADDED = 'added'
+	REMOVED = 'removed'
+	CHANGED = 'changed'
+
+	DEFINITION = 'definition'
+	MACRO = 'macro'
+	SECTION = 'section'
+	CHANGELOG = 'changelog'
+
+	VALUE_OPTIONS = [ '-p', '-f', '-P' ]
+
+	def __init__(self, old, new):
+		'''
+		Init
+		@param old: old model
+		@type old: L{SpecModel}
+		@param new: new model
+		@type new: L{SpecModel}
+		@return: None
+		@rtype: None
+		'''
+		self.old = old
+		self.new = new
+
+	@staticmethod
+	def normalize(text):
+		'''
+		Normalize whitespaces of a text
+		@param text: text to be normalized
+		@type text: string
+		@return: normalized text
+		@rtype: string
+		'''
+		return ' '.join(text.split())
+
+	@staticmethod
+	def get_text(section, renderer):
+		'''
+		Get text of a section, sections which were not modified are taken
+		from the source
+		@param section: section
+		@type section: L{SpecSection}
+		@param renderer: renderer of the model holding the section
+		@type renderer: L{SpecFileRenderer}
+		@return: text of the section
+		@rtype: string
+		'''
+		origin = section.get_origin()
+		if origin is not None:
+			return origin[0].get_span(origin[1], origin[2])
+		f = cStringIO.StringIO()
+		renderer.render_section(section, f)
+		return f.getvalue()
+
+	@classmethod
+	def get_value(cls, value):
+		'''
+		Get normalized text of a token or a token list
+		@param value: token or token list
+		@type value: L{SpecToken} or L{SpecTokenList}
+		@return: normalized text
+		@rtype: string
+		'''
+		f = cStringIO.StringIO()
+		value.write(f)
+		return cls.normalize(f.getvalue())
+
+	@classmethod
+	def get_package(cls, section):
+		'''
+		Get package of a section from arguments on the section line, e.g.
+		'-n foo' of '%files -n foo' or 'devel' of '%post devel -p /bin/sh'
+		@param section: section
+		@type section: L{SpecStSection}
+		@return: package argument, empty for main package
+		@rtype: string
+		'''
+		if '\n' in section.token_section.append:
+			return ''
+		args = []
+		tokens = section.peek_tokens()
+		for i in xrange(len(tokens)):
+			token = tokens[i]
+			if token.is_eof() or '\n' in token.prepend:
+				break
+			args.append(str(token))
+			if '\n' in token.append:
+				break
+
+		ret = ''
+		args = iter(args)
+		for arg in args:
+			if arg == '--': # trigger conditions follow
+				break
+			elif arg == '-n':
+				return '-n ' + next(args, '')
+			elif arg in cls.VALUE_OPTIONS:
+				next(args, None)
+			elif not arg.startswith('-') and not ret:
+				ret = arg
+		return ret
+
+	def get_roots(self):
+		'''
+		Get top level sections which differ, sections with the same content
+		are matched by their digests, see L{SpecModelReader.get_digest}
+		@return: tuple (old sections, new sections)
+		@rtype: tuple
+		'''
+		old_reader = SpecModelReader(self.old)
+		new_reader = SpecModelReader(self.new)
+		if old_reader.get_model_digest() == new_reader.get_model_digest():
+			return [], []
+		old = [ (old_reader.get_digest(s), s) for s in self.old.sections ]
+		new = [ (new_reader.get_digest(s), s) for s in self.new.sections ]
+		return self.get_unmatched(old, new), self.get_unmatched(new, old)
+
+	@staticmethod
+	def get_unmatched(items, others):
+		'''
+		Get items which are not matched by other items, each item matches
+		one other item at most
+		@param items: tuples (text, item)
+		@type items: list
+		@param others: tuples (text, item)
+		@type others: list
+		@return: unmatched items in order
+		@rtype: list
+		'''
+		count = Counter(text for text, _ in others)
+		ret = []
+		for text, item in items:
+			if count[text] > 0:
+				count[text] -= 1
+			else:
+				ret.append(item)
+		return ret
+
+	def get_items(self, model, roots):
+		'''
+		Get items of sections to be compared, sections are walked including
+		nested sections
+		@param model: model holding sections
+		@type model: L{SpecModel}
+		@param roots: top level sections
+		@type roots: list of L{SpecSection}
+		@return: dict kind -> OrderedDict key -> list of tuples (text, item)
+		@rtype: dict
+		'''
+		renderer = SpecFileRenderer(SpecModelReader(model))
+		ret = dict((kind, OrderedDict()) for kind in [ self.DEFINITION, self.MACRO, self.SECTION, self.CHANGELOG ])
+
+		stack = [ (iter(roots), None) ]
+		while stack:
+			sections, package = stack[-1]
+			for s in sections:
+				if issubclass(s.__class__, SpecStDefinition):
+					key = (SpecModel.normalize_tag(s.name), package)
+					ret[self.DEFINITION].setdefault(key, []).append((self.get_value(s.value), s))
+				elif issubclass(s.__class__, SpecStIf):
+					stack.append((itertools.chain(s.true_branch, s.false_branch), package))
+					break
+				elif issubclass(s.__class__, SpecStPackage):
+					name = SpecModel.get_package_name(s)
+					ret[self.SECTION].setdefault((str(s.token_section), name or ''), []).append(('', s))
+					stack.append((iter(s.defs), name))
+					break
+				elif issubclass(s.__class__, SpecStChangelog):
+					for entry in s.entries:
+						# a detached copy is rendered, so the changelog is not marked
+						copy = entry.copy()
+						copy.set_parent(None)
+						f = cStringIO.StringIO()
+						SpecChangelogRenderer.render_entry(copy, f)
+						lines = [ l for l in f.getvalue().splitlines() if l.lstrip().startswith('*') ]
+						key = self.normalize(lines[0]) if lines else ''
+						ret[self.CHANGELOG].setdefault(key, []).append((self.normalize(f.getvalue()), entry))
+				elif issubclass(s.__class__, (SpecStGlobal, SpecStDefine)):
+					token = s.global_token if issubclass(s.__class__, SpecStGlobal) else s.define_token
+					key = (str(token), str(s.variable))
+					ret[self.MACRO].setdefault(key, []).append((self.normalize(self.get_text(s, renderer)), s))
+				elif issubclass(s.__class__, SpecStSection):
+					key = (str(s.token_section), self.get_package(s))
+					ret[self.SECTION].setdefault(key, []).append((self.normalize(self.get_text(s, renderer)), s))
+			else:
+				stack.pop()
+
+		return ret
+
+	def diff(self):
+		'''
+		Compute the diff
+		@return: changes as tuples (change, kind, key, old item, new item),
+		where change is one of L{ADDED}, L{REMOVED}, L{CHANGED} and kind is
+		one of L{DEFINITION}, L{MACRO}, L{SECTION}, L{CHANGELOG}; old item is
+		None if added and new item is None if removed
+		@rtype: list of tuples
+		'''
+		old_roots, new_roots = self.get_roots()
+		old = self.get_items(self.old, old_roots)
+		new = self.get_items(self.new, new_roots)
+
+		ret = []
+		for kind in [ self.DEFINITION, self.MACRO, self.SECTION, self.CHANGELOG ]:
+			keys = list(old[kind]) + [ key for key in new[kind] if key not in old[kind] ]
+			for key in keys:
+				old_items = old[kind].get(key, [])
+				new_items = new[kind].get(key, [])
+				# items are matched by position once same items are skipped
+				removed = self.get_unmatched(old_items, new_items)
+				added = self.get_unmatched(new_items, old_items)
+				for old_item, new_item in zip(removed, added):
+					ret.append((self.CHANGED, kind, key, old_item, new_item))
+				for old_item in removed[len(added):]:
+					ret.append((self.REMOVED, kind, key, old_item, None))
+				for new_item in added[len(removed):]:
+					ret.append((self.ADDED, kind, key, None, new_item))
+
+		return ret
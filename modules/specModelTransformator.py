@@ -25,7 +25,10 @@ An adapter used to communicate with model
 @license: GPL 2.0
 '''
 
+import hashlib
+import cStringIO
 from specModel import SpecModel
+from specFileRenderer import SpecFileRenderer
 
 class SpecModelTransformator(object):
 	'''
@@ -99,6 +102,16 @@ class SpecModelWriter(SpecModelTransformator):
 		'''
 		self.model.append_items(items)
 
+	def set_sections(self, sections):
+		'''
+		Replace all sections
+		@param sections: new sections of the model
+		@type sections: list of L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		self.model.set_sections(sections)
+
 	def add(self, section):
 		'''
 		Add a section, try to guess the most suitable position for the section
@@ -109,6 +122,57 @@ class SpecModelWriter(SpecModelTransformator):
 		'''
 		return self.model.add(section)
 
+	def add_items(self, items):
+		'''
+		Add multiple sections in one pass, see L{add}
+		@param items: sections to be added
+		@type items: list of L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		self.model.add_items(items)
+
+	def update(self, section):
+		'''
+		Notify model about a modified section, e.g. definitions were added
+		to a package
+		@param section: modified section
+		@type section: L{SpecSection}
+		@return: None
+		@rtype: None
+		@raise SpecNotFound: if section is not in the model
+		'''
+		self.model.update(section)
+
+	def modify(self, section):
+		'''
+		Get a section which can be modified in place, a section shared with
+		a fork is copied first
+		@param section: section to be modified
+		@type section: L{SpecSection}
+		@return: the section or its copy which replaced it in the model
+		@rtype: L{SpecSection}
+		@raise SpecNotFound: if section is not in the model
+		'''
+		return self.model.modify(section)
+
+	def fork(self):
+		'''
+		Fork the model, untouched sections are shared with the fork
+		@return: writer of the forked model
+		@rtype: L{SpecModelWriter}
+		'''
+		return self.__class__(self.model.fork())
+
+	def snapshot(self):
+		'''
+		Get a snapshot of the model, later modifications made by this writer
+		do not affect the snapshot
+		@return: snapshot of the model
+		@rtype: L{SpecModel}
+		'''
+		return self.model.fork()
+
 class SpecModelReader(SpecModelTransformator):
 	'''
 	An adapter used to communicate with model - non-modifying methods
@@ -123,6 +187,16 @@ class SpecModelReader(SpecModelTransformator):
 		'''
 		return self.model.find_section(section_type)
 
+	def find_package(self, name):
+		'''
+		Find %package sections of a package
+		@param name: package name, None or '-' for main package
+		@type name: string
+		@return: list of %package sections or None
+		@rtype: list of L{SpecStPackage}
+		'''
+		return self.model.find_package(name)
+
 	def find_definitions_all(self):
 		'''
 		Find all definitions within spec model
@@ -133,4 +207,59 @@ class SpecModelReader(SpecModelTransformator):
 		'''
 		return self.model.find_definitions_all()
 
+	def find_definitions(self, tag, packages = None):
+		'''
+		Find definitions of a tag
+		@param tag: definition tag, e.g. 'Requires:' or 'Source0'
+		@type tag: string
+		@param packages: package names to look for, '-' for main package, '*'
+		or None for all packages
+		@type packages: list of strings
+		@return: definitions in order of the spec file
+		@rtype: list of L{SpecStDefinition}
+		'''
+		return self.model.find_definitions(tag, packages)
+
+	def get_definition_path(self, definition):
+		'''
+		Get %if sections enclosing a definition
+		@param definition: a definition
+		@type definition: L{SpecStDefinition}
+		@return: list of tuples (if section, True if in true branch), outermost first
+		@rtype: list of tuples
+		@raise SpecNotFound: if definition is not found
+		'''
+		return self.model.get_definition_path(definition)
 
+	def get_digest(self, section):
+		'''
+		Get digest of section content computed from its rendered tokens;
+		digests of top level sections are cached in the model until the
+		section is changed through L{SpecModelWriter}
+		@param section: a section, nested sections are accepted as well
+		@type section: L{SpecSection}
+		@return: SHA-1 digest as a hex string
+		@rtype: string
+		'''
+		digest = self.model.digests.get(section)
+		if digest is None:
+			f = cStringIO.StringIO()
+			SpecFileRenderer(self).render_section(section, f)
+			digest = hashlib.sha1(f.getvalue()).hexdigest()
+			if section.parent is None:
+				self.model.digests[section] = digest
+		return digest
+
+	def get_model_digest(self):
+		'''
+		Get digest of the model computed from digests of top level sections,
+		see L{get_digest}; the digest is cached in the model
+		@return: SHA-1 digest as a hex string
+		@rtype: string
+		'''
+		if self.model.digest is None:
+			h = hashlib.sha1()
+			for section in self.model.sections:
+				h.update(self.get_digest(section))
+			self.model.digest = h.hexdigest()
+		return self.model.digest
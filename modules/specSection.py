@@ -27,6 +27,7 @@ in a specfile
 '''
 
 import re
+from specToken import SpecToken, SpecTokenList
 from specSectionMeta import *
 
 class SpecSection(object):
@@ -34,10 +35,14 @@ class SpecSection(object):
 	A generic spec section
 	'''
 	__metaclass__ = SpecSectionMeta
+	__slots__ = ('parent', 'tokens', 'origin', 'changed')
+	changes = 0 # stamp of the last change of definitions in any section, see set_changed()
 
 	def __init__(self, parent = None):
 		self.parent = parent
 		self.tokens = []
+		self.origin = None # (source, start, end) of the section as parsed, None if modified
+		self.changed = None # stamp of the last change of definitions within the section, see set_changed()
 
 	def get_parent(self):
 		'''
@@ -57,14 +62,119 @@ class SpecSection(object):
 		'''
 		self.parent = parent
 
+	def set_origin(self, origin):
+		'''
+		Set span of the section in the source buffer, the section is clean
+		until it is modified, see L{set_dirty}
+		@param origin: tuple (source, start, end) or None
+		@type origin: tuple
+		@return: None
+		@rtype: None
+		'''
+		self.origin = origin
+
+	def get_origin(self):
+		'''
+		Get span of the section in the source buffer if the section was not
+		modified since parsed
+		@return: tuple (source, start, end) or None
+		@rtype: tuple
+		'''
+		return self.origin
+
+	def set_dirty(self):
+		'''
+		Mark section as modified, so its source span can not be used anymore;
+		parent sections are marked as well. Setters and getters of tokens and
+		nested sections mark sections automatically, as returned tokens can be
+		modified in place
+		@return: None
+		@rtype: None
+		'''
+		self.origin = None
+		parent = self.parent
+		while parent is not None and parent.origin is not None:
+			parent.origin = None
+			parent = parent.parent
+
+	def set_changed(self):
+		'''
+		Stamp the top level section holding the section as changed, so
+		definitions within it are indexed again on the next look up, see
+		L{SpecModel.check_definitions}. Modifying setters and getters of
+		nested sections, definition names and package names call this
+		@return: None
+		@rtype: None
+		'''
+		SpecSection.changes += 1
+		section = self
+		while section.parent is not None:
+			section = section.parent
+		section.changed = SpecSection.changes
+
+	def is_dirty(self):
+		'''
+		Check whether the section was modified since parsed
+		@return: True if the section was modified or was not parsed
+		@rtype: Boolean
+		'''
+		return self.origin is None
+
+	def copy(self):
+		'''
+		Get a shallow copy of the section, nested sections and tokens are
+		shared with the section
+		@return: section copy
+		@rtype: L{SpecSection}
+		'''
+		ret = self.__class__.__new__(self.__class__)
+		for cls in self.__class__.__mro__:
+			for attr in cls.__dict__.get('__slots__', ()):
+				if hasattr(self, attr):
+					setattr(ret, attr, getattr(self, attr))
+		if hasattr(self, '__dict__'): # subclasses without __slots__
+			ret.__dict__.update(self.__dict__)
+		return ret
+
+	def copy_tokens(self):
+		'''
+		Replace tokens of a section copy by their copies, so tokens modified in
+		place are not shared with the copied section, see L{copy}. Nested
+		sections are left shared, except of an %if expression
+		@return: None
+		@rtype: None
+		'''
+		for cls in self.__class__.__mro__:
+			for attr in cls.__dict__.get('__slots__', ()):
+				if attr in ('parent', 'origin') or not hasattr(self, attr):
+					continue
+				value = getattr(self, attr)
+				if isinstance(value, (SpecToken, SpecTokenList)):
+					value = value.copy()
+				elif attr == 'tokens_span' and value is not None:
+					token_list, start, end = value
+					value = (token_list.copy(start, end), 0, end - start)
+				elif isinstance(value, SpecSection):
+					value = value.copy()
+					value.copy_tokens()
+					value.set_parent(self)
+				elif isinstance(value, list) and value and isinstance(value[0], SpecToken):
+					value = [ token.copy() for token in value ]
+				else:
+					continue
+				setattr(self, attr, value)
+
 class SpecStIf(SpecSection):
 	'''
 	%if section/statement representation
 	'''
 	__metaclass__ = SpecStIfMeta
+	__slots__ = ('if_token', 'expr', 'true_branch', 'else_token', 'false_branch', 'endif_token')
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.if_token = None
 		self.expr = None
 		self.true_branch = None
@@ -81,6 +191,7 @@ class SpecStIf(SpecSection):
 		@rtype: None
 		'''
 		self.if_token = token
+		self.set_dirty()
 
 	def set_expr(self, expr):
 		'''
@@ -91,6 +202,7 @@ class SpecStIf(SpecSection):
 		@rtype: None
 		'''
 		self.expr = expr
+		self.set_dirty()
 
 	def set_true_branch(self, branch):
 		'''
@@ -101,6 +213,8 @@ class SpecStIf(SpecSection):
 		@rtype: None
 		'''
 		self.true_branch = branch
+		self.set_dirty()
+		self.set_changed()
 
 	def set_else_token(self, els):
 		'''
@@ -111,6 +225,7 @@ class SpecStIf(SpecSection):
 		@rtype: None
 		'''
 		self.else_token = els
+		self.set_dirty()
 
 	def set_false_branch(self, branch):
 		'''
@@ -121,6 +236,8 @@ class SpecStIf(SpecSection):
 		@rtype: None
 		'''
 		self.false_branch = branch
+		self.set_dirty()
+		self.set_changed()
 
 	def set_endif_token(self, endi):
 		'''
@@ -131,6 +248,7 @@ class SpecStIf(SpecSection):
 		@rtype: None
 		'''
 		self.endif_token = endi
+		self.set_dirty()
 
 	def get_if_token(self):
 		'''
@@ -138,6 +256,7 @@ class SpecStIf(SpecSection):
 		@return: %if token
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.if_token
 
 	def get_expr(self):
@@ -146,6 +265,7 @@ class SpecStIf(SpecSection):
 		@return: expression
 		@rtype: L{SpecStExpression}
 		'''
+		self.set_dirty()
 		return self.expr
 
 	def get_true_branch(self):
@@ -154,6 +274,8 @@ class SpecStIf(SpecSection):
 		@return: true branch
 		@rtype: list of L{SpecSection}
 		'''
+		self.set_dirty()
+		self.set_changed()
 		return self.true_branch
 
 	def get_else_token(self):
@@ -162,6 +284,7 @@ class SpecStIf(SpecSection):
 		@return: else token
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.else_token
 
 	def get_false_branch(self):
@@ -170,6 +293,8 @@ class SpecStIf(SpecSection):
 		@return: false branch
 		@rtype: list of L{SpecSection}
 		'''
+		self.set_dirty()
+		self.set_changed()
 		return self.false_branch
 
 	def get_endif_token(self):
@@ -178,6 +303,7 @@ class SpecStIf(SpecSection):
 		@return: endif token
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.endif_token
 
 class SpecStDefinition(SpecSection):
@@ -185,9 +311,12 @@ class SpecStDefinition(SpecSection):
 	Definition representation
 	'''
 	__metaclass__ = SpecStDefinitionMeta
+	__slots__ = ('name', 'value')
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.name = None
 		self.value = None
 
@@ -200,6 +329,8 @@ class SpecStDefinition(SpecSection):
 		@rtype: None
 		'''
 		self.name = name
+		self.set_dirty()
+		self.set_changed()
 
 	def set_value(self, val):
 		'''
@@ -210,6 +341,7 @@ class SpecStDefinition(SpecSection):
 		@rtype: None
 		'''
 		self.value = val
+		self.set_dirty()
 
 	def get_name(self):
 		'''
@@ -217,6 +349,8 @@ class SpecStDefinition(SpecSection):
 		@return: definition name
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
+		self.set_changed()
 		return self.name
 
 	def get_value(self):
@@ -225,6 +359,7 @@ class SpecStDefinition(SpecSection):
 		@return: definition value
 		@rtype: list of L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.value
 
 	def get_package(self):
@@ -237,7 +372,7 @@ class SpecStDefinition(SpecSection):
 		while parent != None:
 			if issubclass(parent.__class__, SpecStPackage):
 				return parent
-			parent = self.parent
+			parent = parent.parent
 
 		return None
 
@@ -246,9 +381,12 @@ class SpecStGlobal(SpecSection):
 	%global representation
 	'''
 	__metaclass__ = SpecStGlobalMeta
+	__slots__ = ('global_token', 'variable', 'value')
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.global_token = None
 		self.variable = None
 		self.value = None
@@ -262,6 +400,7 @@ class SpecStGlobal(SpecSection):
 		@rtype: None
 		'''
 		self.global_token = glb
+		self.set_dirty()
 
 	def set_variable(self, var):
 		'''
@@ -272,6 +411,7 @@ class SpecStGlobal(SpecSection):
 		@rtype: None
 		'''
 		self.variable = var
+		self.set_dirty()
 
 	def set_value(self, val):
 		'''
@@ -282,6 +422,7 @@ class SpecStGlobal(SpecSection):
 		@rtype: None
 		'''
 		self.value = val
+		self.set_dirty()
 
 	def get_global_token(self):
 		'''
@@ -289,6 +430,7 @@ class SpecStGlobal(SpecSection):
 		@return: global token
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.global_token
 
 	def get_variable(self):
@@ -297,6 +439,7 @@ class SpecStGlobal(SpecSection):
 		@return: global variable
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.variable
 
 	def get_value(self):
@@ -305,6 +448,7 @@ class SpecStGlobal(SpecSection):
 		@return: global value
 		@rtype: list of L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.value
 
 class SpecStDefine(SpecSection):
@@ -312,9 +456,12 @@ class SpecStDefine(SpecSection):
 	%define representation
 	'''
 	__metaclass__ = SpecStDefineMeta
+	__slots__ = ('define_token', 'variable', 'value')
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.define_token = None
 		self.variable = None
 		self.value = None
@@ -328,6 +475,7 @@ class SpecStDefine(SpecSection):
 		@rtype: None
 		'''
 		self.define_token = dfn
+		self.set_dirty()
 
 	def set_variable(self, var):
 		'''
@@ -338,6 +486,7 @@ class SpecStDefine(SpecSection):
 		@rtype: None
 		'''
 		self.variable = var
+		self.set_dirty()
 
 	def set_value(self, val):
 		'''
@@ -348,6 +497,7 @@ class SpecStDefine(SpecSection):
 		@rtype: None
 		'''
 		self.value = val
+		self.set_dirty()
 
 	def get_define_token(self):
 		'''
@@ -355,6 +505,7 @@ class SpecStDefine(SpecSection):
 		@return: define token
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.define_token
 
 	def get_variable(self):
@@ -363,6 +514,7 @@ class SpecStDefine(SpecSection):
 		@return: define variable
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.variable
 
 	def get_value(self):
@@ -371,6 +523,7 @@ class SpecStDefine(SpecSection):
 		@return: define value
 		@rtype: list of L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.value
 
 class SpecStEof(SpecSection):
@@ -380,9 +533,12 @@ class SpecStEof(SpecSection):
 	file. EOF token can store prepend part; it is also used as a mark
 	'''
 	__metaclass__ = SpecStEofMeta
+	__slots__ = ('eof_token',)
 
 	def __init__(self, parent = None):
 		self.parent = None
+		self.origin = None
+		self.changed = None
 		self.eof_token = None
 
 	def set_eof_token(self, eof):
@@ -394,6 +550,7 @@ class SpecStEof(SpecSection):
 		@rtype: None
 		'''
 		self.eof_token = eof
+		self.set_dirty()
 
 	def get_eof_token(self):
 		'''
@@ -401,6 +558,7 @@ class SpecStEof(SpecSection):
 		@return: EOF token
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.eof_token
 
 class SpecStExpression(SpecSection):
@@ -408,9 +566,12 @@ class SpecStExpression(SpecSection):
 	An expression representation
 	'''
 	__metaclass__ = SpecStExpressionMeta
+	__slots__ = ()
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.tokens = None
 
 	def set_tokens(self, tkns):
@@ -422,6 +583,7 @@ class SpecStExpression(SpecSection):
 		@rtype: None
 		'''
 		self.tokens = tkns
+		self.set_dirty()
 
 	def get_tokens(self):
 		'''
@@ -429,6 +591,7 @@ class SpecStExpression(SpecSection):
 		@return: expression tokens
 		@rtype: list of L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.tokens
 
 class SpecStSection(SpecSection):
@@ -436,11 +599,15 @@ class SpecStSection(SpecSection):
 	Generic representation of a multi-line ("block") section
 	'''
 	__metaclass__ = SpecStSectionMeta
+	__slots__ = ('token_section', 'tokens_span')
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.token_section = None
 		self.tokens = []
+		self.tokens_span = None # (token list, start, end) of tokens not taken yet
 
 	def set_token_section(self, tkn):
 		'''
@@ -451,6 +618,7 @@ class SpecStSection(SpecSection):
 		@rtype: None
 		'''
 		self.token_section = tkn
+		self.set_dirty()
 
 	def set_tokens(self, tkns):
 		'''
@@ -461,6 +629,36 @@ class SpecStSection(SpecSection):
 		@rtype: None
 		'''
 		self.tokens = tkns
+		self.tokens_span = None
+		self.set_dirty()
+
+	def set_tokens_span(self, token_list, start, end):
+		'''
+		Set section tokens lazily as a range of a token list, tokens are
+		taken on the first L{get_tokens} call
+		@param token_list: token list with section tokens
+		@type token_list: L{SpecTokenList}
+		@param start: index of the first section token
+		@type start: number
+		@param end: index of the first token after the section
+		@type end: number
+		@return: None
+		@rtype: None
+		'''
+		self.tokens = None
+		self.tokens_span = (token_list, start, end)
+
+	def get_source_span(self):
+		'''
+		Get span of section tokens in the source buffer if tokens were not
+		taken yet, see L{set_tokens_span}
+		@return: tuple (source, start, end) or None
+		@rtype: tuple
+		'''
+		if self.tokens_span is None:
+			return None
+		token_list, start, end = self.tokens_span
+		return token_list.get_source_span(start, end)
 
 	def get_token_section(self):
 		'''
@@ -468,6 +666,7 @@ class SpecStSection(SpecSection):
 		@return: section token, e.g. '%build'
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
 		return self.token_section
 
 	def get_tokens(self):
@@ -476,6 +675,20 @@ class SpecStSection(SpecSection):
 		@return: section tokens
 		@rtype: list of L{SpecToken}
 		'''
+		self.set_dirty()
+		return self.peek_tokens()
+
+	def peek_tokens(self):
+		'''
+		Get section tokens without marking the section as modified, tokens
+		must not be modified, see L{get_tokens}
+		@return: section tokens
+		@rtype: list of L{SpecToken}
+		'''
+		if self.tokens_span is not None:
+			token_list, start, end = self.tokens_span
+			self.tokens = token_list.get_range(start, end)
+			self.tokens_span = None
 		return self.tokens
 
 class SpecStDescription(SpecStSection):
@@ -483,12 +696,14 @@ class SpecStDescription(SpecStSection):
 	Description section representation
 	'''
 	__metaclass__ = SpecStDescriptionMeta
+	__slots__ = ()
 
 class SpecStBuild(SpecStSection):
 	'''
 	Build section representation
 	'''
 	__metaclass__ = SpecStBuildMeta
+	__slots__ = ()
 
 class SpecStChangelog(SpecStSection):
 	'''
@@ -499,9 +714,13 @@ class SpecStChangelog(SpecStSection):
 		Changelog entry representation
 		'''
 		__metaclass__ = SpecStChangelogEntryMeta
+		__slots__ = ('star', 'date', 'date_parsed', 'user', 'user_email', 'version_delim', 'version',
+				'message', 'parser')
 
 		def __init__(self, parent):
 			self.parent = parent
+			self.origin = None
+			self.changed = None
 			self.star = None
 			self.date = None
 			self.date_parsed = None
@@ -510,6 +729,64 @@ class SpecStChangelog(SpecStSection):
 			self.version_delim = None
 			self.version = None
 			self.message = None
+			self.tokens_span = None
+			self.parser = None
+
+		def set_tokens_span(self, token_list, start, end, parser):
+			'''
+			Keep entry unparsed as a range of a token list, entry is parsed
+			on the first access of its fields
+			@param token_list: token list with entry tokens
+			@type token_list: L{SpecTokenList}
+			@param start: index of the first entry token
+			@type start: number
+			@param end: index of the first token after the entry
+			@type end: number
+			@param parser: parser used to parse the entry, see
+			L{SpecChangelogParser.parse_entry_span}
+			@type parser: L{SpecChangelogParser}
+			@return: None
+			@rtype: None
+			'''
+			self.tokens_span = (token_list, start, end)
+			self.parser = parser
+
+		def parse_tokens_span(self):
+			'''
+			Parse entry kept as a range of tokens, see L{set_tokens_span}
+			@return: None
+			@rtype: None
+			'''
+			if self.tokens_span is None:
+				return
+
+			token_list, start, end = self.tokens_span
+			# setters used by the parser call back here, decoding the entry
+			# is not a modification of the changelog
+			self.tokens_span = None
+			parent = self.parent
+			self.parent = None
+			try:
+				self.parser.parse_entry_span(self, token_list, start, end)
+			except:
+				self.tokens_span = (token_list, start, end)
+				raise
+			finally:
+				self.parent = parent
+			self.parser = None
+
+		def get_tokens(self):
+			'''
+			Get tokens of an entry which was not parsed yet, see
+			L{set_tokens_span}
+			@return: entry tokens or None if the entry was parsed
+			@rtype: L{SpecTokenList}
+			'''
+			if self.tokens_span is None:
+				return None
+			self.set_dirty()
+			token_list, start, end = self.tokens_span
+			return token_list.get_range(start, end)
 
 		def set_star(self, star):
 			'''
@@ -519,7 +796,9 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.star = star
+			self.set_dirty()
 
 		def set_date(self, date):
 			'''
@@ -529,7 +808,9 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.date = date
+			self.set_dirty()
 
 		def set_date_parsed(self, date_parsed):
 			'''
@@ -539,6 +820,7 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.date_parsed = date_parsed
 
 		def set_user(self, user):
@@ -549,7 +831,9 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.user = user
+			self.set_dirty()
 
 		def set_user_email(self, user_email):
 			'''
@@ -559,7 +843,9 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.user_email = user_email
+			self.set_dirty()
 
 		def set_version_delim(self, version_delim):
 			'''
@@ -569,7 +855,9 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.version_delim = version_delim
+			self.set_dirty()
 
 		def set_version(self, version):
 			'''
@@ -579,7 +867,9 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.version = version
+			self.set_dirty()
 
 		def set_message(self, message):
 			'''
@@ -589,7 +879,9 @@ class SpecStChangelog(SpecStSection):
 			@return: None
 			@rtype: None
 			'''
+			self.parse_tokens_span()
 			self.message = message
+			self.set_dirty()
 
 		def get_star(self):
 			'''
@@ -597,6 +889,8 @@ class SpecStChangelog(SpecStSection):
 			@return: star token
 			@rtype: L{SpecToken}
 			'''
+			self.parse_tokens_span()
+			self.set_dirty()
 			return self.star
 
 		def get_date(self):
@@ -605,6 +899,8 @@ class SpecStChangelog(SpecStSection):
 			@return: date tokens
 			@rtype: list of L{SpecToken}
 			'''
+			self.parse_tokens_span()
+			self.set_dirty()
 			return self.date
 
 		def get_date_parsed(self):
@@ -613,6 +909,7 @@ class SpecStChangelog(SpecStSection):
 			@return: parsed date
 			@rtype: datetime
 			'''
+			self.parse_tokens_span()
 			return self.date_parsed
 
 		def get_user(self):
@@ -621,6 +918,8 @@ class SpecStChangelog(SpecStSection):
 			@return: user token
 			@rtype: L{SpecToken}
 			'''
+			self.parse_tokens_span()
+			self.set_dirty()
 			return self.user
 
 		def get_user_email(self):
@@ -629,6 +928,8 @@ class SpecStChangelog(SpecStSection):
 			@return: user email token
 			@rtype: L{SpecToken}
 			'''
+			self.parse_tokens_span()
+			self.set_dirty()
 			return self.user_email
 
 		def get_version_delim(self):
@@ -637,6 +938,8 @@ class SpecStChangelog(SpecStSection):
 			@return: version delimiter
 			@rtype: L{SpecToken}
 			'''
+			self.parse_tokens_span()
+			self.set_dirty()
 			return self.version_delim
 
 		def get_version(self):
@@ -645,6 +948,8 @@ class SpecStChangelog(SpecStSection):
 			@return: version token
 			@rtype: L{SpecToken}
 			'''
+			self.parse_tokens_span()
+			self.set_dirty()
 			return self.version
 
 		def get_message(self):
@@ -653,12 +958,17 @@ class SpecStChangelog(SpecStSection):
 			@return: changelog entry message
 			@rtype: list of L{SpecToken}
 			'''
+			self.parse_tokens_span()
+			self.set_dirty()
 			return self.message
 
 	__metaclass__ = SpecStChangelogMeta
+	__slots__ = ('entries',)
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.token_section = None
 		self.entries = []
 
@@ -671,6 +981,7 @@ class SpecStChangelog(SpecStSection):
 		@rtype: None
 		'''
 		self.entries = entries
+		self.set_dirty()
 
 	def get_entries(self):
 		'''
@@ -678,6 +989,7 @@ class SpecStChangelog(SpecStSection):
 		@return: list of changelog entries
 		@rtype: list of L{SpecStChangelogEntry}
 		'''
+		self.set_dirty()
 		return self.entries
 
 	def append_entry(self, entry):
@@ -687,6 +999,7 @@ class SpecStChangelog(SpecStSection):
 		@type entry: L{SpecStChangelogEntry}
 		'''
 		self.entries.append(entry)
+		self.set_dirty()
 
 	def insert_entry(self, entry):
 		'''
@@ -695,39 +1008,50 @@ class SpecStChangelog(SpecStSection):
 		@type entry: L{SpecStChangelog.SpecStChangelogEntry}
 		'''
 		self.entries.insert(0, entry)
+		self.set_dirty()
+
+# nested classes are looked up by name when unpickled
+SpecStChangelogEntry = SpecStChangelog.SpecStChangelogEntry
 
 class SpecStCheck(SpecStSection):
 	'''
 	Check section representation
 	'''
 	__metaclass__ = SpecStCheckMeta
+	__slots__ = ()
 
 class SpecStClean(SpecStSection):
 	'''
 	Clean section representation
 	'''
 	__metaclass__ = SpecStCleanMeta
+	__slots__ = ()
 
 class SpecStFiles(SpecStSection):
 	'''
 	Files section representation
 	'''
 	__metaclass__ = SpecStFilesMeta
+	__slots__ = ()
 
 class SpecStInstall(SpecStSection):
 	'''
 	Install section representation
 	'''
 	__metaclass__ = SpecStInstallMeta
+	__slots__ = ()
 
 class SpecStPackage(SpecStSection):
 	'''
 	Package section representation
 	'''
 	__metaclass__ = SpecStPackageMeta
+	__slots__ = ('pkg', 'defs')
 
 	def __init__(self, parent):
 		self.parent = parent
+		self.origin = None
+		self.changed = None
 		self.pkg = None
 		self.defs = []
 		self.token_section = None
@@ -741,6 +1065,8 @@ class SpecStPackage(SpecStSection):
 		@rtype: None
 		'''
 		self.defs = defs
+		self.set_dirty()
+		self.set_changed()
 
 	def set_package(self, pkg):
 		'''
@@ -751,6 +1077,8 @@ class SpecStPackage(SpecStSection):
 		@rtype: None
 		'''
 		self.pkg = pkg
+		self.set_dirty()
+		self.set_changed()
 
 	def get_package(self):
 		'''
@@ -758,6 +1086,8 @@ class SpecStPackage(SpecStSection):
 		@return: package token
 		@rtype: L{SpecToken}
 		'''
+		self.set_dirty()
+		self.set_changed()
 		return self.pkg
 
 	def get_defs(self):
@@ -766,8 +1096,22 @@ class SpecStPackage(SpecStSection):
 		@return: package definitions
 		@rtype: list of L{SpecStDefinition}
 		'''
+		self.set_dirty()
+		self.set_changed()
 		return self.defs
 
+	def defs_remove(self, item):
+		'''
+		Remove a definition from package definitions
+		@param item: definition to be removed
+		@type item: L{SpecStDefinition}
+		@return: None
+		@rtype: None
+		'''
+		self.defs.remove(item)
+		self.set_dirty()
+		self.set_changed()
+
 	def defs_append(self, item):
 		'''
 		Append definition to package definitions
@@ -777,82 +1121,116 @@ class SpecStPackage(SpecStSection):
 		@rtype: None
 		'''
 		self.defs.append(item)
+		self.set_dirty()
+		self.set_changed()
 
 class SpecStPrep(SpecStSection):
 	'''
 	Prep section representation
 	'''
 	__metaclass__ = SpecStPrepMeta
+	__slots__ = ()
 
 class SpecStPre(SpecStSection):
 	'''
 	Pre section representation
 	'''
 	__metaclass__ = SpecStPreMeta
+	__slots__ = ()
 
 class SpecStPost(SpecStSection):
 	'''
 	Post section representation
 	'''
 	__metaclass__ = SpecStPostMeta
+	__slots__ = ()
 
 class SpecStPreun(SpecStSection):
 	'''
 	Preun section representation
 	'''
 	__metaclass__ = SpecStPreunMeta
+	__slots__ = ()
 
 class SpecStPostun(SpecStSection):
 	'''
 	Postun section representation
 	'''
 	__metaclass__ = SpecStPostunMeta
+	__slots__ = ()
 
 class SpecStPretrans(SpecStSection):
 	'''
 	Pretrans section representation
 	'''
 	__metaclass__ = SpecStPretransMeta
+	__slots__ = ()
 
 class SpecStPosttrans(SpecStSection):
 	'''
 	Posttrans section representation
 	'''
 	__metaclass__ = SpecStPosttransMeta
+	__slots__ = ()
 
 class SpecStTrigger(SpecStSection):
 	'''
 	Trigger section representation
 	'''
 	__metaclass__ = SpecStTriggerMeta
+	__slots__ = ()
 
 class SpecStTriggerin(SpecStSection):
 	'''
 	Triggerin section representation
 	'''
 	__metaclass__ = SpecStTriggerinMeta
+	__slots__ = ()
 
 class SpecStTriggerprein(SpecStSection):
 	'''
 	Triggerprein section representation
 	'''
 	__metaclass__ = SpecStTriggerpreinMeta
+	__slots__ = ()
 
 class SpecStTriggerun(SpecStSection):
 	'''
 	Triggerpreun section representation
 	'''
 	__metaclass__ = SpecStTriggerunMeta
+	__slots__ = ()
 
 class SpecStTriggerpostun(SpecStSection):
 	'''
 	Triggerpostun section representation
 	'''
 	__metaclass__ = SpecStTriggerpostunMeta
+	__slots__ = ()
 
 class SpecStVerifyscript(SpecStSection):
 	'''
 	Verifyscript section representation
 	'''
 	__metaclass__ = SpecStVerifyscriptMeta
+	__slots__ = ()
+
 
+class SpecStRaw(SpecStSection):
+	'''
+	A section kept unparsed, see L{SpecFileParser.init}
+	'''
+	__metaclass__ = SpecStRawMeta
+	__slots__ = ('section_type',)
+
+	def __init__(self, parent, section_type):
+		SpecStSection.__init__(self, parent)
+		self.section_type = section_type
+
+	def get_section_type(self):
+		'''
+		Get type of the section which was not parsed
+		@return: section type
+		@rtype: __class__
+		'''
+		return self.section_type
@@ -325,3 +325,13 @@ class SpecStVerifyscriptMeta(SpecStSectionMeta):
 		'''
 		return "%verifyscript"
 
+
+class SpecStRawMeta(SpecStSectionMeta):
+	'''
+	metaclass for L{SpecStRaw}
+	'''
+	def __repr__(c):
+		'''
+		section representation
+		'''
+		return "raw section"
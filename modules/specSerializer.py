@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+# ####################################################################
+# specker-lib - spec file manipulation library
+# Copyright (C) 2015  Fridolin Pokorny, fpokorny@redhat.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# ####################################################################
+'''
+A compact binary format of parsed spec models
+@author: Fridolin Pokorny
+@contact: fpokorny@redhat.com
+@organization: Red Hat Inc.
+@license: GPL 2.0
+'''
+
+import sys
+import array
+import struct
+import datetime
+from specError import SpecBadParam
+from specToken import SpecToken, SpecTokenList
+from specModel import SpecModel
+from specSection import *
+
+class SpecSerializer(object):
+	'''
+	Serializer of spec models to a compact versioned binary format; strings
+	are stored once in a string table and sections are stored as records of
+	32 bit integers referring to it. Records are written in postfix order,
+	values nested in a section precede the section, so loading does not
+	recurse. Sections are loaded as modified, see L{SpecSection.is_dirty},
+	and lazily parsed parts of sections are stored parsed.
+	@cvar MAGIC: magic bytes of serialized models
+	@cvar VERSION: version of the format, has to be changed when records or
+	section classes change
+	@cvar HEADER: header layout - magic, version, number of strings, number
+	of section classes, number of records
+	@cvar SKIPPED: section attributes which are not stored
+	'''
+	MAGIC = 'SPKM'
+	VERSION = 1
+	HEADER = struct.Struct('<4sHIII')
+	SKIPPED = ('parent', 'origin', 'changed', 'tokens_span', 'parser')
+
+	# record tags
+	NONE, FALSE, TRUE, INT, STR, TOKEN, TOKENS, LIST, TUPLE, SECTION, CLASS, DATE, DATETIME, UNSET = range(14)
+
+	def __init__(self):
+		'''
+		Init
+		@return: None
+		@rtype: None
+		'''
+		self.fields = {} # section class -> (stored attributes, skipped attributes, has __dict__)
+
+	def get_fields(self, cls):
+		'''
+		Get attributes of a section class to be stored
+		@param cls: section class
+		@type cls: __class__
+		@return: tuple (stored attributes, skipped attributes, True if instances
+		have __dict__)
+		@rtype: tuple
+		'''
+		ret = self.fields.get(cls)
+		if ret is None:
+			stored = []
+			skipped = []
+			has_dict = False
+			for c in reversed(cls.__mro__[:-1]):
+				if '__slots__' not in c.__dict__:
+					has_dict = True
+					continue
+				for attr in c.__dict__['__slots__']:
+					(skipped if attr in self.SKIPPED else stored).append(attr)
+			ret = self.fields[cls] = (stored, skipped, has_dict)
+		return ret
+
+	@staticmethod
+	def get_class(name):
+		'''
+		Get a section class by its qualified name; serialized data could come
+		from an untrusted source, so classes are looked up only in modules
+		already loaded, nothing is imported
+		@param name: qualified name, e.g. 'modules.specSection.SpecStBuild'
+		@type name: string
+		@return: section class
+		@rtype: __class__
+		@raise SpecBadParam: if the name is not a name of a section class
+		'''
+		module, _, attr = name.rpartition('.')
+		cls = getattr(sys.modules.get(module), attr, None)
+		if cls is None:
+			raise SpecBadParam("Unknown section class '%s'" % name)
+		if not isinstance(cls, type) or not issubclass(cls, SpecSection):
+			raise SpecBadParam("'%s' is not a section class" % name)
+		return cls
+
+	@staticmethod
+	def materialize(section):
+		'''
+		Parse lazily parsed parts of a section, see L{SpecStSection.set_tokens_span}
+		@param section: section to be stored
+		@type section: L{SpecSection}
+		@return: None
+		@rtype: None
+		'''
+		if getattr(section, 'tokens_span', None) is None:
+			return
+		if isinstance(section, SpecStChangelog.SpecStChangelogEntry):
+			section.parse_tokens_span()
+		else:
+			section.peek_tokens()
+
+	def dumps(self, model):
+		'''
+		Serialize a model
+		@param model: model to be serialized
+		@type model: L{SpecModel}
+		@return: serialized model
+		@rtype: string
+		@raise SpecBadParam: if a section holds a value which can not be stored
+		'''
+		strings = { None: -1 } # string -> index in the string table
+		string_id = strings.setdefault # called with len(strings) - 1 as a new index
+		classes = {} # class -> index in the class table
+		records = array.array('i')
+		emit = records.append
+		extend = records.extend
+		unset = object() # value of attributes which were not set
+
+		def class_id(cls):
+			ret = classes.get(cls)
+			if ret is None:
+				ret = classes[cls] = len(classes)
+			return ret
+
+		def token_record(t):
+			line = t.line
+			return (string_id(t.prepend, len(strings) - 1), string_id(t.token, len(strings) - 1),
+					string_id(t.append, len(strings) - 1), -1 if line is None else line, t.kind)
+
+		# tuples (value, True if values nested in it were stored)
+		stack = [ (model.sections, False) ]
+		while stack:
+			value, nested = stack.pop()
+			if nested:
+				if isinstance(value, SpecSection):
+					extend((self.SECTION, class_id(value.__class__)))
+				elif isinstance(value, list):
+					extend((self.LIST, len(value)))
+				else:
+					extend((self.TUPLE, len(value)))
+			elif isinstance(value, SpecTokenList):
+				extend((self.TOKENS, len(value), value.get_pointer()))
+				for i in xrange(len(value)):
+					extend(token_record(value.token_at(i)))
+			elif isinstance(value, SpecToken):
+				emit(self.TOKEN)
+				extend(token_record(value))
+			elif value is None:
+				emit(self.NONE)
+			elif value is unset:
+				emit(self.UNSET)
+			elif isinstance(value, str):
+				extend((self.STR, string_id(value, len(strings) - 1)))
+			elif isinstance(value, SpecSection):
+				self.materialize(value)
+				stored, _, has_dict = self.get_fields(value.__class__)
+				values = [ getattr(value, attr, unset) for attr in stored ]
+				if has_dict:
+					values.append([ (key, value.__dict__[key]) for key in sorted(value.__dict__) ])
+				stack.append((value, True))
+				stack.extend((v, False) for v in reversed(values))
+			elif isinstance(value, (list, tuple)):
+				stack.append((value, True))
+				stack.extend((v, False) for v in reversed(value))
+			elif isinstance(value, bool):
+				emit(self.TRUE if value else self.FALSE)
+			elif isinstance(value, (int, long)):
+				extend((self.INT, value))
+			elif isinstance(value, datetime.datetime):
+				extend((self.DATETIME, value.toordinal(),
+						value.hour * 3600 + value.minute * 60 + value.second, value.microsecond))
+			elif isinstance(value, datetime.date):
+				extend((self.DATE, value.toordinal()))
+			elif isinstance(value, type) and issubclass(value, SpecSection):
+				extend((self.CLASS, class_id(value)))
+			else:
+				raise SpecBadParam("Unable to serialize value of type '%s'" % type(value).__name__)
+
+		class_names = array.array('i', [ 0 ] * len(classes))
+		for cls, i in classes.iteritems():
+			class_names[i] = string_id("%s.%s" % (cls.__module__, cls.__name__), len(strings) - 1)
+		del strings[None]
+		table = [ None ] * len(strings)
+		for s, i in strings.iteritems():
+			table[i] = s
+		lengths = array.array('i', [ len(s) for s in table ])
+
+		columns = [ lengths, class_names, records ]
+		if sys.byteorder != 'little':
+			for column in columns:
+				column.byteswap()
+
+		return self.HEADER.pack(self.MAGIC, self.VERSION, len(lengths), len(class_names), len(records)) \
+				+ ''.join(column.tostring() for column in columns) + ''.join(table)
+
+	def loads(self, data):
+		'''
+		Load a serialized model
+		@param data: serialized model, see L{dumps}
+		@type data: string
+		@return: loaded model
+		@rtype: L{SpecModel}
+		@raise SpecBadParam: if data are not a serialized model of this version
+		'''
+		try:
+			magic, version, n_strings, n_classes, n_records = self.HEADER.unpack_from(data)
+		except struct.error:
+			raise SpecBadParam("Not a serialized spec model")
+		if magic != self.MAGIC:
+			raise SpecBadParam("Not a serialized spec model")
+		if version != self.VERSION:
+			raise SpecBadParam("Unsupported version %d of a serialized spec model" % version)
+
+		columns = []
+		offset = self.HEADER.size
+		for size in (n_strings, n_classes, n_records):
+			column = array.array('i')
+			column.fromstring(data[offset:offset + size * column.itemsize])
+			if len(column) != size:
+				raise SpecBadParam("Truncated serialized spec model")
+			if sys.byteorder != 'little':
+				column.byteswap()
+			offset += size * column.itemsize
+			columns.append(column)
+		lengths, class_names, records = columns
+
+		strings = []
+		for length in lengths:
+			strings.append(data[offset:offset + length])
+			offset += length
+		if offset != len(data):
+			raise SpecBadParam("Malformed serialized spec model")
+		strings.append(None) # string index -1
+
+		try:
+			classes = [ self.get_class(strings[i]) for i in class_names ]
+			sections = self.load_records(records, strings, classes)
+		except (IndexError, ValueError, TypeError):
+			raise SpecBadParam("Malformed serialized spec model")
+
+		model = SpecModel()
+		model.set_sections(sections)
+		return model
+
+	def load_records(self, records, strings, classes):
+		'''
+		Create sections from records, see L{dumps}
+		@param records: records of a serialized model
+		@type records: array
+		@param strings: string table, the last item is None
+		@type strings: list of string
+		@param classes: section classes referred by records
+		@type classes: list of __class__
+		@return: top level sections
+		@rtype: list of L{SpecSection}
+		'''
+		new_token = SpecToken.from_parts
+		unset = object() # value of attributes which were not set
+		values = []
+		push = values.append
+		i = 0
+		n = len(records)
+		while i < n:
+			tag = records[i]
+			if tag == self.TOKENS:
+				count = records[i + 1]
+				l = SpecTokenList()
+				l.token_list = [ new_token(strings[records[j]], strings[records[j + 1]], strings[records[j + 2]],
+						None if records[j + 3] < 0 else records[j + 3], records[j + 4])
+						for j in xrange(i + 3, i + 3 + 5 * count, 5) ]
+				l.set_pointer(records[i + 2])
+				push(l)
+				i += 3 + 5 * count
+			elif tag == self.TOKEN:
+				push(new_token(strings[records[i + 1]], strings[records[i + 2]], strings[records[i + 3]],
+						None if records[i + 4] < 0 else records[i + 4], records[i + 5]))
+				i += 6
+			elif tag == self.STR:
+				push(strings[records[i + 1]])
+				i += 2
+			elif tag == self.NONE:
+				push(None)
+				i += 1
+			elif tag == self.LIST or tag == self.TUPLE:
+				count = records[i + 1]
+				if count > len(values):
+					raise ValueError("Too few values")
+				items = values[len(values) - count:]
+				del values[len(values) - count:]
+				push(items if tag == self.LIST else tuple(items))
+				i += 2
+			elif tag == self.SECTION:
+				cls = classes[records[i + 1]]
+				stored, skipped, has_dict = self.get_fields(cls)
+				count = len(stored) + has_dict
+				if count > len(values):
+					raise ValueError("Too few values")
+				items = values[len(values) - count:]
+				del values[len(values) - count:]
+
+				section = cls.__new__(cls)
+				for attr in skipped:
+					setattr(section, attr, None)
+				for attr, value in zip(stored, items):
+					if value is not unset:
+						setattr(section, attr, value)
+				if has_dict:
+					section.__dict__.update(items[-1])
+
+				# sections nested in attributes and in lists of attributes
+				for value in items:
+					if isinstance(value, SpecSection):
+						value.parent = section
+					elif isinstance(value, list):
+						for item in value:
+							if isinstance(item, SpecSection):
+								item.parent = section
+				push(section)
+				i += 2
+			elif tag == self.UNSET:
+				push(unset)
+				i += 1
+			elif tag == self.TRUE or tag == self.FALSE:
+				push(tag == self.TRUE)
+				i += 1
+			elif tag == self.INT:
+				push(records[i + 1])
+				i += 2
+			elif tag == self.CLASS:
+				push(classes[records[i + 1]])
+				i += 2
+			elif tag == self.DATETIME:
+				value = datetime.datetime.fromordinal(records[i + 1])
+				push(value + datetime.timedelta(seconds = records[i + 2], microseconds = records[i + 3]))
+				i += 4
+			elif tag == self.DATE:
+				push(datetime.date.fromordinal(records[i + 1]))
+				i += 2
+			else:
+				raise ValueError("Unknown record %d" % tag)
+
+		if len(values) != 1 or not isinstance(values[0], list):
+			raise ValueError("Expected list of sections")
+		return values[0]
+
+	def dump(self, model, f):
+		'''
+		Serialize a model to a file
+		@param model: model to be serialized
+		@type model: L{SpecModel}
+		@param f: file to write to, opened in binary mode
+		@type f: file
+		@return: None
+		@rtype: None
+		@raise SpecBadParam: if a section holds a value which can not be stored
+		'''
+		f.write(self.dumps(model))
+
+	def load(self, f):
+		'''
+		Load a serialized model from a file
+		@param f: file to read from, opened in binary mode
+		@type f: file
+		@return: loaded model
+		@rtype: L{SpecModel}
+		@raise SpecBadParam: if the file does not hold a serialized model of
+		this version
+		'''
+		return self.loads(f.read())
@@ -25,13 +25,306 @@ A spec file token abstraction and token list representation
 @license: GPL 2.0
 '''
 import cStringIO
+import array
+from bisect import bisect_right
 from specFile import SpecFile
-from specError import SpecBadIndex
+from specLexer import SpecLexer
+from specError import SpecBadIndex, SpecBadParam, SpecNotImplemented
 
-class SpecToken:
+class SpecTokenTable(object):
 	'''
-	Token abstraction
+	Columnar storage of tokens lexed from a L{SpecFile}; tokens refer to the
+	source buffer by offsets, token strings are kept in an interned string
+	pool so equal tokens share one string. Tokens are classified once per
+	string in the pool, see L{SpecLexer.classify}. Line numbers stored in
+	columns are relative to the source, shifts set by L{shift_lines} map
+	them to lines of a text the source is a part of.
 	'''
+	COLUMNS = [ 'starts', 'token_starts', 'token_ids', 'lines', 'kinds' ]
+
+	def __init__(self, specFile, line = 1):
+		'''
+		Init L{SpecTokenTable}, tokenize a spec file using L{SpecLexer}
+		@param specFile: file to be tokenized
+		@type specFile: L{SpecFile}
+		@param line: line number of the first line of the spec file
+		@type line: number
+		@return: None
+		@rtype: None
+		'''
+		self.source = specFile
+		self.starts = array.array('l')       # prepend start, end sentinel
+		self.token_starts = array.array('l')
+		self.token_ids = array.array('l')    # index to string pool, -1 for EOF
+		self.lines = array.array('l')        # line of token, end sentinel
+		self.kinds = array.array('B')       # see SpecLexer.KIND_*
+		self.strings = []
+		self.string_kinds = []
+		self.string_ids = {}
+		self.line_tokens = None # first token of logical lines, see get_line_tokens()
+		self.shift_rows = []   # first rows of line shifts, see shift_lines()
+		self.shift_values = []
+		self.kind_masks = {}   # see get_kind_mask()
+
+		self.tokenize(specFile)
+		if line != 1:
+			self.shift_lines(0, line - 1)
+
+	def tokenize(self, specFile):
+		'''
+		Fill columns with tokens of a spec file
+		@param specFile: file to be tokenized
+		@type specFile: L{SpecFile}
+		@return: None
+		@rtype: None
+		'''
+		content = specFile.content
+		specFile.build_line_index()
+		line_starts = specFile.line_starts
+		line_count = len(line_starts)
+		starts_append = self.starts.append
+		token_starts_append = self.token_starts.append
+		token_ids_append = self.token_ids.append
+		lines_append = self.lines.append
+		kinds_append = self.kinds.append
+		strings = self.strings
+		string_kinds = self.string_kinds
+		string_ids = self.string_ids
+		classify = SpecLexer.classify
+		line = 1
+		end = 0
+
+		for span in SpecLexer.tokenize(content):
+			# spans are sorted, so line starts are walked only once
+			while line < line_count and line_starts[line] <= span[0]:
+				line += 1
+
+			starts_append(span[0])
+			token_starts_append(span[1])
+			lines_append(line)
+
+			if span[2] is None:
+				token_ids_append(-1)
+				kinds_append(SpecLexer.KIND_EOF)
+				end = span[1]
+			else:
+				token = content[span[1]:span[2]]
+				string_id = string_ids.get(token)
+				if string_id is None:
+					kind = classify(token)
+					if kind != SpecLexer.KIND_WORD:
+						token = intern(token)
+					string_id = len(strings)
+					string_ids[token] = string_id
+					strings.append(token)
+					string_kinds.append(kind)
+				token_ids_append(string_id)
+				kinds_append(string_kinds[string_id])
+				end = span[3]
+
+		while line < line_count and line_starts[line] <= end:
+			line += 1
+
+		starts_append(end)
+		lines_append(line)
+
+	def __len__(self):
+		'''
+		Number of tokens in table
+		@return: number of tokens
+		@rtype: number
+		'''
+		return len(self.kinds)
+
+	def get_prepend(self, i):
+		'''
+		Get prepend part of a token
+		@param i: index of a token
+		@type i: number
+		@return: prepend part
+		@rtype: string
+		'''
+		return self.source.get_span(self.starts[i], self.token_starts[i])
+
+	def get_token(self, i):
+		'''
+		Get token string
+		@param i: index of a token
+		@type i: number
+		@return: token string or None for EOF token
+		@rtype: string
+		'''
+		if self.kinds[i] == SpecLexer.KIND_EOF:
+			return None
+		return self.strings[self.token_ids[i]]
+
+	def get_append(self, i):
+		'''
+		Get append part of a token
+		@param i: index of a token
+		@type i: number
+		@return: append part
+		@rtype: string
+		'''
+		if self.kinds[i] == SpecLexer.KIND_EOF:
+			return ""
+		token_end = self.token_starts[i] + len(self.strings[self.token_ids[i]])
+		return self.source.get_span(token_end, self.starts[i + 1])
+
+	def get_line(self, i):
+		'''
+		Get line of a token
+		@param i: index of a token
+		@type i: number
+		@return: line number
+		@rtype: number
+		'''
+		j = bisect_right(self.shift_rows, i) - 1
+		if j < 0:
+			return self.lines[i]
+		return self.lines[i] + self.shift_values[j]
+
+	def same_shift(self, i, j):
+		'''
+		Check if lines of two tokens are shifted by the same shift, so no
+		text was inserted or removed between them, see L{shift_lines}
+		@param i: index of a token
+		@type i: number
+		@param j: index of a token
+		@type j: number
+		@return: True if tokens are shifted by the same shift
+		@rtype: Boolean
+		'''
+		if not self.shift_rows:
+			return True
+		return bisect_right(self.shift_rows, i) == bisect_right(self.shift_rows, j)
+
+	def shift_lines(self, first, shift):
+		'''
+		Shift lines of tokens starting with a row, used when lines were
+		inserted to or removed from a text before these tokens
+		@param first: first row to be shifted
+		@type first: number
+		@param shift: number of lines to shift by
+		@type shift: number
+		@return: None
+		@rtype: None
+		'''
+		j = bisect_right(self.shift_rows, first)
+		if j == 0 or self.shift_rows[j - 1] != first:
+			self.shift_rows.insert(j, first)
+			self.shift_values.insert(j, self.shift_values[j - 1] if j > 0 else 0)
+		else:
+			j -= 1
+
+		for k in xrange(j, len(self.shift_values)):
+			self.shift_values[k] += shift
+
+	def get_eol_count(self, i):
+		'''
+		Get number of new lines in a token
+		@param i: index of a token
+		@type i: number
+		@return: number of new lines
+		@rtype: number
+		'''
+		return self.lines[i + 1] - self.lines[i]
+
+	def get_logical_line(self, i):
+		'''
+		Get logical line of a token, see L{SpecFile.get_logical_line}
+		@param i: index of a token
+		@type i: number
+		@return: logical line number
+		@rtype: number
+		'''
+		return self.source.logical_lines[self.lines[i] - 1]
+
+	def get_kind_mask(self, kinds):
+		'''
+		Get a mask of tokens of given kinds, the mask is computed by a single
+		scan once for the kinds; the next token of the kinds is then found by
+		a string search
+		@param kinds: token kinds, see L{SpecLexer}
+		@type kinds: set of numbers
+		@return: a string with '\\x01' for tokens of given kinds and '\\x00'
+		for other tokens
+		@rtype: string
+		'''
+		kinds = frozenset(kinds)
+		mask = self.kind_masks.get(kinds)
+		if mask is None:
+			translation = ''.join('\x01' if i in kinds else '\x00' for i in xrange(256))
+			mask = self.kind_masks[kinds] = self.kinds.tostring().translate(translation)
+		return mask
+
+	def __getstate__(self):
+		'''
+		Get state to be pickled, columns are stored as raw arrays and caches
+		are not stored
+		@return: table state
+		@rtype: dict
+		'''
+		state = self.__dict__.copy()
+		for column in self.COLUMNS:
+			state[column] = (state[column].typecode, state[column].tostring())
+		state['string_ids'] = None
+		state['line_tokens'] = None
+		state['kind_masks'] = {}
+		return state
+
+	def __setstate__(self, state):
+		'''
+		Restore pickled state
+		@param state: table state, see L{__getstate__}
+		@type state: dict
+		@return: None
+		@rtype: None
+		'''
+		self.__dict__.update(state)
+		self.source.build_line_index()
+		for column in self.COLUMNS:
+			typecode, data = state[column]
+			setattr(self, column, array.array(typecode, data))
+		strings = self.strings
+		for i, kind in enumerate(self.string_kinds):
+			if kind != SpecLexer.KIND_WORD:
+				strings[i] = intern(strings[i])
+		self.string_ids = dict((string, i) for i, string in enumerate(strings))
+
+	def get_line_tokens(self, logical):
+		'''
+		Get tokens on a logical line
+		@param logical: logical line number
+		@type logical: number
+		@return: tuple (start, end), indexes of the first token on the logical
+		line and of the first token after it
+		@rtype: tuple
+		'''
+		if self.line_tokens is None:
+			logical_lines = self.source.logical_lines
+			lines = self.lines
+			line_tokens = array.array('l')
+			for i in xrange(len(self)):
+				while len(line_tokens) < logical_lines[lines[i] - 1]:
+					line_tokens.append(i)
+			line_tokens.append(len(self))
+			self.line_tokens = line_tokens
+
+		if logical < 1:
+			return (0, 0)
+		if logical >= len(self.line_tokens):
+			return (len(self), len(self))
+		return (self.line_tokens[logical - 1], self.line_tokens[logical])
+
+class SpecToken(object):
+	'''
+	Token abstraction; a token either owns its strings or it is a view of
+	a row in a L{SpecTokenTable}, a view takes its own copy of the row once
+	it is modified
+	'''
+	__slots__ = ('table', 'index', '_prepend', '_token', '_append', '_line', '_kind')
+
 	def __init__(self, specFile = None):
 		'''
 		Init L{SpecToken}
@@ -40,6 +333,190 @@ class SpecToken:
 		@return: None
 		@rtype: None
 		'''
+		self.table = None
+		self._prepend = "" # prepended whitespaces
+		self._append = ""  # appended whitespaces
+		self._token = ""
+		self._line  = None
+		self._kind = None # classified on demand
+
+		if specFile is not None:
+			self.read(specFile)
+
+	@classmethod
+	def from_table(cls, table, index):
+		'''
+		Create a token which is a view of a row in a token table
+		@param table: table with tokens
+		@type table: L{SpecTokenTable}
+		@param index: row in the table
+		@type index: number
+		@return: token view
+		@rtype: L{SpecToken}
+		'''
+		ret = cls.__new__(cls)
+		ret.table = table
+		ret.index = index
+		return ret
+
+	@classmethod
+	def from_parts(cls, prepend, token, append, line, kind):
+		'''
+		Create a token which owns its strings
+		@param prepend: prepended whitespaces
+		@type prepend: string
+		@param token: token string, None for EOF token
+		@type token: string
+		@param append: appended whitespaces
+		@type append: string
+		@param line: line of the token or None
+		@type line: number
+		@param kind: token kind, see SpecLexer.KIND_*
+		@type kind: number
+		@return: token
+		@rtype: L{SpecToken}
+		'''
+		ret = cls.__new__(cls)
+		ret.table = None
+		ret._prepend = prepend
+		ret._token = token
+		ret._append = append
+		ret._line = line
+		ret._kind = kind
+		return ret
+
+	def copy(self):
+		'''
+		Get a copy of the token, a copy of a token view is a view of the same
+		table row; table rows are not modified, see L{detach}
+		@return: token copy
+		@rtype: L{SpecToken}
+		'''
+		if self.table is not None:
+			return self.from_table(self.table, self.index)
+		return self.from_parts(self._prepend, self._token, self._append, self._line, self._kind)
+
+	def __getstate__(self):
+		'''
+		Get state to be pickled, a token view is stored as a reference to
+		its table row
+		@return: token state
+		@rtype: tuple
+		'''
+		if self.table is not None:
+			return (self.table, self.index)
+		return (None, self._prepend, self._token, self._append, self._line, self._kind)
+
+	def __setstate__(self, state):
+		'''
+		Restore pickled state
+		@param state: token state, see L{__getstate__}
+		@type state: tuple
+		@return: None
+		@rtype: None
+		'''
+		if state[0] is not None:
+			self.table, self.index = state
+		else:
+			self.table, self._prepend, self._token, self._append, self._line, self._kind = state
+
+	def detach(self):
+		'''
+		Make token own its strings, a token view is detached from its table
+		@return: None
+		@rtype: None
+		'''
+		table = self.table
+		if table is None:
+			return
+
+		i = self.index
+		self._prepend = table.get_prepend(i)
+		self._token = table.get_token(i)
+		self._append = table.get_append(i)
+		self._line = table.get_line(i)
+		self._kind = table.kinds[i]
+		self.table = None
+
+	def get_source_span(self):
+		'''
+		Get span of the whole token in the source buffer
+		@return: tuple (source, start, end) or None if token is not a view of
+		a token table
+		@rtype: tuple
+		'''
+		table = self.table
+		if table is None:
+			return None
+		return (table.source, table.starts[self.index], table.starts[self.index + 1])
+
+	def _get_prepend(self):
+		if self.table is None:
+			return self._prepend
+		return self.table.get_prepend(self.index)
+
+	def _set_prepend(self, prepend):
+		self.detach()
+		self._prepend = prepend
+
+	def _get_token(self):
+		if self.table is None:
+			return self._token
+		return self.table.get_token(self.index)
+
+	def _set_token(self, token):
+		self.detach()
+		self._token = token
+		self._kind = None
+
+	def _get_append(self):
+		if self.table is None:
+			return self._append
+		return self.table.get_append(self.index)
+
+	def _set_append(self, append):
+		self.detach()
+		self._append = append
+
+	def _get_line(self):
+		table = self.table
+		if table is None:
+			return self._line
+		if table.shift_rows:
+			return table.get_line(self.index)
+		return table.lines[self.index]
+
+	def _set_line(self, line):
+		self.detach()
+		self._line = line
+
+	def _get_eol_count(self):
+		if self.table is None:
+			return self._prepend.count('\n') + self._append.count('\n')
+		return self.table.get_eol_count(self.index)
+
+	def _get_kind(self):
+		if self.table is not None:
+			return self.table.kinds[self.index]
+		if self._kind is None:
+			self._kind = SpecLexer.classify(self._token)
+		return self._kind
+
+	prepend = property(_get_prepend, _set_prepend)
+	token = property(_get_token, _set_token)
+	append = property(_get_append, _set_append)
+	line = property(_get_line, _set_line)
+	eol_count = property(_get_eol_count) # new lines in prepend and append
+	kind = property(_get_kind) # see SpecLexer.KIND_*
+
+	def read(self, specFile):
+		'''
+		Read token from a spec file char by char
+		@param specFile: L{SpecFile} to parse
+		@type specFile: L{SpecFile}
+		@return: None
+		@rtype: None
+		'''
 		def read_comment(specFile):
 			ret = ""
 			while True:
@@ -50,15 +527,7 @@ class SpecToken:
 					break
 			return ret
 
-		self.prepend = "" # prepended whitespaces
-		self.append = ""  # appended whitespaces
-		self.token = ""
-		self.line  = None
-		self.eol_count = 0
-
-		if specFile is None:
-			return
-
+		prepend = append = token = ""
 		token_parsed = False
 
 		while True:
@@ -69,56 +538,57 @@ class SpecToken:
 					specFile.ungetc()
 					break
 				else:
-					self.token = None
+					token = None
 					break
 			elif c == ' ' or c == '\t' or c == '\n':
 				if token_parsed:
-					self.append += c
+					append += c
 				else:
-					self.prepend += c
-
-				if c == '\n':
-					self.eol_count += 1
+					prepend += c
 			elif c == '\\' and specFile.touch() == '\n':
 				if token_parsed:
-					self.append += c
-					self.append += specFile.getc()
+					append += c
+					append += specFile.getc()
 				else:
-					self.prepend += c
-					self.prepend += specFile.getc()
-
-				self.eol_count += 1
+					prepend += c
+					prepend += specFile.getc()
 			elif c == '#':
 				if token_parsed:
 					# TODO: make better decision, e.g. '^  #comment$'
-					if len(self.append) > 0 and self.append[-1] == '\n':
+					if len(append) > 0 and append[-1] == '\n':
 						specFile.ungetc()
 						break
 					else:
-						self.append += c
-						self.append += read_comment(specFile)
+						append += c
+						append += read_comment(specFile)
 				else:
-					self.prepend += c
-					self.prepend += read_comment(specFile)
+					prepend += c
+					prepend += read_comment(specFile)
 
 			else:
-				if len(self.append) == 0:
-					self.token += c
+				if len(append) == 0:
+					token += c
 					token_parsed = True
 				else:
 					specFile.ungetc()
 					break
 
+		self._prepend = prepend
+		self._token = token
+		self._append = append
+		self._kind = None
+
 	def __str__(self):
 		'''
 		Get raw string representation
 		@return: string representation of a token
 		@rtype: string
 		'''
-		if self.token == None:
+		token = self.token
+		if token is None:
 			return "<EOF>"
 		else:
-			return self.token
+			return token
 
 	def __len__(self):
 		'''
@@ -138,6 +608,11 @@ class SpecToken:
 		@return: None
 		@rtype: None
 		'''
+		span = self.get_source_span()
+		if span is not None and not raw:
+			span[0].write_span(f, span[1], span[2])
+			return
+
 		if not raw:
 			f.write(self.prepend)
 
@@ -155,6 +630,10 @@ class SpecToken:
 		@return: string representation of a token
 		@rtype: string
 		'''
+		span = self.get_source_span()
+		if span is not None and not raw:
+			return span[0].get_span(span[1], span[2])
+
 		ret = ""
 		if not raw:
 			ret += self.prepend
@@ -172,6 +651,9 @@ class SpecToken:
 		@return: True if token is on the same line
 		@rtype: Boolean
 		'''
+		table = self.table
+		if table is not None and token.table is table and table.same_shift(self.index, token.index):
+			return table.get_logical_line(self.index) == table.get_logical_line(token.index)
 		return (self.line + self.append.count('\\\n')) == token.line
 
 	@staticmethod
@@ -200,7 +682,9 @@ class SpecToken:
 		@return: True if token is EOF token
 		@rtype: Boolean
 		'''
-		return self.token == None
+		if self.table is None:
+			return self._token is None
+		return self.table.kinds[self.index] == SpecLexer.KIND_EOF
 
 	def get_line(self):
 		'''
@@ -243,25 +727,54 @@ class SpecToken:
 class SpecTokenList:
 	'''
 	List of token abstraction with a working pointer
+	@cvar LEXER_CHAR: char-by-char lexer, see L{SpecToken}
+	@cvar LEXER_REGEX: bulk lexer, see L{SpecLexer}
+	@cvar LEXERS: available lexers
 	'''
-	def __init__(self, spec = None):
+	LEXER_CHAR = 'char'
+	LEXER_REGEX = 'regex'
+	LEXERS = [ LEXER_CHAR, LEXER_REGEX ]
+
+	def __init__(self, spec = None, lexer = LEXER_REGEX):
 		'''
 		Init L{SpecTokenList}
 		@param spec: file or string to be parsed
-		@type spec: string/file
+		@type spec: string/file/L{SpecFile}
+		@param lexer: lexer to be used, one of L{LEXERS}
+		@type lexer: string
 		@return: None
 		@rtype: None
+		@raise SpecBadParam: if an unknown lexer is requested
 		'''
 		self.current = 0
 		self.pointer = 0
-		self.token_list = []
+		self.token_list = [] # None for tokens not accessed yet, see token_at()
+		self.table = None
+		self.pieces = None # runs of table rows, see get_offset() and splice()
 
 		# TODO: pass spec in another method
 		if spec is None:
 			return
 
+		if not isinstance(spec, SpecFile):
+			spec = SpecFile(spec)
+
+		if lexer == self.LEXER_CHAR:
+			self.tokenize_char(spec)
+		elif lexer == self.LEXER_REGEX:
+			self.tokenize_regex(spec)
+		else:
+			raise SpecBadParam("Unknown lexer '%s'" % lexer)
+
+	def tokenize_char(self, specFile):
+		'''
+		Tokenize a spec file char by char
+		@param specFile: file to be tokenized
+		@type specFile: L{SpecFile}
+		@return: None
+		@rtype: None
+		'''
 		line = 1
-		specFile = SpecFile(spec)
 		while True:
 			t = SpecToken(specFile)
 			self.token_list.append(t)
@@ -272,6 +785,148 @@ class SpecTokenList:
 			if t.token == None:
 				break
 
+	def tokenize_regex(self, specFile):
+		'''
+		Tokenize a spec file using L{SpecLexer}, tokens are stored in
+		a L{SpecTokenTable} and their views are created on first access
+		@param specFile: file to be tokenized
+		@type specFile: L{SpecFile}
+		@return: None
+		@rtype: None
+		'''
+		self.table = SpecTokenTable(specFile)
+		self.token_list = [None] * len(self.table)
+		self.pieces = [(0, self.table, 0, 0)] # first token, table, first row, offset
+
+	def token_at(self, i):
+		'''
+		Get token on given position, create a view of the token table if
+		the token was not accessed yet
+		@param i: index to token list
+		@type i: number
+		@return: token on given position
+		@rtype: L{SpecToken}
+		'''
+		token = self.token_list[i]
+		if token is None:
+			if i < 0:
+				i += len(self.token_list)
+			token = self.token_list[i] = SpecToken.from_table(self.table, i)
+		return token
+
+	def get_piece(self, i):
+		'''
+		Get a run of table rows a token belongs to
+		@param i: index to token list
+		@type i: number
+		@return: tuple (first token, table, first row, offset of the first token)
+		@rtype: tuple
+		@raise SpecNotImplemented: if tokens are not stored in token tables
+		'''
+		if self.pieces is None:
+			raise SpecNotImplemented("Offsets are available only for tokens of a token table")
+		return self.pieces[bisect_right(self.pieces, (i + 1,)) - 1]
+
+	def get_offset(self, i):
+		'''
+		Get offset of a token in the tokenized text
+		@param i: index to token list
+		@type i: number
+		@return: offset where prepend part of the token starts
+		@rtype: number
+		@raise SpecNotImplemented: if tokens are not stored in token tables
+		'''
+		first, table, row, offset = self.get_piece(i)
+		return offset + table.starts[row + i - first] - table.starts[row]
+
+	def find_offset(self, offset):
+		'''
+		Find a token containing an offset of the tokenized text
+		@param offset: offset in the tokenized text
+		@type offset: number
+		@return: index of the last token starting at or before the offset
+		@rtype: number
+		@raise SpecNotImplemented: if tokens are not stored in token tables
+		'''
+		lo, hi = 0, len(self.token_list)
+		while hi - lo > 1:
+			mid = (lo + hi) // 2
+			if self.get_offset(mid) <= offset:
+				lo = mid
+			else:
+				hi = mid
+		return lo
+
+	def splice(self, first, last, table, rows, delta):
+		'''
+		Replace tokens by rows of a token table lexed from a changed part of
+		the tokenized text; tokens outside of the range are shared
+		@param first: index of the first token to be replaced
+		@type first: number
+		@param last: index of the first token which is not replaced
+		@type last: number
+		@param table: table with tokens of the changed part, its source starts
+		at offset of the first replaced token
+		@type table: L{SpecTokenTable}
+		@param rows: number of table rows to be used
+		@type rows: number
+		@param delta: difference of the changed text length
+		@type delta: number
+		@return: new token list, this list is not modified
+		@rtype: L{SpecTokenList}
+		@raise SpecNotImplemented: if tokens are not stored in token tables
+		'''
+		if self.pieces is None:
+			raise SpecNotImplemented("Splicing is available only for tokens of a token table")
+
+		# list indexes stop matching table rows, so views are created upfront
+		if self.table is not None:
+			for i in xrange(len(self.token_list)):
+				self.token_at(i)
+
+		pieces = [p for p in self.pieces if p[0] < first]
+		if rows > 0:
+			pieces.append((first, table, 0, self.get_offset(first)))
+
+		if last < len(self.token_list):
+			count = rows - (last - first)
+			start, last_table, row, offset = self.get_piece(last)
+			pieces.append((first + rows, last_table, row + last - start, self.get_offset(last) + delta))
+			for start, t, row, offset in self.pieces:
+				if start > last:
+					pieces.append((start + count, t, row, offset + delta))
+
+		ret = SpecTokenList()
+		ret.token_list = self.token_list[:first]
+		ret.token_list.extend(SpecToken.from_table(table, i) for i in xrange(rows))
+		ret.token_list.extend(self.token_list[last:])
+		ret.pieces = pieces
+		return ret
+
+	def shift_lines(self, first, shift):
+		'''
+		Shift lines of tokens starting with a token, see L{SpecTokenTable.shift_lines}
+		@param first: index of the first token to be shifted
+		@type first: number
+		@param shift: number of lines to shift by
+		@type shift: number
+		@return: None
+		@rtype: None
+		@raise SpecNotImplemented: if tokens are not stored in token tables
+		'''
+		if self.pieces is None:
+			raise SpecNotImplemented("Line shifts are available only for tokens of a token table")
+		if shift == 0 or first >= len(self.token_list):
+			return
+
+		# rows of a table are in text order, so shifting its first row
+		# after the given token shifts all its rows that follow
+		shifted = set()
+		for start, table, row, offset in self.pieces[bisect_right(self.pieces, (first + 1,)) - 1:]:
+			if table not in shifted:
+				table.shift_lines(row + max(first - start, 0), shift)
+				shifted.add(table)
+
 	def is_eof(self):
 		'''
 		Check if pointer points at the end of file
@@ -291,7 +946,7 @@ class SpecTokenList:
 			raise StopIteration
 		else:
 			self.current += 1
-			return self.token_list[self.current - 1]
+			return self.token_at(self.current - 1)
 
 	def get(self):
 		'''
@@ -300,9 +955,9 @@ class SpecTokenList:
 		@rtype: L{SpecToken}
 		'''
 		if self.pointer == len(self.token_list):
-			return self.token_list[-1] # eof
+			return self.token_at(-1) # eof
 		self.pointer += 1
-		return self.token_list[self.pointer - 1]
+		return self.token_at(self.pointer - 1)
 
 	def touch(self):
 		'''
@@ -312,9 +967,9 @@ class SpecTokenList:
 		@raise SpecNotFound:
 		'''
 		if self.pointer == len(self.token_list):
-			return self.token_list[-1] # eof
+			return self.token_at(-1) # eof
 
-		return self.token_list[self.pointer]
+		return self.token_at(self.pointer)
 
 	def get_line(self):
 		'''
@@ -322,8 +977,32 @@ class SpecTokenList:
 		@return: list of tokens on the same line
 		@rtype: L{SpecTokenList}
 		'''
+		table = self.table
+		if table is not None and len(self.token_list) == len(table):
+			l = SpecTokenList()
+			if not self.is_eof():
+				start = self.pointer
+				end = table.get_line_tokens(table.get_logical_line(start))[1]
+				l.token_list = [self.token_at(i) for i in xrange(start, end)]
+				self.pointer = end
+			return l
+
 		ret = []
 
+		if self.pieces is not None:
+			# tokens of several tables, a logical line continues while new
+			# lines in a token are escaped
+			while not self.is_eof():
+				token = self.get()
+				ret.append(token)
+				eol_count = token.eol_count
+				if eol_count > 0 and token.string().count('\\\n') != eol_count:
+					break
+
+			l = SpecTokenList()
+			l.token_list = ret
+			return l
+
 		while not self.is_eof():
 			token_next = self.touch()
 
@@ -343,14 +1022,43 @@ class SpecTokenList:
 		l.token_list = ret
 		return l
 
-	def get_while_not(self, callback):
+	def get_line_tokens(self, line):
+		'''
+		Get tokens on a logical line, B{DO NOT} move pointer
+		@param line: number of a line which is a part of the logical line
+		@type line: number
+		@return: list of tokens on the logical line
+		@rtype: L{SpecTokenList}
+		@raise SpecBadIndex: if there is no such line
+		@raise SpecNotImplemented: if tokens are not stored in a token table
+		'''
+		table = self.table
+		if table is None or len(self.token_list) != len(table):
+			raise SpecNotImplemented("Line index is available only for tokens of a token table")
+
+		start, end = table.get_line_tokens(table.source.get_logical_line(line))
+		l = SpecTokenList()
+		l.token_list = [self.token_at(i) for i in xrange(start, end)]
+		return l
+
+	def get_while_not(self, callback, kinds = None):
 		'''
 		Get list of token until predicate is False
 		@param callback: callback to be called, predicate
 		@type callback: func(L{SpecTokenList}) -> Boolean
+		@param kinds: kinds of tokens the predicate can be True for, other
+		tokens are skipped without calling the callback; None to check all
+		tokens
+		@type kinds: set of numbers, see L{SpecLexer}
 		@return: list of tokens until predicate was not True
 		@rtype: L{SpecTokenList}
 		'''
+		table = self.table
+		if kinds is not None and table is not None and len(self.token_list) == len(table):
+			start = self.pointer
+			self.skip_while_not(callback, kinds)
+			return self.get_range(start, self.pointer)
+
 		ret = []
 
 		while not self.touch().is_eof():
@@ -363,6 +1071,98 @@ class SpecTokenList:
 		l.token_list = ret
 		return l
 
+	def skip_while_not(self, callback, kinds = None):
+		'''
+		Move pointer until predicate is False, see L{get_while_not}
+		@param callback: callback to be called, predicate
+		@type callback: func(L{SpecTokenList}) -> Boolean
+		@param kinds: kinds of tokens the predicate can be True for
+		@type kinds: set of numbers, see L{SpecLexer}
+		@return: None
+		@rtype: None
+		'''
+		table = self.table
+		if kinds is not None and table is not None and len(self.token_list) == len(table):
+			mask = table.get_kind_mask(kinds | set([SpecLexer.KIND_EOF]))
+			pointer = self.pointer
+			while pointer < len(self.token_list):
+				# EOF token is always in the mask
+				pointer = mask.find('\x01', pointer)
+				self.pointer = pointer
+				if self.token_at(pointer).is_eof() or callback(self):
+					break
+				pointer += 1
+			return
+
+		while not self.touch().is_eof():
+			if callback(self):
+				break
+			self.get()
+
+	def get_range(self, start, end):
+		'''
+		Get tokens in a range as a new list, B{DO NOT} move pointer
+		@param start: index of the first token
+		@type start: number
+		@param end: index of the first token after the range
+		@type end: number
+		@return: list of tokens
+		@rtype: L{SpecTokenList}
+		'''
+		l = SpecTokenList()
+		l.token_list = self.get_slice(start, end)
+		return l
+
+	def copy(self, start = 0, end = None):
+		'''
+		Get copies of tokens in a range as a new list, B{DO NOT} move pointer
+		@param start: index of the first token
+		@type start: number
+		@param end: index of the first token after the range, None for the end
+		of the list
+		@type end: number
+		@return: list of token copies
+		@rtype: L{SpecTokenList}
+		'''
+		if end is None:
+			end = len(self.token_list)
+		l = SpecTokenList()
+		l.token_list = [ token.copy() for token in self.get_slice(start, end) ]
+		return l
+
+	def get_source_span(self, start, end):
+		'''
+		Get span of tokens in a range in the source buffer
+		@param start: index of the first token
+		@type start: number
+		@param end: index of the first token after the range
+		@type end: number
+		@return: tuple (source, start, end) or None if tokens are not stored
+		in a single token table
+		@rtype: tuple
+		'''
+		table = self.table
+		if table is None or len(self.token_list) != len(table):
+			return None
+		return (table.source, table.starts[start], table.starts[end])
+
+	def get_slice(self, start, end):
+		'''
+		Get tokens in a range, B{DO NOT} move pointer
+		@param start: index of the first token
+		@type start: number
+		@param end: index of the first token after the range
+		@type end: number
+		@return: list of tokens
+		@rtype: list of L{SpecToken}
+		'''
+		ret = self.token_list[start:end]
+		if None in ret:
+			for i in xrange(len(ret)):
+				if ret[i] is None:
+					ret[i] = self.token_at(start + i)
+		return ret
+
 	def unget(self):
 		'''
 		Move the buffer pointer one step back
@@ -382,6 +1182,25 @@ class SpecTokenList:
 		'''
 		return self.pointer
 
+	def pin(self):
+		'''
+		Pin the current buffer pointer so it is possible to return to it
+		using L{set_pointer}
+		@return: pinned buffer pointer
+		@rtype: number
+		'''
+		return self.pointer
+
+	def unpin(self, val):
+		'''
+		Unpin a buffer pointer pinned by L{pin}
+		@param val: pinned buffer pointer
+		@type val: number
+		@return: None
+		@rtype: None
+		'''
+		pass
+
 	def set_pointer(self, val):
 		'''
 		Set value of the current buffer pointer
@@ -428,8 +1247,42 @@ class SpecTokenList:
 		@return: None
 		@rtype: None
 		'''
-		for token in self.token_list:
-			token.write(f, raw)
+		if raw:
+			for i in xrange(len(self.token_list)):
+				self.token_at(i).write(f, raw)
+			return
+
+		# emit contiguous runs of token views straight from the source
+		run_table = None
+		run_start = run_end = 0
+		token_list = self.token_list
+		for j in xrange(len(token_list)):
+			token = token_list[j]
+			if token is None: # not accessed, still in the table
+				table, i = self.table, j
+			else:
+				table = token.table
+				if table is not None:
+					i = token.index
+
+			if table is not None:
+				start = table.starts[i]
+
+				if table is run_table and start == run_end:
+					run_end = table.starts[i + 1]
+					continue
+
+				if run_table is not None:
+					run_table.source.write_span(f, run_start, run_end)
+				run_table, run_start, run_end = table, start, table.starts[i + 1]
+			else:
+				if run_table is not None:
+					run_table.source.write_span(f, run_start, run_end)
+					run_table = None
+				token.write(f)
+
+		if run_table is not None:
+			run_table.source.write_span(f, run_start, run_end)
 
 	def get_raw(self):
 		'''
@@ -472,7 +1325,7 @@ class SpecTokenList:
 		@return: token on given position
 		@rtype: L{SpecToken}
 		'''
-		return self.token_list[i]
+		return self.token_at(i)
 
 	def __setitem__(self, i, item):
 		'''
@@ -495,7 +1348,203 @@ class SpecTokenList:
 		@rtype: None
 		'''
 		str_created = ""
-		for token in self.token_list:
-			str_created += token.string(raw = True)
+		for i in xrange(len(self.token_list)):
+			str_created += self.token_at(i).string(raw = True)
 		return str_created == str_compare
 
+class SpecTokenStream(SpecTokenList):
+	'''
+	List of tokens lexed on demand as the working pointer advances. Only
+	a window of tokens is kept; tokens before the pointer are dropped unless
+	the pointer was pinned, indexes and pointers are absolute.
+	@cvar LOOKBEHIND: number of tokens kept before the pointer
+	@cvar TRIM_THRESHOLD: number of tokens to be dropped at once
+	'''
+	LOOKBEHIND = 1
+	TRIM_THRESHOLD = 4096
+
+	def __init__(self, spec, chunk_size = 65536):
+		'''
+		Init L{SpecTokenStream}
+		@param spec: file or string to be parsed
+		@type spec: string/file/L{SpecFile}
+		@param chunk_size: number of bytes to be read at once
+		@type chunk_size: number
+		@return: None
+		@rtype: None
+		'''
+		SpecTokenList.__init__(self)
+
+		if isinstance(spec, SpecFile):
+			spec = spec.content
+		if isinstance(spec, basestring):
+			spec = cStringIO.StringIO(spec)
+
+		self.tokens = SpecLexer.tokenize_stream(spec, chunk_size)
+		self.offset = 0 # absolute index of the first token in window
+		self.pins = []
+		self.line = 1
+		self.eof = False
+
+	def fill(self, index):
+		'''
+		Lex tokens until a token on the index is available or EOF is reached
+		@param index: absolute index of a token
+		@type index: number
+		@return: None
+		@rtype: None
+		'''
+		token_list = self.token_list
+		while not self.eof and index >= self.offset + len(token_list):
+			prepend, token, append = next(self.tokens)
+			t = SpecToken.create(token, prepend, append)
+			t.line = self.line
+			self.line += t.eol_count
+			token_list.append(t)
+			self.eof = token is None
+
+	def trim(self):
+		'''
+		Drop tokens which are not reachable anymore
+		@return: None
+		@rtype: None
+		'''
+		keep = self.pointer - self.LOOKBEHIND
+		if self.pins:
+			keep = min(keep, min(self.pins))
+
+		drop = keep - self.offset
+		if drop >= self.TRIM_THRESHOLD:
+			del self.token_list[:drop]
+			self.offset += drop
+
+	def is_eof(self):
+		'''
+		Check if pointer points at the end of file
+		@return: True if pointer points at the end of file
+		@rtype: Boolean
+		'''
+		self.fill(self.pointer)
+		return self.pointer == self.offset + len(self.token_list)
+
+	def get(self):
+		'''
+		Get token from list and advance pointer
+		@return: next token
+		@rtype: L{SpecToken}
+		'''
+		self.fill(self.pointer)
+		if self.pointer == self.offset + len(self.token_list):
+			return self.token_list[-1] # eof
+
+		ret = self.token_list[self.pointer - self.offset]
+		self.pointer += 1
+		self.trim()
+		return ret
+
+	def touch(self):
+		'''
+		Get token from list and B{DO NOT} advance pointer
+		@return: next token
+		@rtype: L{SpecToken}
+		'''
+		self.fill(self.pointer)
+		if self.pointer == self.offset + len(self.token_list):
+			return self.token_list[-1] # eof
+
+		return self.token_list[self.pointer - self.offset]
+
+	def unget(self):
+		'''
+		Move the buffer pointer one step back
+		@return: None
+		@rtype: None
+		@raise SpecBadIndex: when called at the beginning of the window
+		'''
+		if self.pointer == self.offset:
+			raise SpecBadIndex('Cannot unget at the beginning of the window')
+		self.pointer -= 1
+
+	def set_pointer(self, val):
+		'''
+		Set value of the current buffer pointer
+		@param val: new buffer pointer
+		@type val: number
+		@raise SpecBadIndex: when a pointer is out of window
+		'''
+		self.fill(val - 1)
+		if val < self.offset or val > self.offset + len(self.token_list):
+			raise SpecBadIndex('TokenList pointer out of window')
+		self.pointer = val
+
+	def pin(self):
+		'''
+		Pin the current buffer pointer, tokens from the pinned pointer are
+		kept in window until L{unpin} is called
+		@return: pinned buffer pointer
+		@rtype: number
+		'''
+		self.pins.append(self.pointer)
+		return self.pointer
+
+	def unpin(self, val):
+		'''
+		Unpin a buffer pointer pinned by L{pin}
+		@param val: pinned buffer pointer
+		@type val: number
+		@return: None
+		@rtype: None
+		'''
+		self.pins.remove(val)
+
+	def next(self):
+		'''
+		Get next token from list, tokens are lexed as iterated
+		@return: next token
+		@rtype: L{SpecToken}
+		@raise StopIteration: when end of token list is reached
+		@raise SpecBadIndex: when a token is out of window
+		'''
+		self.fill(self.current)
+		if self.current < self.offset:
+			raise SpecBadIndex('Token out of window')
+		if self.current == self.offset + len(self.token_list):
+			raise StopIteration
+		self.current += 1
+		return self.token_list[self.current - 1 - self.offset]
+
+	def __len__(self):
+		'''
+		Return number of tokens lexed so far
+		@return: number of tokens
+		@rtype: number
+		'''
+		return self.offset + len(self.token_list)
+
+	def __getitem__(self, i):
+		'''
+		Get item for direct access
+		@param i: absolute index to token list
+		@type i: number
+		@return: token on given position
+		@rtype: L{SpecToken}
+		@raise SpecBadIndex: when a token is out of window
+		'''
+		self.fill(i)
+		if i < self.offset or i >= self.offset + len(self.token_list):
+			raise SpecBadIndex('Token out of window')
+		return self.token_list[i - self.offset]
+
+	def __setitem__(self, i, item):
+		'''
+		Set item using direct access
+		@param i: absolute index to token list
+		@type i: number
+		@param item: item to be set
+		@type item: L{SpecToken}
+		@raise SpecBadIndex: when a token is out of window
+		'''
+		self.fill(i)
+		if i < self.offset or i >= self.offset + len(self.token_list):
+			raise SpecBadIndex('Token out of window')
+		self.token_list[i - self.offset] = item